@@ -18,23 +18,9 @@ bl_info = {
     }
 
 
-# Only needed if you want to add into a dynamic menu
-def menu_func_import(self, context):
-    self.layout.operator(ImportLDDOps.bl_idname, text="LEGO Digital Designer (.lxf/.lxfml)")
-
-
 def register():
-    bpy.utils.register_class(ImportLDDOps)
-    bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    importldd.register()
 
 
 def unregister():
-    bpy.utils.unregister_class(ImportLDDOps)
-    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
-
-
-if __name__ == "__main__":
-    register()
-
-    # test call
-    bpy.ops.import_scene.importldd('INVOKE_DEFAULT')
+    importldd.unregister()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# Benchmark for pylddlib with a synthetic LDD database and scene
+#
+# Builds a db.lif and an extracted db folder with generated parts (Primitives XML, .g geometry,
+# Materials.xml, localizedStrings.loc, decorations) plus an LXFML scene, then times every phase
+# of a conversion and writes the results as JSON. No LDD install is needed.
+#
+# usage: benchmark.py [--bricks 2000] [--parts 200] [--flex 0.05] [--deco 0.05] [--json results.json]
+#
+# License: MIT License
+#
+
+import os
+import sys
+import time
+import json
+import math
+import zlib
+import random
+import struct
+import shutil
+import zipfile
+import argparse
+import tempfile
+import platform
+import contextlib
+
+import pylddlib
+
+MATERIALS = [('1', 'White', 244, 244, 244, 255, 'Shiny'), ('21', 'Bright Red', 180, 0, 0, 255, 'Shiny'), ('23', 'Bright Blue', 30, 90, 168, 255, 'Shiny'), ('26', 'Black', 27, 42, 52, 255, 'Shiny'), ('40', 'Transparent', 238, 238, 238, 128, 'Transparent'), ('297', 'Warm Gold', 170, 127, 46, 255, 'Metallic')]
+
+def png(width=4, height=4):
+	# smallest useful RGBA png
+	def chunk(kind, data):
+		return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+	raw = b''.join(b'\0' + b'\xff\x00\x00\xff' * width for y in range(height))
+	return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b'')
+
+def geometry(vertices, faces, textures=False, bones=0, seed=0):
+	r = random.Random(seed)
+	out = struct.pack('<iiii', 1111961649, vertices, faces * 3, 3 if textures else 0)
+	out += struct.pack('<%df' % (vertices * 3), *[r.uniform(0, 1.6) for i in range(vertices * 3)])
+	out += struct.pack('<%df' % (vertices * 3), *[r.uniform(-1, 1) for i in range(vertices * 3)])
+	if textures:
+		out += struct.pack('<%df' % (vertices * 2), *[r.uniform(0, 1) for i in range(vertices * 2)])
+	out += struct.pack('<%di' % (faces * 3), *[r.randrange(vertices) for i in range(faces * 3)])
+	if bones > 0:
+		# one 8 byte record per bone, every vertex points at the record of its bone
+		region = b''.join(struct.pack('<ii', 7, b) for b in range(bones))
+		region += b'\0' * (max(vertices, faces) + 8)
+		out += struct.pack('<i', len(region)) + region
+		out += struct.pack('<%di' % vertices, *[8 * (i * bones // vertices) for i in range(vertices)])
+	else:
+		out += struct.pack('<i', 0)
+	return out
+
+def primitive(designID, bones=0):
+	flex = ''
+	if bones > 0:
+		flex = '<Flex>' + ''.join('<Bone boneId="{0}" angle="{1}" ax="0" ay="1" az="0" tx="{2}" ty="0" tz="0"/>'.format(b, 5 * b, 0.4 * b) for b in range(bones)) + '</Flex>'
+	field = ','.join(['0:4'] * 9)
+	return ('<?xml version="1.0" encoding="UTF-8"?><LEGOPrimitive><Annotations><Annotation designname="Bench part {0}"/></Annotations>{1}'
+		'<Collision><Box sX="0.8" sY="0.48" sZ="0.4" angle="0" ax="1" ay="0" az="0" tx="0.8" ty="0.48" tz="0.4"/></Collision>'
+		'<Bounding><AABB minX="0" minY="0" minZ="0" maxX="1.6" maxY="0.96" maxZ="0.8"/></Bounding>'
+		'<GeometryBounding><AABB minX="0" minY="0" minZ="0" maxX="1.6" maxY="1.12" maxZ="0.8"/></GeometryBounding>'
+		'<Connectivity><Custom2DField type="23" width="2" height="2" angle="0" ax="1" ay="0" az="0" tx="0" ty="0.96" tz="0">{2}</Custom2DField></Connectivity>'
+		'</LEGOPrimitive>').format(designID, flex, field).encode('utf-8')
+
+def database(parts, vertices, flex, deco, seed):
+	r = random.Random(seed)
+	files = {}
+	files['/info.xml'] = b'<?xml version="1.0" encoding="UTF-8"?><Info><Bricks version="2670"/></Info>'
+	files['/Materials.xml'] = ('<?xml version="1.0" encoding="UTF-8"?><Materials>' + ''.join('<Material MatID="{0}" Red="{2}" Green="{3}" Blue="{4}" Alpha="{5}" MaterialType="{6}"/>'.format(*m) for m in MATERIALS) + '</Materials>').encode('utf-8')
+	files['/MaterialNames/EN/localizedStrings.loc'] = b'2\0' + b''.join(b'Material' + m[0].encode('utf-8') + b'\0' + m[1].encode('utf-8') + b'\0' for m in MATERIALS)
+	files['/Decorations/1000.png'] = png()
+
+	designs = []
+	for d in range(parts):
+		designID = str(3000 + d)
+		bones = 4 if d < int(round(parts * flex)) else 0
+		textures = d >= parts - int(round(parts * deco))
+		count = max(8, int(vertices * r.uniform(0.5, 1.5)))
+		files['/Primitives/{0}.xml'.format(designID)] = primitive(designID, bones)
+		files['/Primitives/LOD0/{0}.g'.format(designID)] = geometry(count, count, textures=textures, bones=bones, seed=d)
+		if d % 5 == 0:
+			# a second sub-part with its own material
+			files['/Primitives/LOD0/{0}.g1'.format(designID)] = geometry(count // 4 + 3, count // 4, seed=parts + d)
+		designs.append((designID, bones, textures, d % 5 == 0))
+	return files, designs
+
+def writeLIF(filename, files):
+	tree = {}
+	for name, data in sorted(files.items()):
+		node = tree
+		path = name.strip('/').split('/')
+		for folder in path[:-1]:
+			node = node.setdefault(folder, {})
+		node[path[-1]] = data
+
+	# packed data, 20 byte header per entry followed by the file contents, in directory order
+	packed = [b'\0' * 20]
+	def pack(node):
+		for name in node:
+			if isinstance(node[name], dict):
+				packed.append(b'\0' * 20)
+				pack(node[name])
+			else:
+				packed.append(b'\0' * 20 + node[name])
+	pack(tree)
+
+	def directory(node):
+		out = struct.pack('>i', len(node))
+		for name in node:
+			encoded = name.encode('utf-16-be') + b'\0\0'
+			if isinstance(node[name], dict):
+				out += struct.pack('>h', 1) + b'\0' * 4 + encoded + b'\0' * 8 + directory(node[name])
+			else:
+				out += struct.pack('>h', 2) + b'\0' * 4 + encoded + b'\0' * 4 + struct.pack('>i', len(node[name]) + 20) + b'\0' * 24
+		return out
+
+	blob = bytearray(b'LIFF' + b'\0' * 60) + b''.join(packed)
+	struct.pack_into('>i', blob, 72, len(blob) - 64)
+	blob += b'\0' * 36 + directory(tree)
+	with open(filename, 'wb') as f:
+		f.write(bytes(blob))
+
+def writeFolder(folder, files):
+	for name, data in files.items():
+		filename = os.path.join(folder, name.strip('/'))
+		if not os.path.isdir(os.path.dirname(filename)):
+			os.makedirs(os.path.dirname(filename))
+		with open(filename, 'wb') as f:
+			f.write(data)
+
+def scene(designs, bricks, seed):
+	r = random.Random(seed)
+	side = int(math.ceil(math.sqrt(bricks)))
+	out = []
+	for b in range(bricks):
+		(designID, bones, textures, subpart) = r.choice(designs)
+		materials = ','.join(r.choice(MATERIALS)[0] for i in range(2 if subpart else 1))
+		decoration = ' decoration="1000"' if textures else ''
+		x = 0.8 * (b % side) * 2
+		z = 0.8 * (b // side)
+		y = 0.96 * r.randrange(4)
+		bonelist = ''.join('<Bone refID="{0}" transformation="1,0,0,0,1,0,0,0,1,{1},{2},{3}"/>'.format(b * 10 + k, x + 0.4 * k, y, z) for k in range(max(1, bones)))
+		out.append('<Brick refID="{0}" designID="{1}"><Part refID="{0}" designID="{1}" materials="{2}"{3}>{4}</Part></Brick>'.format(b, designID, materials, decoration, bonelist))
+	groups = ''.join('<Group refID="{0}" partRefs="{1}"/>'.format(g, ','.join(str(i) for i in range(g * 10, min(bricks, g * 10 + 10)))) for g in range(bricks // 10))
+	return ('<?xml version="1.0" encoding="UTF-8" standalone="no" ?><LXFML versionMajor="5" versionMinor="0" name="Benchmark"><Meta><Application name="LEGO Digital Designer" versionMajor="4" versionMinor="3"/><BrickSet version="2670"/></Meta>'
+		'<Cameras><Camera refID="0" fieldOfView="80" distance="60" transformation="1,0,0,0,1,0,0,0,1,0,10,60"/></Cameras>'
+		'<Bricks cameraRef="0">{0}</Bricks><GroupSystems><GroupSystem>{1}</GroupSystem></GroupSystems></LXFML>').format(''.join(out), groups).encode('utf-8')
+
+@contextlib.contextmanager
+def quiet():
+	# progress bars and status prints of pylddlib are not part of the measurement output
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, 'w')
+	try:
+		yield
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+
+def timed(results, name, repeat, function):
+	best = None
+	value = None
+	for i in range(repeat):
+		start_time = time.time()
+		with quiet():
+			value = function()
+		seconds = time.time() - start_time
+		best = seconds if best is None else min(best, seconds)
+	results[name] = round(best, 6)
+	print('{0:<24} {1:10.4f}s'.format(name, best))
+	return value
+
+def main():
+	parser = argparse.ArgumentParser(description='Time the pylddlib pipeline on a synthetic LDD database and scene.')
+	parser.add_argument('--bricks', type=int, default=2000, help='bricks in the scene')
+	parser.add_argument('--parts', type=int, default=200, help='unique parts in the database')
+	parser.add_argument('--vertices', type=int, default=400, help='average vertices per part')
+	parser.add_argument('--flex', type=float, default=0.05, help='share of flex parts')
+	parser.add_argument('--deco', type=float, default=0.05, help='share of decorated parts')
+	parser.add_argument('--repeat', type=int, default=3, help='runs per phase, the best one counts')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--json', metavar='FILE', help='write the results to FILE')
+	parser.add_argument('--keep', metavar='DIR', help='build the fixtures in DIR and keep them')
+	args = parser.parse_args()
+
+	workdir = args.keep if args.keep is not None else tempfile.mkdtemp(prefix='lddbench')
+	if not os.path.isdir(workdir):
+		os.makedirs(workdir)
+	# a private geometry cache, so the cold runs really start empty
+	cachedir = os.path.join(workdir, 'cache')
+	os.environ['LDDCACHEDIR'] = cachedir
+
+	lif = os.path.join(workdir, 'db.lif')
+	folder = os.path.join(workdir, 'db')
+	lxfml = os.path.join(workdir, 'scene.lxfml')
+	lxf = os.path.join(workdir, 'scene.lxf')
+	outdir = os.path.join(workdir, 'out')
+
+	start_time = time.time()
+	files, designs = database(args.parts, args.vertices, args.flex, args.deco, args.seed)
+	for name in (lif, lif + pylddlib.LIFINDEXSUFFIX):
+		if os.path.exists(name):
+			os.remove(name)
+	writeLIF(lif, files)
+	shutil.rmtree(folder, ignore_errors=True)
+	writeFolder(folder, files)
+	data = scene(designs, args.bricks, args.seed)
+	with open(lxfml, 'wb') as f:
+		f.write(data)
+	with zipfile.ZipFile(lxf, 'w', zipfile.ZIP_DEFLATED) as zf:
+		zf.writestr('IMAGE100.LXFML', data)
+	if not os.path.isdir(outdir):
+		os.makedirs(outdir)
+	print('fixtures in {0} ({1:.1f}s)'.format(workdir, time.time() - start_time))
+
+	phases = {}
+	repeat = max(1, args.repeat)
+
+	def openLIF(cold):
+		if cold and os.path.exists(lif + pylddlib.LIFINDEXSUFFIX):
+			os.remove(lif + pylddlib.LIFINDEXSUFFIX)
+		return pylddlib.LIFReader(file=lif)
+
+	timed(phases, 'lif open (no index)', repeat, lambda: openLIF(True))
+	reader = timed(phases, 'lif open (indexed)', repeat, lambda: openLIF(False))
+	if not reader.initok:
+		print('generated db.lif could not be opened')
+		return 1
+	def openFolder():
+		# folder databases use absolute part paths, put the db.lif ones back afterwards
+		paths = (pylddlib.PRIMITIVEPATH, pylddlib.GEOMETRIEPATH, pylddlib.DECORATIONPATH, pylddlib.MATERIALNAMESPATH)
+		pylddlib.setDBFolderVars(dbfolderlocation=folder)
+		try:
+			return pylddlib.DBFolderReader(folder=folder)
+		finally:
+			(pylddlib.PRIMITIVEPATH, pylddlib.GEOMETRIEPATH, pylddlib.DECORATIONPATH, pylddlib.MATERIALNAMESPATH) = paths
+
+	if not timed(phases, 'db folder open', repeat, openFolder).initok:
+		print('generated db folder could not be opened')
+		return 1
+	timed(phases, 'scene parse lxfml', repeat, lambda: pylddlib.Scene(file=lxfml))
+	parsed = timed(phases, 'scene parse lxf', repeat, lambda: pylddlib.Scene(file=lxf))
+
+	designIDs = sorted(set(pa.designID for bri in parsed.Bricks for pa in bri.Parts))
+	geometries = timed(phases, 'geometry decode', repeat, lambda: [pylddlib.Geometry(designID=designID, database=reader) for designID in designIDs])
+
+	def geometryCache(cold, geometrycache=None):
+		# a new GeometryCache reads from disk, a reused one hands out what it already holds in memory like --serve does
+		if cold:
+			shutil.rmtree(cachedir, ignore_errors=True)
+		if geometrycache is None:
+			geometrycache = pylddlib.GeometryCache(database=reader)
+		return [geometrycache.get(designID=designID, database=reader) for designID in designIDs]
+
+	timed(phases, 'geometry cache cold', repeat, lambda: geometryCache(True))
+	timed(phases, 'geometry cache disk', repeat, lambda: geometryCache(False))
+	warm = pylddlib.GeometryCache(database=reader)
+	with quiet():
+		geometryCache(False, warm)
+	timed(phases, 'geometry cache memory', repeat, lambda: geometryCache(False, warm))
+
+	def export(glb):
+		converter = pylddlib.Converter()
+		converter.LoadDatabase(databaselocation=lif)
+		converter.LoadScene(filename=lxf)
+		if glb:
+			converter.ExportGLB(filename=os.path.join(outdir, 'bench'))
+		else:
+			converter.Export(filename=os.path.join(outdir, 'bench'))
+
+	timed(phases, 'export obj', repeat, lambda: export(False))
+	timed(phases, 'export glb', repeat, lambda: export(True))
+
+	counts = {
+		'bricks': len(parsed.Bricks),
+		'uniqueParts': len(designIDs),
+		'vertices': sum(geo.valuecount() for geo in geometries),
+		'faces': sum(geo.facecount() for geo in geometries),
+		'lifBytes': os.path.getsize(lif),
+		'objBytes': os.path.getsize(os.path.join(outdir, 'bench.obj')),
+		'glbBytes': os.path.getsize(os.path.join(outdir, 'bench.glb')),
+	}
+	results = {
+		'config': vars(args),
+		'python': platform.python_version(),
+		'numpy': pylddlib.numpy.__version__ if pylddlib.numpy is not None else None,
+		'phases': phases,
+		'counts': counts,
+	}
+
+	if args.json is not None:
+		with open(args.json, 'w') as f:
+			json.dump(results, f, indent=2, sort_keys=True)
+		print('results written to ' + args.json)
+	if args.keep is None:
+		shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+	sys.exit(main())
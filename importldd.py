@@ -18,6 +18,7 @@ from bpy_extras.io_utils import (
         orientation_helper,
         axis_conversion,
         )
+from bpy_extras.object_utils import world_to_camera_view
 
 
 
@@ -47,23 +48,61 @@ import os
 import platform
 import sys
 import math
+import mmap
+import json
+import hashlib
+import collections
 import struct
 import zipfile
+import threading
+import tracemalloc
 from xml.dom import minidom
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 import random
 import time
 
-if sys.version_info < (3, 0):
-    reload(sys)
-    sys.setdefaultencoding('utf-8')
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 PRIMITIVEPATH = '/Primitives/'
 GEOMETRIEPATH = PRIMITIVEPATH + 'LOD0/'
 DECORATIONPATH = '/Decorations/'
 MATERIALNAMESPATH = '/MaterialNames/'
 
+LIFINDEXSUFFIX = '.idx'
+LIFINDEXVERSION = 2
+# bytes of the db.lif header and of its directory block that go into the fingerprint, the rest is covered by size and mtime
+LIFFINGERPRINTSIZE = 65536
+GEOMETRYCACHEVERSION = 3
+# arrays of a GeometryReader that go into the .npz of the geometry cache, everything else is json
+GEOMETRYCACHEARRAYS = ('positions', 'normals', 'textures', 'faces', 'bones')
+MATERIALKEYPROPERTY = 'lddMaterialKey'
+
 LOGOONSTUDSCONNTYPE = {"0:4", "0:4:1", "0:4:2", "0:4:33", "2:4:1", "2:4:34"}
+OCCLUSIONCELLSIZE = 1.6
+ENCLOSURESTEP = 0.4
+ENCLOSUREMARGIN = 0.1
+WELDTOLERANCE = 0.0001
+# cluster cell size per level of detail, levels without a Primitives/LOD<n>/ folder in the database are simplified from LOD0
+LODCLUSTERSIZE = (0, 0.06, 0.16, 0.4)
+# a part drops to the next level when its bounding radius is less than this fraction of the half view height
+LODSCREENSIZE = (0.05, 0.02, 0.008)
+LDDCAMERAFOV = 25
+# how far (in LDD units) a part may lie outside the camera view before it is left out
+FRUSTUMMARGIN = 2.0
+# bricks per mesh when merged meshes are chunked by brick count
+MERGECHUNKSIZE = 500
+# quads of a proxy box whose corners are ordered x, then y, then z
+PROXYFACES = ((0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3))
 
 class Matrix3D:
     def __init__(self, n11=1,n12=0,n13=0,n14=0,n21=0,n22=1,n23=0,n24=0,n31=0,n32=0,n33=1,n34=0,n41=0,n42=0,n43=0,n44=1):
@@ -171,6 +210,25 @@ class Point3D:
     def copy(self):
         return Point3D(x=self.x,y=self.y,z=self.z)
 
+def transformArray(points, matrix, mask=None, translate=True):
+    # Same arithmetic as Point3D.transform / transformW, applied to an (N,3) array in double precision
+    if mask is None:
+        mask = slice(None)
+    out = numpy.array(points, dtype=numpy.float64)
+    src = numpy.asarray(points, dtype=numpy.float64)[mask]
+    x = src[:, 0]
+    y = src[:, 1]
+    z = src[:, 2]
+    if translate:
+        out[mask, 0] = matrix.n11 * x + matrix.n21 * y + matrix.n31 * z + matrix.n41
+        out[mask, 1] = matrix.n12 * x + matrix.n22 * y + matrix.n32 * z + matrix.n42
+        out[mask, 2] = matrix.n13 * x + matrix.n23 * y + matrix.n33 * z + matrix.n43
+    else:
+        out[mask, 0] = matrix.n11 * x + matrix.n21 * y + matrix.n31 * z
+        out[mask, 1] = matrix.n12 * x + matrix.n22 * y + matrix.n32 * z
+        out[mask, 2] = matrix.n13 * x + matrix.n23 * y + matrix.n33 * z
+    return out
+
 class Point2D:
     def __init__(self, x=0,y=0):
         self.x = x
@@ -197,12 +255,12 @@ class Face:
 
 class Group:
     def __init__(self, node):
-        self.partRefs = node.getAttribute('partRefs').split(',')
+        self.partRefs = node.get('partRefs', '').split(',')
         
 class Bone:
     def __init__(self, node):
-        self.refID = node.getAttribute('refID')
-        (a, b, c, d, e, f, g, h, i, x, y, z) = map(float, node.getAttribute('transformation').split(','))
+        self.refID = node.get('refID', '')
+        (a, b, c, d, e, f, g, h, i, x, y, z) = map(float, node.get('transformation', '').split(','))
         self.matrix = Matrix3D(n11=a,n12=b,n13=c,n14=0,n21=d,n22=e,n23=f,n24=0,n31=g,n32=h,n33=i,n34=0,n41=x,n42=y,n43=z,n44=1)
 
 class Part:
@@ -210,9 +268,9 @@ class Part:
         self.isGrouped = False
         self.GroupIDX = 0
         self.Bones = []
-        self.refID = node.getAttribute('refID')
-        self.designID = node.getAttribute('designID')
-        self.materials = list(map(str, node.getAttribute('materials').split(',')))
+        self.refID = node.get('refID', '')
+        self.designID = node.get('designID', '')
+        self.materials = list(map(str, node.get('materials', '').split(',')))
         
         lastm = '0'
         for i, m in enumerate(self.materials):
@@ -221,95 +279,126 @@ class Part:
                 self.materials[i] = self.materials[0] #in case of 0 choose the 'base' material
             else:
                 lastm = m
-        if node.hasAttribute('decoration'):
-            self.decoration = list(map(str,node.getAttribute('decoration').split(',')))
-        for childnode in node.childNodes:
-            if childnode.nodeName == 'Bone':
+        if 'decoration' in node.attrib:
+            self.decoration = list(map(str,node.get('decoration').split(',')))
+        for childnode in node:
+            if childnode.tag == 'Bone':
                 self.Bones.append(Bone(node=childnode)) 
 
 class Brick:
     def __init__(self, node):
-        self.refID = node.getAttribute('refID')
-        self.designID = node.getAttribute('designID')
+        self.refID = node.get('refID', '')
+        self.designID = node.get('designID', '')
         self.Parts = []
-        for childnode in node.childNodes:
-            if childnode.nodeName == 'Part':
+        for childnode in node:
+            if childnode.tag == 'Part':
                 self.Parts.append(Part(node=childnode))
 
 class SceneCamera:
     def __init__(self, node):
-        self.refID = node.getAttribute('refID')
-        (a, b, c, d, e, f, g, h, i, x, y, z) = map(float, node.getAttribute('transformation').split(','))
+        self.refID = node.get('refID', '')
+        (a, b, c, d, e, f, g, h, i, x, y, z) = map(float, node.get('transformation', '').split(','))
         self.matrix = Matrix3D(n11=a,n12=b,n13=c,n14=0,n21=d,n22=e,n23=f,n24=0,n31=g,n32=h,n33=i,n34=0,n41=x,n42=y,n43=z,n44=1)
-        self.fieldOfView = float(node.getAttribute('fieldOfView'))
-        self.distance = float(node.getAttribute('distance'))
+        self.fieldOfView = float(node.get('fieldOfView', ''))
+        self.distance = float(node.get('distance', ''))
 
 class Scene:
     def __init__(self, file):
         self.Bricks = []
         self.Scenecamera = []
         self.Groups = []
+        self.cameraRef = ''
 
         if file.endswith('.lxfml'):
-            with open(file, "rb") as file:
-                data = file.read()
+            with open(file, "rb") as source:
+                self.parse(source)
         elif file.endswith('.lxf'):
-            zf = zipfile.ZipFile(file, 'r')
-            data = zf.read('IMAGE100.LXFML')
+            with zipfile.ZipFile(file, 'r') as zf:
+                with zf.open('IMAGE100.LXFML') as source:
+                    self.parse(source)
         else:
             return
 
-        xml = minidom.parseString(data)
-        self.Name = xml.firstChild.getAttribute('name')
-                
-        for node in xml.firstChild.childNodes: 
-            if node.nodeName == 'Meta':
-                for childnode in node.childNodes:
-                    if childnode.nodeName == 'BrickSet':
-                        self.Version = str(childnode.getAttribute('version'))
-            elif node.nodeName == 'Cameras':
-                for childnode in node.childNodes:
-                    if childnode.nodeName == 'Camera':
-                        self.Scenecamera.append(SceneCamera(node=childnode))
-            elif node.nodeName == 'Bricks':
-                for childnode in node.childNodes:
-                    if childnode.nodeName == 'Brick':
-                        self.Bricks.append(Brick(node=childnode))
-            elif node.nodeName == 'GroupSystems':
-                for childnode in node.childNodes:
-                    if childnode.nodeName == 'GroupSystem':
-                        for childnode in childnode.childNodes:
-                            if childnode.nodeName == 'Group':
-                                self.Groups.append(Group(node=childnode))
-
-        for i in range(len(self.Groups)):
-            for brick in self.Bricks:
-                for part in brick.Parts:
-                    if part.refID in self.Groups[i].partRefs:
-                        part.isGrouped = True
-                        part.GroupIDX = i
+        # a part belongs to the last group listing it
+        groupIndex = {}
+        for i, group in enumerate(self.Groups):
+            for refID in group.partRefs:
+                groupIndex[refID] = i
+
+        for brick in self.Bricks:
+            for part in brick.Parts:
+                if part.refID in groupIndex:
+                    part.isGrouped = True
+                    part.GroupIDX = groupIndex[part.refID]
 
         print('Scene "'+ self.Name + '" Brickversion: ' + str(self.Version))
 
-class GeometryReader:
+    def parse(self, source):
+        # Streams the LXFML, every brick, camera and group is dropped from the tree once it has been read
+        path = []
+        for event, node in ElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if len(path) == 0:
+                    self.Name = node.get('name', '')
+                elif node.tag == 'Bricks':
+                    self.cameraRef = node.get('cameraRef', '')
+                path.append(node)
+                continue
+
+            path.pop()
+            if len(path) == 0:
+                continue
+            parent = path[-1]
+
+            if node.tag == 'BrickSet' and parent.tag == 'Meta':
+                self.Version = str(node.get('version', ''))
+            elif node.tag == 'Camera' and parent.tag == 'Cameras':
+                self.Scenecamera.append(SceneCamera(node=node))
+            elif node.tag == 'Brick' and parent.tag == 'Bricks':
+                self.Bricks.append(Brick(node=node))
+            elif node.tag == 'Group' and parent.tag == 'GroupSystem':
+                self.Groups.append(Group(node=node))
+            else:
+                continue
+            parent.remove(node)
+
+class GeometryReader(object):
     def __init__(self, data):
         self.offset = 0
         self.data = data
-        self.positions = []
-        self.normals = []
-        self.textures = []
-        self.faces = []
-        self.bonemap = {}
+        # decoded arrays, only filled when numpy is available
+        self.positionArray = None
+        self.normalArray = None
+        self.textureArray = None
+        self.faceArray = None
+        self.boneArray = None
+        # object views of the arrays, built on first access
+        self._positions = None
+        self._normals = None
+        self._textures = None
+        self._faces = None
+        self._bonemap = None
+        self._boneGroups = None
+        self._digest = None
         self.texCount = 0
         self.outpositions = []
         self.outnormals = []
 
-        if self.readInt() == 1111961649:
+        if data is not None and self.readInt() == 1111961649:
             self.valueCount = self.readInt()
             self.indexCount = self.readInt()
             self.faceCount = int(self.indexCount / 3)
             options = self.readInt()
 
+            if numpy is not None:
+                self.readArrays(options)
+                return
+
+            self.positions = []
+            self.normals = []
+            self.textures = []
+            self.faces = []
+
             for i in range(0, self.valueCount):
                 self.positions.append(Point3D(x=self.readFloat(),y= self.readFloat(),z=self.readFloat()))
 
@@ -339,18 +428,206 @@ class GeometryReader:
                 for i in range(0, self.valueCount):
                     boneoffset = self.readInt() + 4
                     self.bonemap[i] = self.read_Int(datastart + boneoffset)
-    
+
+    def readArrays(self, options):
+        self.positionArray = self.readArray('<f4', self.valueCount, 3)
+        self.normalArray = self.readArray('<f4', self.valueCount, 3)
+
+        if (options & 3) == 3:
+            self.texCount = self.valueCount
+            self.textureArray = self.readArray('<f4', self.valueCount, 2)
+
+        self.faceArray = self.readArray('<i4', self.faceCount, 3)
+
+        if (options & 48) == 48:
+            num = self.readInt()
+            self.offset += (num * 4) + (self.indexCount * 4)
+            num = self.readInt()
+            self.offset += (3 * num * 4) + (self.indexCount * 4)
+
+        bonelength = self.readInt()
+        self.boneArray = numpy.zeros(self.valueCount, dtype=numpy.int32)
+
+        if (bonelength > self.valueCount) or (bonelength > self.faceCount):
+            datastart = self.offset
+            self.offset += bonelength
+            # every vertex points to a bone record, the bone index is stored 4 bytes into it
+            boneoffsets = self.readArray('<i4', self.valueCount) + (datastart + 4)
+            raw = numpy.frombuffer(self.data, dtype=numpy.uint8)
+            self.boneArray = raw[boneoffsets[:, None] + numpy.arange(4)].view('<i4').ravel().astype(numpy.int32)
+
+    def compile(self):
+        return {'valueCount': self.valueCount, 'indexCount': self.indexCount, 'texCount': self.texCount, 'positions': self.positionArray, 'normals': self.normalArray, 'textures': self.textureArray, 'faces': self.faceArray, 'bones': self.boneArray}
+
+    def restore(self, compiled):
+        self.valueCount = compiled['valueCount']
+        self.indexCount = compiled['indexCount']
+        self.faceCount = int(self.indexCount / 3)
+        self.texCount = compiled['texCount']
+        self.positionArray = compiled['positions']
+        self.normalArray = compiled['normals']
+        self.textureArray = compiled['textures']
+        self.faceArray = compiled['faces']
+        self.boneArray = compiled['bones']
+
+    def weld(self, tolerance):
+        # Merges vertices whose position, normal, uv and bone agree within tolerance and drops the faces that collapse
+        if self.positionArray is None or self.valueCount == 0:
+            return 0
+        if self.faceArray.size > 0 and (self.faceArray.min() < 0 or self.faceArray.max() >= self.valueCount):
+            return 0
+        columns = [self.positionArray, self.normalArray]
+        if self.textureArray is not None:
+            columns.append(self.textureArray)
+        keys = numpy.column_stack((numpy.round(numpy.hstack(columns) / tolerance).astype(numpy.int64), self.boneArray))
+        unique, first, inverse = numpy.unique(keys, axis=0, return_index=True, return_inverse=True)
+        if len(first) == self.valueCount:
+            return 0
+
+        # the kept vertices stay in the order they first appear in
+        order = numpy.argsort(first)
+        remap = numpy.empty(len(first), dtype=numpy.int32)
+        remap[order] = numpy.arange(len(first), dtype=numpy.int32)
+        keep = first[order]
+        removed = self.valueCount - len(keep)
+        self.setArrays(self.positionArray[keep], self.normalArray[keep], self.textureArray[keep] if self.textureArray is not None else None, self.boneArray[keep], remap[inverse.reshape(-1)][self.faceArray])
+        return removed
+
+    def simplify(self, cellsize):
+        # Vertex clustering, the vertices of one bone inside one cell of cellsize become a single vertex
+        if self.positionArray is None or self.valueCount == 0:
+            return 0
+        if self.faceArray.size > 0 and (self.faceArray.min() < 0 or self.faceArray.max() >= self.valueCount):
+            return 0
+        cells = numpy.column_stack((numpy.floor(self.positionArray / cellsize).astype(numpy.int64), self.boneArray))
+        unique, first, inverse = numpy.unique(cells, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        counts = numpy.bincount(inverse, minlength=len(first)).astype(numpy.float64)
+        positions = numpy.zeros((len(first), 3))
+        numpy.add.at(positions, inverse, self.positionArray)
+        positions /= counts[:, None]
+        normals = numpy.zeros((len(first), 3))
+        numpy.add.at(normals, inverse, self.normalArray)
+        lengths = numpy.linalg.norm(normals, axis=1)
+        lengths[lengths == 0] = 1
+        normals /= lengths[:, None]
+        textures = self.textureArray[first] if self.textureArray is not None else None
+
+        faces = inverse[self.faceArray]
+        faceCount = self.faceCount
+        self.setArrays(positions.astype(self.positionArray.dtype), normals.astype(self.normalArray.dtype), textures, self.boneArray[first], faces)
+        # faces that now use the same three vertices are kept once
+        unique, first = numpy.unique(numpy.sort(self.faceArray, axis=1), axis=0, return_index=True)
+        self.setArrays(self.positionArray, self.normalArray, self.textureArray, self.boneArray, self.faceArray[numpy.sort(first)])
+        return faceCount - self.faceCount
+
+    def setArrays(self, positions, normals, textures, bones, faces):
+        # faces that collapsed to a line or a point are dropped, everything derived from the old arrays is reset
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])].astype(numpy.int32)
+        self.positionArray = positions
+        self.normalArray = normals
+        self.textureArray = textures
+        self.boneArray = bones
+        self.faceArray = faces
+        self.valueCount = len(positions)
+        self.texCount = len(positions) if textures is not None else 0
+        self.faceCount = len(faces)
+        self.indexCount = self.faceCount * 3
+        self._boneGroups = None
+        self._digest = None
+
+    def digest(self):
+        # identifies the decoded arrays, equal sub parts of different designIDs have the same digest
+        if self._digest is None and self.positionArray is not None:
+            sha = hashlib.sha1()
+            for (array, dtype) in ((self.positionArray, '<f4'), (self.normalArray, '<f4'), (self.textureArray, '<f4'), (self.faceArray, '<i4'), (self.boneArray, '<i4')):
+                if array is not None:
+                    sha.update(numpy.ascontiguousarray(array, dtype=dtype).tobytes())
+                sha.update(b'|')
+            self._digest = sha.hexdigest()
+        return self._digest
+
+    def readArray(self, dtype, count, width=1):
+        ret = numpy.frombuffer(self.data, dtype=dtype, count=count * width, offset=self.offset)
+        self.offset += count * width * 4
+        if width > 1:
+            ret = ret.reshape(count, width)
+        return ret
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            self._positions = [Point3D(x=x, y=y, z=z) for (x, y, z) in self.positionArray.tolist()] if self.positionArray is not None else []
+        return self._positions
+
+    @positions.setter
+    def positions(self, value):
+        self._positions = value
+
+    @property
+    def normals(self):
+        if self._normals is None:
+            self._normals = [Point3D(x=x, y=y, z=z) for (x, y, z) in self.normalArray.tolist()] if self.normalArray is not None else []
+        return self._normals
+
+    @normals.setter
+    def normals(self, value):
+        self._normals = value
+
+    @property
+    def textures(self):
+        if self._textures is None:
+            self._textures = [Point2D(x=x, y=y) for (x, y) in self.textureArray.tolist()] if self.textureArray is not None else []
+        return self._textures
+
+    @textures.setter
+    def textures(self, value):
+        self._textures = value
+
+    @property
+    def faces(self):
+        if self._faces is None:
+            self._faces = [Face(a=a, b=b, c=c) for (a, b, c) in self.faceArray.tolist()] if self.faceArray is not None else []
+        return self._faces
+
+    @faces.setter
+    def faces(self, value):
+        self._faces = value
+
+    @property
+    def bonemap(self):
+        if self._bonemap is None:
+            self._bonemap = self.boneArray.tolist() if self.boneArray is not None else {}
+        return self._bonemap
+
+    @bonemap.setter
+    def bonemap(self, value):
+        self._bonemap = value
+
+    def boneGroups(self):
+        # (bone index, vertex indices) pairs, grouped once per geometry
+        if self._boneGroups is None:
+            order = numpy.argsort(self.boneArray, kind='stable')
+            bones, starts = numpy.unique(self.boneArray[order], return_index=True)
+            self._boneGroups = list(zip(bones.tolist(), numpy.split(order, starts[1:])))
+        return self._boneGroups
+
+    def skin(self, matrices):
+        # Moves the vertices of every bone with that bone's matrix, one array operation per bone
+        positions = numpy.array(self.positionArray, dtype=numpy.float64)
+        normals = numpy.array(self.normalArray, dtype=numpy.float64)
+        for bone, indices in self.boneGroups():
+            if 0 <= bone < len(matrices):
+                positions[indices] = transformArray(positions[indices], matrices[bone])
+                normals[indices] = transformArray(normals[indices], matrices[bone], translate=False)
+        return positions, normals
+
     def read_Int(self,_offset):
-        if sys.version_info < (3, 0):
-            return int(struct.unpack_from('i', self.data, _offset)[0])
-        else:
-            return int.from_bytes(self.data[_offset:_offset + 4], byteorder='little')
+        return int.from_bytes(self.data[_offset:_offset + 4], byteorder='little')
 
     def readInt(self):
-        if sys.version_info < (3, 0):
-            ret = int(struct.unpack_from('i', self.data, self.offset)[0])
-        else:
-            ret = int.from_bytes(self.data[self.offset:self.offset + 4], byteorder='little')
+        ret = int.from_bytes(self.data[self.offset:self.offset + 4], byteorder='little')
         self.offset += 4
         return ret
 
@@ -360,31 +637,48 @@ class GeometryReader:
         return ret
 
 class Geometry:
-    def __init__(self, designID, database):
+    def __init__(self, designID, database, compiled=None, lod=0):
         self.designID = designID
+        self.lod = lod
         self.Parts = {} 
         self.maxGeoBounding = -1	
         self.studsFields2D = []
+        self.CollisionBoxes = []
+        # every database file that was looked at, a cached copy is only used while none of them changed
+        self.sources = []
         
-        GeometryLocation = os.path.normpath('{0}{1}{2}'.format(GEOMETRIEPATH, designID,'.g'))
+        if compiled is not None:
+            self.restore(compiled)
+            return
+
+        geometrypath = GEOMETRIEPATH
+        if lod > 0:
+            self.sources.append(os.path.normpath('{0}LOD{1}/{2}.g'.format(PRIMITIVEPATH, lod, designID)))
+            if self.sources[-1] in database.filelist:
+                geometrypath = '{0}LOD{1}/'.format(PRIMITIVEPATH, lod)
+
+        GeometryLocation = os.path.normpath('{0}{1}{2}'.format(geometrypath, designID,'.g'))
         GeometryCount = 0
+        self.sources.append(GeometryLocation)
         while str(GeometryLocation) in database.filelist:
             self.Parts[GeometryCount] = GeometryReader(data=database.filelist[GeometryLocation].read())
             GeometryCount += 1
-            GeometryLocation = os.path.normpath('{0}{1}{2}{3}'.format(GEOMETRIEPATH, designID,'.g',GeometryCount))
+            GeometryLocation = os.path.normpath('{0}{1}{2}{3}'.format(geometrypath, designID,'.g',GeometryCount))
+            self.sources.append(GeometryLocation)
 
-        primitive = Primitive(data = database.filelist[os.path.normpath(PRIMITIVEPATH + designID + '.xml')].read())
+        self.sources.append(os.path.normpath(PRIMITIVEPATH + designID + '.xml'))
+        primitive = Primitive(data = database.filelist[self.sources[-1]].read())
         self.Partname = primitive.Designname
         self.studsFields2D = primitive.Fields2D
-        try:
-            geoBoundingList = [abs(float(primitive.Bounding['minX']) - float(primitive.Bounding['maxX'])), abs(float(primitive.Bounding['minY']) - float(primitive.Bounding['maxY'])), abs(float(primitive.Bounding['minZ']) - float(primitive.Bounding['maxZ']))]
-            geoBoundingList.sort() 
-            self.maxGeoBounding = geoBoundingList[-1]
-        except KeyError as e:
-            print('\nBounding errror in part {0}: {1}\n'.format(designID, e))
+        self.CollisionBoxes = primitive.CollisionBoxes
+        self.setBounding(primitive.Bounding)
                     
         # preflex
         for part in self.Parts:
+            if self.Parts[part].positionArray is not None:
+                if len(primitive.Bones) > 0:
+                    self.Parts[part].positionArray, self.Parts[part].normalArray = self.Parts[part].skin([b.matrix for b in primitive.Bones])
+                continue
             # transform
             for i, b in enumerate(primitive.Bones):
                 # positions
@@ -396,6 +690,51 @@ class Geometry:
                     if (self.Parts[part].bonemap[k] == i):
                         self.Parts[part].normals[k].transformW(b.matrix)
 
+        if lod > 0 and geometrypath == GEOMETRIEPATH:
+            self.simplify(LODCLUSTERSIZE[lod])
+
+    def setBounding(self, bounding):
+        self.Bounding = bounding
+        try:
+            geoBoundingList = [abs(float(bounding['minX']) - float(bounding['maxX'])), abs(float(bounding['minY']) - float(bounding['maxY'])), abs(float(bounding['minZ']) - float(bounding['maxZ']))]
+            geoBoundingList.sort() 
+            self.maxGeoBounding = geoBoundingList[-1]
+        except KeyError as e:
+            print('\nBounding errror in part {0}: {1}\n'.format(self.designID, e))
+
+    def compile(self):
+        fields = [(f.type, len(f.custom2DField[0]) - 1, len(f.custom2DField) - 1, f.field2DRawData, [f.matrix.n11, f.matrix.n12, f.matrix.n13, f.matrix.n14, f.matrix.n21, f.matrix.n22, f.matrix.n23, f.matrix.n24, f.matrix.n31, f.matrix.n32, f.matrix.n33, f.matrix.n34, f.matrix.n41, f.matrix.n42, f.matrix.n43, f.matrix.n44]) for f in self.studsFields2D]
+        boxes = [(b.corner.x, b.corner.y, b.corner.z, [b.matrix.n11, b.matrix.n12, b.matrix.n13, b.matrix.n14, b.matrix.n21, b.matrix.n22, b.matrix.n23, b.matrix.n24, b.matrix.n31, b.matrix.n32, b.matrix.n33, b.matrix.n34, b.matrix.n41, b.matrix.n42, b.matrix.n43, b.matrix.n44]) for b in self.CollisionBoxes]
+        return {'version': GEOMETRYCACHEVERSION, 'sources': self.sources, 'designID': self.designID, 'Partname': self.Partname, 'Bounding': self.Bounding, 'studsFields2D': fields, 'CollisionBoxes': boxes, 'Parts': [self.Parts[part].compile() for part in sorted(self.Parts)]}
+
+    def restore(self, compiled):
+        self.sources = compiled['sources']
+        self.Partname = compiled['Partname']
+        self.setBounding(compiled['Bounding'])
+        for (sX, sY, sZ, matrix) in compiled['CollisionBoxes']:
+            box = CollisionBox(sX=sX, sY=sY, sZ=sZ)
+            box.matrix = Matrix3D(*matrix)
+            self.CollisionBoxes.append(box)
+        for (type, width, height, field2DRawData, matrix) in compiled['studsFields2D']:
+            field = Field2D(type=type, width=width, height=height, field2DRawData=field2DRawData)
+            field.matrix = Matrix3D(*matrix)
+            self.studsFields2D.append(field)
+        for i, part in enumerate(compiled['Parts']):
+            self.Parts[i] = GeometryReader(data=None)
+            self.Parts[i].restore(part)
+
+    def simplify(self, cellsize):
+        removed = 0
+        for part in self.Parts:
+            removed += self.Parts[part].simplify(cellsize)
+        return removed
+
+    def weld(self, tolerance=WELDTOLERANCE):
+        removed = 0
+        for part in self.Parts:
+            removed += self.Parts[part].weld(tolerance)
+        return removed
+
     def valuecount(self):
         count = 0
         for part in self.Parts:
@@ -414,6 +753,179 @@ class Geometry:
             count += self.Parts[part].texCount
         return count
 
+class ConverterStats(object):
+    # Seconds and counters per conversion phase, callback(stats, phase, seconds) runs after every timed phase
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.phases = collections.OrderedDict()
+        self.calls = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+        # decode seconds per designID, geometry loaded from the cache directory does not show up here
+        self.designs = {}
+        self.peakMemory = 0
+
+    def add(self, phase, seconds, designID=None):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.calls[phase] = self.calls.get(phase, 0) + 1
+            if designID is not None:
+                self.designs[designID] = self.designs.get(designID, 0.0) + seconds
+        if self.callback is not None:
+            self.callback(self, phase, seconds)
+
+    def count(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def set(self, counter, value):
+        with self.lock:
+            self.counters[counter] = value
+
+    def measureMemory(self):
+        # traced peak while tracemalloc runs (--profile), otherwise the peak resident size of the process
+        if tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+        elif resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        else:
+            return self.peakMemory
+        self.peakMemory = max(self.peakMemory, peak)
+        return self.peakMemory
+
+    def report(self):
+        with self.lock:
+            return {
+                'phases': collections.OrderedDict((phase, {'seconds': round(seconds, 6), 'calls': self.calls[phase]}) for (phase, seconds) in self.phases.items()),
+                'counters': collections.OrderedDict(self.counters),
+                'designs': dict((designID, round(seconds, 6)) for (designID, seconds) in self.designs.items()),
+                'peakMemory': self.peakMemory
+            }
+
+    def summary(self, slowest=10):
+        lines = ['{0:<24} {1:>10} {2:>8}'.format('phase', 'seconds', 'calls')]
+        for (phase, seconds) in self.phases.items():
+            lines.append('{0:<24} {1:>10.3f} {2:>8}'.format(phase, seconds, self.calls[phase]))
+        for (counter, value) in self.counters.items():
+            lines.append('{0:<24} {1:>10}'.format(counter, value))
+        if self.peakMemory > 0:
+            lines.append('{0:<24} {1:>10.1f} MB'.format('peak memory', self.peakMemory / 1048576.0))
+        for (designID, seconds) in sorted(self.designs.items(), key=lambda item: -item[1])[:slowest]:
+            lines.append('{0:<24} {1:>10.3f}'.format('decode ' + designID, seconds))
+        return '\n'.join(lines)
+
+class GeometryCache:
+    # Compiled (pre-flexed) geometry per designID on disk, one directory per database version and state
+    def __init__(self, database, stats=None, weld=None):
+        self.location = None
+        self.pending = {}
+        self.executor = None
+        self.stats = stats if stats is not None else ConverterStats()
+        # welding tolerance, None keeps the vertices as they are stored in the .g files
+        self.weld = weld
+        # decoded geometry stays in memory for every later export with the same converter
+        self.warm = {}
+        if numpy is None or database.dbinfo is None:
+            return
+        dbstate = hashlib.sha1(database.fingerprint.encode('utf-8')).hexdigest()[:16]
+        self.location = os.path.join(FindCacheDir(), '{0}_{1}'.format(database.dbinfo.Version, dbstate))
+        if weld is not None:
+            self.location += '_weld{0:g}'.format(weld)
+
+    def prefetch(self, parts, database, workers=None):
+        # Decodes every (designID, lod) of parts in background threads, get() then hands out the finished geometry
+        self.shutdown()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        task = lambda designID, lod: self.build(designID=designID, database=database, lod=lod)
+
+        for (designID, lod) in parts:
+            key = geometryKey(designID, lod)
+            if key not in self.pending and key not in self.warm:
+                self.pending[key] = self.executor.submit(task, designID, lod)
+        if len(self.pending) == 0:
+            self.shutdown()
+
+    def shutdown(self):
+        if self.executor is not None:
+            for future in self.pending.values():
+                future.cancel()
+            self.executor.shutdown(wait=False)
+        self.executor = None
+        self.pending = {}
+
+    def get(self, designID, database, lod=0):
+        key = geometryKey(designID, lod)
+        if key in self.warm:
+            self.stats.count('geometry memory hits')
+            return self.warm[key]
+        if key in self.pending:
+            start = time.time()
+            result = self.pending.pop(key).result()
+            self.stats.add('geometry wait', time.time() - start)
+            if len(self.pending) == 0:
+                self.shutdown()
+        else:
+            result = self.build(designID=designID, database=database, lod=lod)
+        self.warm[key] = result
+        return result
+
+    def build(self, designID, database, lod=0):
+        if self.location is not None:
+            compiled = self.load(geometryKey(designID, lod), database)
+            if compiled is not None:
+                self.stats.count('geometry disk hits')
+                return Geometry(designID=designID, database=database, compiled=compiled, lod=lod)
+        start = time.time()
+        geo = Geometry(designID=designID, database=database, lod=lod)
+        if self.weld is not None and numpy is not None:
+            self.stats.count('vertices welded', geo.weld(self.weld))
+        self.stats.add('geometry decode', time.time() - start, designID=geometryKey(designID, lod))
+        if self.location is not None:
+            self.save(geo, database)
+        return geo
+
+    def load(self, key, database):
+        # arrays of an .npz and json for the rest, nothing in the cache directory is unpickled
+        try:
+            with numpy.load(os.path.join(self.location, key + '.npz'), allow_pickle=False) as data:
+                compiled = json.loads(bytes(data['meta']).decode('utf-8'))
+                if compiled.get('version') != GEOMETRYCACHEVERSION:
+                    return None
+                for (i, part) in enumerate(compiled['Parts']):
+                    for name in GEOMETRYCACHEARRAYS:
+                        part[name] = data['{0}_{1}'.format(i, name)] if '{0}_{1}'.format(i, name) in data.files else None
+        except Exception as e:
+            return None
+        if [database.filelist.stamp(name) for name in compiled['sources']] != compiled['stamps']:
+            return None
+        return compiled
+
+    def save(self, geo, database):
+        filename = os.path.join(self.location, geometryKey(geo.designID, geo.lod) + '.npz')
+        tmpname = '{0}.{1}'.format(filename, os.getpid())
+        compiled = geo.compile()
+        compiled['stamps'] = [database.filelist.stamp(name) for name in geo.sources]
+        arrays = {}
+        for (i, part) in enumerate(compiled['Parts']):
+            for name in GEOMETRYCACHEARRAYS:
+                if part[name] is not None:
+                    arrays['{0}_{1}'.format(i, name)] = part[name]
+                del part[name]
+        try:
+            arrays['meta'] = numpy.frombuffer(json.dumps(compiled).encode('utf-8'), dtype=numpy.uint8)
+            if not os.path.isdir(self.location):
+                os.makedirs(self.location)
+            with open(tmpname, 'wb') as f:
+                numpy.savez(f, **arrays)
+            os.replace(tmpname, filename)
+        except Exception as e:
+            print('Could not write geometry cache {0}: {1}'.format(filename, e))
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+def geometryKey(designID, lod=0):
+    return designID if lod == 0 else '{0}.lod{1}'.format(designID, lod)
+
 class Bone2:
     def __init__(self,boneId=0, angle=0, ax=0, ay=0, az=0, tx=0, ty=0, tz=0):
         self.boneId = boneId
@@ -534,37 +1046,21 @@ class LOCReader:
         self.offset = 0
         self.values = {}
         self.data = data
-        if sys.version_info < (3, 0):
-            if ord(self.data[0]) == 50 and ord(self.data[1]) == 0:
-                self.offset += 2
-                while self.offset < len(self.data):
-                    key = self.NextString().replace('Material', '')
-                    value = self.NextString()
-                    self.values[key] = value
-        else:
-            if int(self.data[0]) == 50 and int(self.data[1]) == 0:
-                self.offset += 2
-                while self.offset < len(self.data):
-                    key = self.NextString().replace('Material', '')
-                    value = self.NextString()
-                    self.values[key] = value
+        if int(self.data[0]) == 50 and int(self.data[1]) == 0:
+            self.offset += 2
+            while self.offset < len(self.data):
+                key = self.NextString().replace('Material', '')
+                value = self.NextString()
+                self.values[key] = value
 
     def NextString(self):
         out = ''
-        if sys.version_info < (3, 0):
-            t = ord(self.data[self.offset])
-            self.offset += 1
-            while not t == 0:
-                out = '{0}{1}'.format(out,chr(t))
-                t = ord(self.data[self.offset])
-                self.offset += 1
-        else:
+        t = int(self.data[self.offset])
+        self.offset += 1
+        while not t == 0:
+            out = '{0}{1}'.format(out,chr(t))
             t = int(self.data[self.offset])
             self.offset += 1
-            while not t == 0:
-                out = '{0}{1}'.format(out,chr(t))
-                t = int(self.data[self.offset])
-                self.offset += 1
         return out
 
 class Materials:
@@ -784,6 +1280,58 @@ def Xform "material_{0}" (
         #return bxdf_mat_str
         return material
 
+class MaterialCache:
+    # Hands out one material per (materialId, decorationId) and keeps it for later imports in the same session
+    def __init__(self):
+        self.materials = {}
+
+    def get(self, materialRi, decorationId=None):
+        if decorationId == '0':
+            decorationId = None
+        if decorationId is None:
+            key = str(materialRi.materialId)
+        else:
+            key = '{0}_{1}'.format(materialRi.materialId, decorationId)
+
+        material = self.materials.get(key)
+        if not self.isvalid(material, key):
+            material = self.find(key)
+            if material is None:
+                if decorationId is None:
+                    material = materialRi.string(None)
+                else:
+                    material = self.decoration(decorationId)
+                material[MATERIALKEYPROPERTY] = key
+            self.materials[key] = material
+        return material
+
+    def isvalid(self, material, key):
+        if material is None:
+            return False
+        try:
+            # Datablocks removed by the user or by loading another file raise ReferenceError
+            return material.get(MATERIALKEYPROPERTY) == key
+        except ReferenceError:
+            return False
+
+    def find(self, key):
+        for material in bpy.data.materials:
+            if material.get(MATERIALKEYPROPERTY) == key:
+                return material
+        return None
+
+    def decoration(self, decorationId):
+        decofilename = DECORATIONPATH + decorationId + '.png'
+        material = bpy.data.materials.new(name=decorationId + '.png')
+        material.use_nodes = True
+        bsdf = material.node_tree.nodes["Principled BSDF"]
+        texImage = material.node_tree.nodes.new('ShaderNodeTexImage')
+        texImage.image = bpy.data.images.load(os.path.normpath(decofilename), check_existing=True)
+        material.node_tree.links.new(bsdf.inputs['Base Color'], texImage.outputs['Color'])
+        return material
+
+MATERIALCACHE = MaterialCache()
+
 class DBinfo:
     def __init__(self, data):
         xml = minidom.parseString(data)
@@ -791,29 +1339,94 @@ class DBinfo:
         print('DB Version: ' + str(self.Version))
 
 class DBFolderFile:
-    def __init__(self, name, handle):
+    def __init__(self, name, handle, filelist=None):
         self.handle = handle
         self.name = name
+        self.filelist = filelist
 
     def read(self):
         reader = open(self.handle, "rb")
         try:
             filecontent = reader.read()
             reader.close()
+            if self.filelist is not None:
+                self.filelist.addBytesRead(len(filecontent))
             return filecontent
         finally:
             reader.close()
         
+class DBFolderFileList:
+    # Resolves entries on demand instead of walking the whole db folder up front
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bytesread = 0
+
+    def addBytesRead(self, count):
+        with self.lock:
+            self.bytesread += count
+
+    def __contains__(self, name):
+        return os.path.isfile(name)
+
+    def __getitem__(self, name):
+        if not os.path.isfile(name):
+            raise KeyError(name)
+        return DBFolderFile(name=name, handle=name, filelist=self)
+
+    def stamp(self, name):
+        # changes when the file is edited in place, None for a missing file
+        try:
+            stat = os.stat(name)
+        except OSError as e:
+            return None
+        return '{0}-{1}'.format(stat.st_size, stat.st_mtime_ns)
+
 class LIFFile:
-    def __init__(self, name, offset, size, handle):
+    def __init__(self, name, offset, size, handle, filelist=None):
         self.handle = handle
         self.name = name
         self.offset = offset
         self.size = size
+        self.filelist = filelist
 
     def read(self):
-        self.handle.seek(self.offset, 0)
-        return self.handle.read(self.size)
+        if self.filelist is not None:
+            self.filelist.addBytesRead(self.size)
+        return self.handle[self.offset:self.offset + self.size]
+
+class LIFFileList:
+    # name -> (offset, size) table of a db.lif, LIFFile objects are created on access
+    def __init__(self, handle, entries):
+        self.handle = handle
+        self.entries = entries
+        self.lock = threading.Lock()
+        self.bytesread = 0
+
+    def addBytesRead(self, count):
+        with self.lock:
+            self.bytesread += count
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __getitem__(self, name):
+        (offset, size) = self.entries[name]
+        return LIFFile(name=name, offset=offset, size=size, handle=self.handle, filelist=self)
+
+    def stamp(self, name):
+        # the fingerprint of the whole db.lif covers the content, the entry tells files apart
+        if name not in self.entries:
+            return None
+        return '{0}-{1}'.format(*self.entries[name])
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def __len__(self):
+        return len(self.entries)
 
 class DBFolderReader:
     def __init__(self, folder):
@@ -832,6 +1445,7 @@ class DBFolderReader:
             self.parse()
             if self.fileexist(os.path.join(self.location,'Materials.xml')) and self.fileexist(os.path.join(self.location, 'info.xml')) and self.fileexist(os.path.normpath(os.path.join(self.location, MATERIALNAMESPATH, 'EN/localizedStrings.loc'))):
                 self.dbinfo = DBinfo(data=self.filelist[os.path.join(self.location,'info.xml')].read())
+                self.readFingerprint()
                 print("DB folder OK.")
                 self.initok = True
             else:
@@ -841,29 +1455,41 @@ class DBFolderReader:
         return filename in self.filelist
 
     def parse(self):
-        for path, subdirs, files in os.walk(self.location):
-            for name in files:
-                entryName = os.path.join(path, name)
-                self.filelist[entryName] = DBFolderFile(name=entryName, handle=entryName)
+        self.filelist = DBFolderFileList()
+
+    def readFingerprint(self):
+        # no single file to hash here, the mtimes of info.xml and the part folders change with the database
+        names = ['info.xml', 'Primitives', os.path.join('Primitives', 'LOD0')]
+        self.fingerprint = '-'.join('{0}'.format(os.stat(os.path.join(self.location, name)).st_mtime) for name in names if os.path.exists(os.path.join(self.location, name)))
     
 class LIFReader:
     def __init__(self, file):
         self.packedFilesOffset = 84
         self.filelist = {}
+        self.entries = {}
+        self.index = file + LIFINDEXSUFFIX
         self.initok = False
         self.location = file
         self.dbinfo = None
 
         try:
             self.filehandle = open(self.location, "rb")
-            self.filehandle.seek(0, 0)
+            self.mapping = mmap.mmap(self.filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = memoryview(self.mapping)
         except Exception as e:
             self.initok = False
             print("Database FAIL")
             return
         else:
-            if self.filehandle.read(4).decode() == "LIFF":
-                self.parse(prefix='', offset=self.readInt(offset=72) + 64)
+            if self.mapping[0:4] == b"LIFF":
+                self.readFingerprint()
+                if not self.loadIndex():
+                    self.parse(prefix='', offset=self.readInt(offset=72) + 64)
+                    # the index keeps the names with the separator of this platform
+                    if os.sep != '/':
+                        self.entries = dict((os.path.normpath(name), entry) for name, entry in self.entries.items())
+                    self.saveIndex()
+                self.filelist = LIFFileList(handle=self.data, entries=self.entries)
                 if self.fileexist(os.path.normpath('/Materials.xml')) and self.fileexist(os.path.normpath('/info.xml')) and self.fileexist(os.path.normpath(MATERIALNAMESPATH + 'EN/localizedStrings.loc')):
                     self.dbinfo = DBinfo(data=self.filelist[os.path.normpath('/info.xml')].read())
                     print("Database OK.")
@@ -890,70 +1516,512 @@ class LIFReader:
             entryType = self.readShort(offset=offset)
             offset += 6
 
-            entryName = '{0}{1}'.format(prefix,'/');
-            self.filehandle.seek(offset + 1, 0)
-            if sys.version_info < (3, 0):
-                t = ord(self.filehandle.read(1))
-            else:
-                t = int.from_bytes(self.filehandle.read(1), byteorder='big')
-
-            while not t == 0:
-                entryName ='{0}{1}'.format(entryName,chr(t))
-                self.filehandle.seek(1, 1)
-                if sys.version_info < (3, 0):
-                    t = ord(self.filehandle.read(1))
-                else:
-                    t = int.from_bytes(self.filehandle.read(1), byteorder='big')
-
-                offset += 2
-
-            offset += 6
+            # entry names are zero terminated UTF-16BE strings
+            nameEnd = self.mapping.find(b'\x00\x00', offset)
+            while (nameEnd - offset) % 2 == 1:
+                nameEnd = self.mapping.find(b'\x00\x00', nameEnd + 1)
+            entryName = '{0}/{1}'.format(prefix, self.mapping[offset:nameEnd].decode('utf-16-be'))
+            offset = nameEnd + 6
             self.packedFilesOffset += 20
 
             if entryType == 1:
                 offset = self.parse(prefix=entryName, offset=offset)
             elif entryType == 2:
                 fileSize = self.readInt(offset=offset) - 20
-                self.filelist[os.path.normpath(entryName)] = LIFFile(name=entryName, offset=self.packedFilesOffset, size=fileSize, handle=self.filehandle)
+                self.entries[entryName] = (self.packedFilesOffset, fileSize)
                 offset += 24
                 self.packedFilesOffset += fileSize
 
         return offset
 
+    def readFingerprint(self):
+        # size, mtime and a hash of the header and the start of the directory tables identify the state of a db.lif
+        stat = os.fstat(self.filehandle.fileno())
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        directory = self.readInt(offset=72) + 64
+        sha = hashlib.sha1(self.data[:min(LIFFINGERPRINTSIZE, directory)])
+        sha.update(self.data[directory:directory + LIFFINGERPRINTSIZE])
+        self.hash = sha.hexdigest()
+        self.fingerprint = '{0}-{1}-{2}'.format(self.size, self.mtime, self.hash)
+
+    def loadIndex(self):
+        try:
+            with open(self.index, 'rb') as f:
+                index = json.loads(f.read().decode('utf-8'))
+        except Exception as e:
+            return False
+        if index.get('version') != LIFINDEXVERSION or index.get('size') != self.size or index.get('mtime') != self.mtime or index.get('hash') != self.hash or index.get('separator') != os.sep:
+            return False
+        self.entries = index['entries']
+        return True
+
+    def saveIndex(self):
+        index = {'version': LIFINDEXVERSION, 'size': self.size, 'mtime': self.mtime, 'hash': self.hash, 'separator': os.sep, 'entries': self.entries}
+        tmpname = '{0}.{1}'.format(self.index, os.getpid())
+        try:
+            with open(tmpname, 'wb') as f:
+                f.write(json.dumps(index).encode('utf-8'))
+            os.replace(tmpname, self.index)
+        except Exception as e:
+            print('Could not write database index {0}: {1}'.format(self.index, e))
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
     def readInt(self, offset=0):
-        self.filehandle.seek(offset, 0)
-        if sys.version_info < (3, 0):
-            return int(struct.unpack('>i', self.filehandle.read(4))[0])
-        else:
-            return int.from_bytes(self.filehandle.read(4), byteorder='big')
+        return int(struct.unpack_from('>I', self.mapping, offset)[0])
 
     def readShort(self, offset=0):
-        self.filehandle.seek(offset, 0)
-        if sys.version_info < (3, 0):
-            return int(struct.unpack('>h', self.filehandle.read(2))[0])
+        return int(struct.unpack_from('>H', self.mapping, offset)[0])
+
+def invertRigid(matrix):
+    # inverse of a rotation followed by a translation, like the bone and box matrices of LDD
+    return Matrix3D(
+        n11=matrix.n11, n12=matrix.n21, n13=matrix.n31, n14=0,
+        n21=matrix.n12, n22=matrix.n22, n23=matrix.n32, n24=0,
+        n31=matrix.n13, n32=matrix.n23, n33=matrix.n33, n34=0,
+        n41=-(matrix.n41 * matrix.n11 + matrix.n42 * matrix.n12 + matrix.n43 * matrix.n13),
+        n42=-(matrix.n41 * matrix.n21 + matrix.n42 * matrix.n22 + matrix.n43 * matrix.n23),
+        n43=-(matrix.n41 * matrix.n31 + matrix.n42 * matrix.n32 + matrix.n43 * matrix.n33),
+        n44=1)
+
+def readBounding(bounding):
+    try:
+        return ((float(bounding['minX']), float(bounding['minY']), float(bounding['minZ'])), (float(bounding['maxX']), float(bounding['maxY']), float(bounding['maxZ'])))
+    except (KeyError, ValueError) as e:
+        return None
+
+class BoxGrid:
+    # Boxes of the parts of a scene in a uniform grid of OCCLUSIONCELLSIZE cells, finds the parts a point is inside of
+    def __init__(self, cellsize=OCCLUSIONCELLSIZE):
+        self.cellsize = cellsize
+        self.boxes = []
+        self.cells = {}
+
+    def add(self, matrix, low, high, owner, box=None):
+        # matrix places the part in the scene, box is a CollisionBox matrix from part space into the space of that box
+        toscene = [matrix] if box is None else [invertRigid(box), matrix]
+        corners = [Point3D(x=x, y=y, z=z) for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])]
+        for corner in corners:
+            for m in toscene:
+                corner.transform(m)
+        first = self.cell(Point3D(x=min(c.x for c in corners), y=min(c.y for c in corners), z=min(c.z for c in corners)))
+        last = self.cell(Point3D(x=max(c.x for c in corners), y=max(c.y for c in corners), z=max(c.z for c in corners)))
+
+        index = len(self.boxes)
+        self.boxes.append(([invertRigid(matrix)] if box is None else [invertRigid(matrix), box], low, high, owner))
+        for i in range(first[0], last[0] + 1):
+            for j in range(first[1], last[1] + 1):
+                for k in range(first[2], last[2] + 1):
+                    self.cells.setdefault((i, j, k), []).append(index)
+
+    def cell(self, point):
+        return (int(math.floor(point.x / self.cellsize)), int(math.floor(point.y / self.cellsize)), int(math.floor(point.z / self.cellsize)))
+
+    def inside(self, point, owner=None):
+        # point is in scene space, boxes of owner itself do not count
+        for index in self.cells.get(self.cell(point), ()):
+            (tolocal, low, high, other) = self.boxes[index]
+            if other is owner:
+                continue
+            p = point.copy()
+            for m in tolocal:
+                p.transform(m)
+            if low[0] < p.x < high[0] and low[1] < p.y < high[1] and low[2] < p.z < high[2]:
+                return True
+        return False
+
+def findEnclosed(placements, candidates=None):
+    # placements are (owner, matrix, designID, primitive) of rigid parts. A part is enclosed when points just outside
+    # every face of its Bounding box, ENCLOSURESTEP apart, are all inside collision boxes of other parts.
+    # Only the owners in candidates are tested (all of them for None), every placement covers the others
+    grid = BoxGrid()
+    for (owner, matrix, designID, primitive) in placements:
+        for box in primitive.CollisionBoxes:
+            grid.add(matrix, (-box.corner.x, -box.corner.y, -box.corner.z), (box.corner.x, box.corner.y, box.corner.z), owner, box=box.matrix)
+
+    enclosed = set()
+    surfaces = {}
+    for (owner, matrix, designID, primitive) in placements:
+        if candidates is not None and owner not in candidates:
+            continue
+        if designID not in surfaces:
+            bounds = readBounding(primitive.Bounding)
+            surfaces[designID] = surfacePoints(bounds[0], bounds[1]) if bounds is not None else []
+        if len(surfaces[designID]) == 0:
+            continue
+        for (x, y, z) in surfaces[designID]:
+            point = Point3D(x=x, y=y, z=z)
+            point.transform(matrix)
+            if not grid.inside(point, owner):
+                break
         else:
-            return int.from_bytes(self.filehandle.read(2), byteorder='big')
+            enclosed.add(owner)
+    return enclosed
+
+def surfacePoints(low, high):
+    # points ENCLOSUREMARGIN outside of every face of a box, about ENCLOSURESTEP apart
+    samples = []
+    for (a, b) in zip(low, high):
+        count = max(1, int(math.ceil((b - a) / ENCLOSURESTEP)))
+        samples.append([a + (b - a) * (k + 0.5) / count for k in range(count)])
+    points = []
+    for axis in range(3):
+        (u, v) = [other for other in range(3) if other != axis]
+        for side in (low[axis] - ENCLOSUREMARGIN, high[axis] + ENCLOSUREMARGIN):
+            for a in samples[u]:
+                for b in samples[v]:
+                    coords = [0, 0, 0]
+                    coords[axis] = side
+                    coords[u] = a
+                    coords[v] = b
+                    points.append(tuple(coords))
+    return points
+
+def buildMesh(mesh, positions, faces, textures=None):
+    # Fills an empty mesh straight from the geometry arrays instead of from_pydata and per loop uv writes
+    loops = numpy.ascontiguousarray(faces, dtype=numpy.int32).ravel()
+    faceCount = len(faces)
+
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set('co', numpy.ascontiguousarray(positions, dtype=numpy.float32).ravel())
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set('vertex_index', loops)
+    mesh.polygons.add(faceCount)
+    mesh.polygons.foreach_set('loop_start', numpy.arange(0, len(loops), 3, dtype=numpy.int32))
+    try:
+        mesh.polygons.foreach_set('loop_total', numpy.full(faceCount, 3, dtype=numpy.int32))
+    except (AttributeError, TypeError):
+        # read only since Blender 4.0, the sizes follow from loop_start there
+        pass
+    mesh.polygons.foreach_set('use_smooth', numpy.ones(faceCount, dtype=bool))
+
+    if textures is not None and len(textures) > 0:
+        uv_layer = mesh.uv_layers.new(do_init=False)
+        uvs = numpy.array(textures, dtype=numpy.float32)[loops]
+        uvs[:, 1] *= -1
+        uv_layer.data.foreach_set('uv', uvs.ravel())
+
+    mesh.update(calc_edges=True)
+
+def partProperties(bri, pa):
+    # custom properties of the object of a part, enough to build the part again or to find it on a re-import
+    properties = {
+        'lddBrickRefID': bri.refID,
+        'lddRefID': pa.refID,
+        'lddDesignID': pa.designID,
+        'lddMaterials': ','.join(pa.materials),
+        'lddBones': ';'.join(','.join(str(getattr(b.matrix, n)) for n in ('n11', 'n12', 'n13', 'n21', 'n22', 'n23', 'n31', 'n32', 'n33', 'n41', 'n42', 'n43')) for b in pa.Bones),
+        'lddGroup': pa.GroupIDX if pa.isGrouped else -1,
+    }
+    if hasattr(pa, 'decoration'):
+        properties['lddDecoration'] = ','.join(pa.decoration)
+    return properties
+
+def studPoints(studs):
+    # positions of the logos of a stud field in part space
+    points = []
+    for i in range(len(studs.custom2DField)):
+        for j in range(len(studs.custom2DField[0])):
+            if studs.custom2DField[i][j] in LOGOONSTUDSCONNTYPE: #Valid Connection type which are "allowed" for logo on stud
+                points.append((-1 * studs.matrix.n41 + j * 0.4 - 0.02, -1 * studs.matrix.n42 + 0.14, -1 * studs.matrix.n43 + i * 0.4 - 0))
+    return points
+
+def removeObject(obj):
+    for child in list(obj.children):
+        removeObject(child)
+    bpy.data.objects.remove(obj, do_unlink=True)
+
+class MeshBatch:
+    # Sub parts of many rigid bricks that share a material, moved into scene space to be built as one mesh
+    def __init__(self):
+        self.positions = []
+        self.faces = []
+        self.textures = []
+        self.vertexCount = 0
+
+    def add(self, reader, matrix, scale=1.0):
+        rotation = numpy.array(((matrix.n11, matrix.n12, matrix.n13), (matrix.n21, matrix.n22, matrix.n23), (matrix.n31, matrix.n32, matrix.n33)))
+        self.positions.append((reader.positionArray * scale) @ rotation + (matrix.n41, matrix.n42, matrix.n43))
+        self.faces.append(reader.faceArray + self.vertexCount)
+        self.textures.append(reader.textureArray)
+        self.vertexCount += len(reader.positionArray)
+
+    def build(self, mesh):
+        textures = None
+        if any(uv is not None for uv in self.textures):
+            # sub parts without uvs are padded so the uv layer covers every vertex
+            textures = numpy.concatenate([uv if uv is not None else numpy.zeros((len(positions), 2), dtype=numpy.float32) for (uv, positions) in zip(self.textures, self.positions)])
+        buildMesh(mesh, numpy.concatenate(self.positions), numpy.concatenate(self.faces), textures)
 
 class Converter:
+    def __init__(self, stats=None, weld=None):
+        self.stats = stats if stats is not None else ConverterStats()
+        self.weld = weld
+        self.primitives = {}
+
     def LoadDBFolder(self, dbfolderlocation):
+        start = time.time()
         self.database = DBFolderReader(folder=dbfolderlocation)
+        self.databaselocation = dbfolderlocation
+        self.geometrycache = GeometryCache(database=self.database, stats=self.stats, weld=self.weld)
 
         if self.database.initok and self.database.fileexist(os.path.join(dbfolderlocation,'Materials.xml')) and self.database.fileexist(os.path.normpath(MATERIALNAMESPATH + 'EN/localizedStrings.loc')):
             self.allMaterials = Materials(data=self.database.filelist[os.path.normpath(os.path.join(dbfolderlocation,'Materials.xml'))].read());
             self.allMaterials.setLOC(loc=LOCReader(data=self.database.filelist[os.path.normpath(MATERIALNAMESPATH + 'EN/localizedStrings.loc')].read()))
+        self.stats.add('database open', time.time() - start)
     
     def LoadDatabase(self,databaselocation):
+        start = time.time()
         self.database = LIFReader(file=databaselocation)
+        self.databaselocation = databaselocation
+        self.geometrycache = GeometryCache(database=self.database, stats=self.stats, weld=self.weld)
 
         if self.database.initok and self.database.fileexist(os.path.normpath('/Materials.xml')) and self.database.fileexist(os.path.normpath(MATERIALNAMESPATH + 'EN/localizedStrings.loc')):
             self.allMaterials = Materials(data=self.database.filelist[os.path.normpath('/Materials.xml')].read());
             self.allMaterials.setLOC(loc=LOCReader(data=self.database.filelist[os.path.normpath(MATERIALNAMESPATH + 'EN/localizedStrings.loc')].read()))
+        self.stats.add('database open', time.time() - start)
 
     def LoadScene(self,filename):
         if self.database.initok:
+            start = time.time()
             self.scene = Scene(file=filename)
+            self.stats.add('scene parse', time.time() - start)
+
+    def findEnclosedParts(self, candidates=None):
+        # rigid parts out of candidates (all for None) that are covered by other parts on every side, only the .xml files are read
+        start = time.time()
+        placements = []
+        for bri in self.scene.Bricks:
+            for pa in bri.Parts:
+                if len(pa.Bones) == 1:
+                    placements.append((pa, pa.Bones[0].matrix, pa.designID, self.readPrimitive(pa.designID)))
+        enclosed = findEnclosed(placements, candidates)
+        self.stats.add('interior culling', time.time() - start)
+        self.stats.count('enclosed parts', len(enclosed))
+        return enclosed
+
+    def findCulledParts(self, margin=FRUSTUMMARGIN):
+        # rigid parts whose box lies completely outside the view of the scene camera, widened by margin
+        camera = None
+        for cam in self.scene.Scenecamera:
+            if camera is None or cam.refID == self.scene.cameraRef:
+                camera = cam
+        culled = set()
+        if camera is None:
+            return culled
+        start = time.time()
+        view = invertRigid(camera.matrix)
+        tangent = math.tan(math.radians(LDDCAMERAFOV) / 2)
+        for bri in self.scene.Bricks:
+            for pa in bri.Parts:
+                if len(pa.Bones) != 1:
+                    continue
+                bounds = self.readPrimitiveBounds(pa.designID)
+                if bounds is None:
+                    continue
+                # world AABB of the placed part, then its corners in camera space where the camera looks down -z
+                corners = []
+                for x in (bounds[0][0], bounds[1][0]):
+                    for y in (bounds[0][1], bounds[1][1]):
+                        for z in (bounds[0][2], bounds[1][2]):
+                            point = Point3D(x=x, y=y, z=z)
+                            point.transform(pa.Bones[0].matrix)
+                            corners.append(point)
+                low = [min(getattr(c, axis) for c in corners) - margin for axis in ('x', 'y', 'z')]
+                high = [max(getattr(c, axis) for c in corners) + margin for axis in ('x', 'y', 'z')]
+                corners = []
+                for x in (low[0], high[0]):
+                    for y in (low[1], high[1]):
+                        for z in (low[2], high[2]):
+                            point = Point3D(x=x, y=y, z=z)
+                            point.transform(view)
+                            corners.append(point)
+                # outside when all corners are behind the camera or beyond the same side of the view
+                for plane in ((0, 0, 1), (1, 0, tangent), (-1, 0, tangent), (0, 1, tangent), (0, -1, tangent)):
+                    if all(plane[0] * c.x + plane[1] * c.y + plane[2] * c.z > 0 for c in corners):
+                        culled.add(pa)
+                        break
+        self.stats.add('frustum culling', time.time() - start)
+        self.stats.count('parts out of view', len(culled))
+        return culled
+
+    def isTransparent(self, pa):
+        # the logos under a part with a see-through material stay visible
+        for materialId in pa.materials:
+            material = self.allMaterials.MaterialsRi.get(materialId)
+            if material is not None and (material.materialType == 'Transparent' or material.a < 1):
+                return True
+        return False
+
+    def readPrimitive(self, designID):
+        # the .xml of a design without its .g files, for bounds, collision boxes and stud fields
+        if designID not in self.primitives:
+            self.primitives[designID] = Primitive(data = self.database.filelist[os.path.normpath(PRIMITIVEPATH + designID + '.xml')].read())
+        return self.primitives[designID]
+
+    def readPrimitiveBounds(self, designID):
+        # Primitive.Bounding of a design as (low, high) or None
+        return readBounding(self.readPrimitive(designID).Bounding)
+
+    def ExportProxies(self, col, global_matrix):
+        # A box from Primitive.Bounding per part, the .g geometry is not read. The proxies keep everything
+        # needed to build the part later as custom properties and the collection keeps the database
+        start = time.time()
+        boxes = {}
+        for bri in self.scene.Bricks:
+            for pa in bri.Parts:
+                if pa.designID not in boxes:
+                    (low, high) = self.readPrimitiveBounds(pa.designID) or ((0, 0, 0), (0.8, 0.96, 0.8))
+                    mesh = bpy.data.meshes.new('proxy{0}'.format(pa.designID))
+                    mesh.from_pydata([(x, y, z) for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])], [], PROXYFACES)
+                    boxes[pa.designID] = mesh
+
+                proxy = bpy.data.objects.new('proxy{0}_{1}'.format(pa.refID, pa.designID), boxes[pa.designID])
+                proxy.display_type = 'WIRE'
+                proxy.hide_render = True
+                m = pa.Bones[0].matrix
+                proxy.matrix_world = global_matrix @ mathutils.Matrix(((m.n11, m.n21, m.n31, m.n41),(m.n12, m.n22, m.n32, m.n42),(m.n13, m.n23, m.n33, m.n43),(m.n14, m.n24, m.n34, m.n44)))
+                for (key, value) in partProperties(bri, pa).items():
+                    proxy[key] = value
+                proxy['lddProxy'] = True
+                col.objects.link(proxy)
+                self.stats.count('proxies')
+        self.stats.add('proxy build', time.time() - start)
+
+    def UpdateParts(self, col, global_matrix):
+        # Matches the parts of the scene with the objects of an earlier import of the same file by refIDs.
+        # Returns the objects of the parts that are still up to date, removes the objects of parts that are gone or changed.
+        # Also returns (part, designID, matrix) of the rigid parts that were added, removed or moved, before (part None) and after
+        start = time.time()
+        existing = {}
+        for obj in col.all_objects:
+            if 'lddRefID' in obj and obj.parent is None:
+                existing[(obj['lddBrickRefID'], obj['lddRefID'])] = obj
+
+        unchanged = {}
+        changed = []
+        for bri in self.scene.Bricks:
+            for pa in bri.Parts:
+                obj = existing.pop((bri.refID, pa.refID), None)
+                properties = partProperties(bri, pa)
+                if obj is None or obj.get('lddBones') != properties['lddBones']:
+                    if len(pa.Bones) == 1:
+                        changed.append((pa, pa.designID, pa.Bones[0].matrix))
+                    if obj is not None and ';' not in obj.get('lddBones', ';'):
+                        changed.append((None, obj['lddDesignID'], Bone(node={'transformation': obj['lddBones']}).matrix))
+                if obj is None:
+                    self.stats.count('parts added')
+                    continue
+                if 'lddProxy' in obj:
+                    # proxies of an earlier proxy import are replaced by the bricks
+                    removeObject(obj)
+                    self.stats.count('proxies replaced')
+                elif all(obj.get(key) == properties.get(key) for key in ('lddDesignID', 'lddMaterials', 'lddDecoration', 'lddBones')):
+                    unchanged[pa] = obj
+                    self.stats.count('parts unchanged')
+                elif all(obj.get(key) == properties.get(key) for key in ('lddDesignID', 'lddMaterials', 'lddDecoration')) and len(pa.Bones) == 1:
+                    # a rigid part that only moved keeps its objects and its seam scale
+                    m = pa.Bones[0].matrix
+                    scale = tuple(obj.scale)
+                    obj.matrix_world = global_matrix @ mathutils.Matrix(((m.n11, m.n21, m.n31, m.n41),(m.n12, m.n22, m.n32, m.n42),(m.n13, m.n23, m.n33, m.n43),(m.n14, m.n24, m.n34, m.n44)))
+                    obj.scale = scale
+                    for (key, value) in properties.items():
+                        obj[key] = value
+                    unchanged[pa] = obj
+                    self.stats.count('parts moved')
+                else:
+                    removeObject(obj)
+                    self.stats.count('parts changed')
+
+        for obj in existing.values():
+            if ';' not in obj.get('lddBones', ';'):
+                changed.append((None, obj['lddDesignID'], Bone(node={'transformation': obj['lddBones']}).matrix))
+            removeObject(obj)
+        self.stats.count('parts removed', len(existing))
+        self.stats.add('reimport matching', time.time() - start)
+        return unchanged, changed
+
+    def touchedParts(self, parts, changed):
+        # the rigid parts out of parts that moved themselves or have a point of their enclosure test inside the bounds of a changed placement
+        grid = BoxGrid()
+        touched = set()
+        for (k, (owner, designID, matrix)) in enumerate(changed):
+            if owner in parts:
+                touched.add(owner)
+            bounds = self.readPrimitiveBounds(designID)
+            if bounds is not None:
+                grid.add(matrix, bounds[0], bounds[1], k)
+        for pa in parts:
+            if pa in touched:
+                continue
+            bounds = self.readPrimitiveBounds(pa.designID)
+            if len(pa.Bones) != 1 or bounds is None:
+                continue
+            for (x, y, z) in surfacePoints(bounds[0], bounds[1]):
+                point = Point3D(x=x, y=y, z=z)
+                point.transform(pa.Bones[0].matrix)
+                if grid.inside(point):
+                    touched.add(pa)
+                    break
+        return touched
+
+    def coveredStuds(self, pa, studocclusion):
+        # indices of the studs covered by another part per stud field (counted from 1) of a placed part, from the .xml only
+        covered = {}
+        if studocclusion is None or len(pa.Bones) != 1:
+            return covered
+        for (a, studs) in enumerate(self.readPrimitive(pa.designID).Fields2D, 1):
+            if studs.type == 23:
+                for (k, (x, y, z)) in enumerate(studPoints(studs)):
+                    point = Point3D(x=x, y=y, z=z)
+                    point.transform(pa.Bones[0].matrix)
+                    if studocclusion.inside(point, pa):
+                        covered.setdefault(a, []).append(k)
+        return covered
+
+    def partState(self, pa, lod, interior, inview, logos, studocclusion):
+        # what a part object got from its neighbours and the cameras, a re-import builds it again when this changes
+        state = {'lddLOD': lod, 'lddInterior': 1 if interior else 0, 'lddInView': 1 if inview else 0, 'lddLogos': 'none'}
+        if logos == True and lod == 0:
+            covered = {}
+            if studocclusion is not None:
+                covered = self.coveredStuds(pa, studocclusion)
+            state['lddLogos'] = ';'.join('{0}:{1}'.format(a, ','.join(str(k) for k in covered[a])) for a in sorted(covered))
+        return state
+
+    def selectLOD(self, pa, bounds):
+        # level of detail from the size of the part (bounds as from readPrimitiveBounds) seen by the nearest LDD camera,
+        # flex parts keep their full geometry
+        if len(pa.Bones) != 1 or bounds is None or len(self.scene.Scenecamera) == 0:
+            return 0
+        low, high = bounds
+        center = Point3D(x=(low[0] + high[0]) / 2, y=(low[1] + high[1]) / 2, z=(low[2] + high[2]) / 2)
+        center.transform(pa.Bones[0].matrix)
+        radius = math.sqrt((high[0] - low[0]) ** 2 + (high[1] - low[1]) ** 2 + (high[2] - low[2]) ** 2) / 2
+        distance = min(math.sqrt((center.x - cam.matrix.n41) ** 2 + (center.y - cam.matrix.n42) ** 2 + (center.z - cam.matrix.n43) ** 2) for cam in self.scene.Scenecamera)
+        if distance <= radius:
+            return 0
+        size = radius / (distance * math.tan(math.radians(LDDCAMERAFOV) / 2))
+        lod = 0
+        while lod < len(LODSCREENSIZE) and size < LODSCREENSIZE[lod]:
+            lod += 1
+        return lod
+
+    def updateStats(self):
+        # counters that are read off the database and the process instead of being counted along the way
+        self.stats.set('database bytes read', getattr(self.database.filelist, 'bytesread', 0))
+        self.stats.measureMemory()
+        return self.stats
+
+    def Export(self, filename, useLogoStuds, useLDDCamera, **options):
+        # the background decoding of prefetch must not keep running in Blender when an import fails
+        try:
+            self.ExportScene(filename, useLogoStuds, useLDDCamera, **options)
+        finally:
+            self.geometrycache.shutdown()
 
-    def Export(self,filename, useLogoStuds, useLDDCamera):
+    def ExportScene(self,filename, useLogoStuds, useLDDCamera, useInstancing=True, useStudCulling=False, interiorMode='NONE', useLOD=False, useFrustumCulling=False, frustumMargin=FRUSTUMMARGIN, mergeMode='NONE', mergeChunkSize=MERGECHUNKSIZE, useProxies=False, collection=None, useReimport=False, printStats=False):
         invert = Matrix3D() 
         #invert.n33 = -1 #uncomment to invert the Z-Axis
         
@@ -983,35 +2051,178 @@ class Converter:
         
         global_matrix = axis_conversion(from_forward='-Z', from_up='Y', to_forward='Y',to_up='Z').to_4x4()
         #col = bpy.data.collections.get("Collection")
-        col = bpy.data.collections.new(self.scene.Name)
-        bpy.context.scene.collection.children.link(col)
+        col = collection
+        if col is None and useReimport == True and mergeMode == 'NONE' and useProxies == False:
+            # a re-import updates the collection of the last import of the same file, if that made an object per part
+            for existing in bpy.data.collections:
+                if existing.get('lddFile') == os.path.abspath(filename) and existing.get('lddMergeMode') == 'NONE':
+                    col = existing
+        reimport = col is not None and collection is None
+
+        if col is None:
+            col = bpy.data.collections.new(self.scene.Name)
+            bpy.context.scene.collection.children.link(col)
+            col['lddFile'] = os.path.abspath(filename)
+            # merged meshes have no part to match, proxies do and are replaced by a re-import
+            col['lddMergeMode'] = 'NONE' if useProxies == True or numpy is None else mergeMode
+        # realized proxies are added to the collection of their import, which knows the database
+        col['lddDatabase'] = self.databaselocation
         
         if useLDDCamera == True:
+            # a re-import moves the cameras it made before, found by refID like the parts
+            cameras = {}
+            if reimport:
+                cameras = dict((obj['lddCameraRefID'], obj) for obj in col.objects if 'lddCameraRefID' in obj)
             for cam in self.scene.Scenecamera:
-                camera_data = bpy.data.cameras.new(name='Cam_{0}'.format(cam.refID)) 
-                camera_object = bpy.data.objects.new('Cam_{0}'.format(cam.refID), camera_data)
+                camera_object = cameras.get(cam.refID)
+                if camera_object is None:
+                    camera_data = bpy.data.cameras.new(name='Cam_{0}'.format(cam.refID)) 
+                    camera_object = bpy.data.objects.new('Cam_{0}'.format(cam.refID), camera_data)
+                    camera_object['lddCameraRefID'] = cam.refID
+                    #bpy.context.scene.collection.objects.link(camera_object)
+                    col.objects.link(camera_object)
                 transform_matrix = mathutils.Matrix(((cam.matrix.n11, cam.matrix.n21, cam.matrix.n31, cam.matrix.n41),(cam.matrix.n12, cam.matrix.n22, cam.matrix.n32, cam.matrix.n42),(cam.matrix.n13, cam.matrix.n23, cam.matrix.n33, cam.matrix.n43),(cam.matrix.n14, cam.matrix.n24, cam.matrix.n34, cam.matrix.n44)))
                 camera_object.matrix_world = global_matrix @ transform_matrix 
-                #bpy.context.scene.collection.objects.link(camera_object)
-                col.objects.link(camera_object)
                 camera_object.data.lens_unit = 'FOV'
-                camera_object.data.angle = math.radians(25)
+                camera_object.data.angle = math.radians(LDDCAMERAFOV)
+        
+        if useProxies == True:
+            self.ExportProxies(col, global_matrix)
+            self.stats.add('export', time.time() - start_time)
+            print("--- %s seconds ---" % (time.time() - start_time))
+            if printStats == True:
+                print(self.updateStats().summary())
+            return
+        
+        # Parts that did not change since the last import of this file are left as they are
+        unchanged = {}
+        changed = []
+        if reimport == True:
+            (unchanged, changed) = self.UpdateParts(col, global_matrix)
+        
+        # Parts the LDD camera cannot see are left out, their geometry is never decoded
+        outofview = set()
+        if useLDDCamera == True and useFrustumCulling == True:
+            outofview = self.findCulledParts(margin=frustumMargin)
+        
+        # Enclosed parts are left out or go into a collection that is hidden in viewport and render,
+        # parts out of view are not tested but still cover their neighbours. Unchanged parts are only
+        # tested again next to parts that changed, the others keep what the last import found
+        enclosed = set()
+        hiddencol = None
+        retested = set(unchanged)
+        if reimport == True and col.get('lddInteriorMode') == interiorMode:
+            retested = self.touchedParts(unchanged, changed)
+        col['lddInteriorMode'] = interiorMode
+        if interiorMode != 'NONE':
+            enclosed = self.findEnclosedParts(candidates=set(pa for bri in self.scene.Bricks for pa in bri.Parts if pa not in outofview and (pa not in unchanged or pa in retested)))
+        
+        if interiorMode == 'HIDE' and len(enclosed) > 0:
+            hiddencol = col.children.get(self.scene.Name + ' interior') if reimport else None
+            if hiddencol is None:
+                hiddencol = bpy.data.collections.new(self.scene.Name + ' interior')
+                col.children.link(hiddencol)
+            hiddencol.hide_viewport = True
+            hiddencol.hide_render = True
+        
+        # Studs covered by another part get no logo, flex parts are left out on both sides
+        studocclusion = None
+        if uselogoonstuds == True and useStudCulling == True:
+            start = time.time()
+            studocclusion = BoxGrid()
+            for bri in self.scene.Bricks:
+                for pa in bri.Parts:
+                    if len(pa.Bones) == 1 and not self.isTransparent(pa):
+                        bounds = self.readPrimitiveBounds(pa.designID)
+                        if bounds is not None:
+                            studocclusion.add(pa.Bones[0].matrix, bounds[0], bounds[1], pa)
+            self.stats.add('stud occlusion', time.time() - start)
+        
+        # Unchanged parts whose logos, interior collection or level of detail depend on parts or cameras that changed are built again,
+        # the ones the camera does not see any more are removed
+        for (pa, obj) in list(unchanged.items()):
+            lod = self.selectLOD(pa, self.readPrimitiveBounds(pa.designID)) if useLOD == True else 0
+            interior = pa in enclosed if pa in retested else obj.get('lddInterior') == 1
+            state = self.partState(pa, lod, interior, pa not in outofview, uselogoonstuds, studocclusion)
+            if any(obj.get(key) != value for (key, value) in state.items()):
+                removeObject(obj)
+                del unchanged[pa]
+                self.stats.count('parts removed out of view' if pa in outofview else 'parts rebuilt for neighbours')
+        
+        # Parts that look small from the LDD cameras get coarser geometry, chosen from the bounds in the .xml files
+        lods = {}
+        if useLOD == True:
+            start = time.time()
+            for bri in self.scene.Bricks:
+                for pa in bri.Parts:
+                    if pa in outofview or pa in unchanged or (pa in enclosed and interiorMode == 'SKIP'):
+                        continue
+                    lods[pa] = self.selectLOD(pa, self.readPrimitiveBounds(pa.designID))
+                    self.stats.count('parts at lod{0}'.format(lods[pa]))
+            self.stats.add('lod selection', time.time() - start)
+        
+        # decode the geometry of the parts that are built, at their level of detail, in the background while the objects are created
+        self.geometrycache.prefetch(parts=[(pa.designID, lods.get(pa, 0)) for bri in self.scene.Bricks for pa in bri.Parts if pa not in unchanged and pa not in outofview and not (pa in enclosed and interiorMode == 'SKIP')], database=self.database)
+        
+        # Rigid parts go into one mesh per material (and chunk) instead of an object per brick and sub part
+        batches = None
+        if mergeMode != 'NONE' and numpy is not None:
+            batches = {}
         
         for bri in self.scene.Bricks:
             current += 1    
 
             for pa in bri.Parts:
                 currentpart += 1
-
-                if pa.designID not in geometriecache:
-                    geo = Geometry(designID=pa.designID, database=self.database)
+                if pa in enclosed and interiorMode == 'SKIP':
+                    continue
+                if pa in outofview or pa in unchanged:
+                    continue
+                partcol = hiddencol if pa in enclosed else col
+
+                lod = lods.get(pa, 0)
+                lodkey = geometryKey(pa.designID, lod)
+                if lodkey not in geometriecache:
+                    self.stats.count('geometriecache misses')
+                    geo = self.geometrycache.get(designID=pa.designID, database=self.database, lod=lod)
                     progress(current ,total , "(" + geo.designID + ") " + geo.Partname, ' ')
-                    geometriecache[pa.designID] = geo
+                    geometriecache[lodkey] = geo
                     
                 else:
-                    geo = geometriecache[pa.designID]
+                    self.stats.count('geometriecache hits')
+                    geo = geometriecache[lodkey]
                     progress(current ,total , "(" + geo.designID + ") " + geo.Partname ,'-')
                     
+                if batches is not None and len(pa.Bones) == 1 and all(geo.Parts[part].positionArray is not None for part in geo.Parts):
+                    start = time.time()
+                    if mergeMode == 'GROUP':
+                        chunk = pa.GroupIDX if pa.isGrouped else -1
+                    elif mergeMode == 'BRICKS':
+                        chunk = (current - 1) // max(1, mergeChunkSize)
+                    else:
+                        chunk = 0
+                    scalefact = (geo.maxGeoBounding - 0.025 * random.uniform(0.0, 1.000)) / geo.maxGeoBounding
+                    decoCount = 0
+                    for part in geo.Parts:
+                        try:
+                            materialCurrentPart = pa.materials[part]
+                        except IndexError:
+                            print('WARNING: {0}.g{1} has NO material assignment in lxf. Replaced with color 9. Fix {0}.xml faces values.'.format(pa.designID, part))
+                            materialCurrentPart = '9'
+                        deco = '0'
+                        if hasattr(pa, 'decoration') and geo.Parts[part].texCount > 0:
+                            if decoCount < len(pa.decoration):
+                                deco = pa.decoration[decoCount]
+                            decoCount += 1
+                        batchkey = (partcol, chunk, materialCurrentPart, deco)
+                        if batchkey not in batches:
+                            batches[batchkey] = MeshBatch()
+                        batches[batchkey].add(geo.Parts[part], pa.Bones[0].matrix, scalefact)
+                    if miny > float(pa.Bones[0].matrix.n42):
+                        miny = pa.Bones[0].matrix.n42
+                    self.stats.add('mesh merge', time.time() - start)
+                    continue
+
                 # n11=a, n21=d, n31=g, n41=x,
                 # n12=b, n22=e, n32=h, n42=y,
                 # n13=c, n23=f, n33=i, n43=z,
@@ -1052,7 +2263,11 @@ class Converter:
                 
                 brick_object = bpy.data.objects.new("brick{0}_{1}".format(currentpart, written_obj), None)                
                 #bpy.context.scene.collection.objects.link(brick_object)
-                col.objects.link(brick_object)
+                partcol.objects.link(brick_object)
+                for (key, value) in partProperties(bri, pa).items():
+                    brick_object[key] = value
+                for (key, value) in self.partState(pa, lod, pa in enclosed, pa not in outofview, uselogoonstuds, studocclusion).items():
+                    brick_object[key] = value
                 brick_object.empty_display_size = 1.25
                 brick_object.empty_display_type = 'PLAIN_AXES'
                 #out.write('''
@@ -1078,60 +2293,87 @@ class Converter:
                 for part in geo.Parts:
                     
                     written_geo = str(geo.designID) + '_' + str(part)
+                    if lod > 0:
+                        written_geo = written_geo + '_lod' + str(lod)
                     
-                    geo.Parts[part].outpositions = [elem.copy() for elem in geo.Parts[part].positions]
-                    geo.Parts[part].outnormals = [elem.copy() for elem in geo.Parts[part].normals]
+                    if geo.Parts[part].positionArray is None:
+                        geo.Parts[part].outpositions = [elem.copy() for elem in geo.Parts[part].positions]
+                        geo.Parts[part].outnormals = [elem.copy() for elem in geo.Parts[part].normals]
                     
                     # translate / rotate only parts with more then 1 bone. This are flex parts
                     if (len(pa.Bones) > flexflag):
 
                         written_geo = written_geo + '_' + uniqueId
-                        for i, b in enumerate(pa.Bones):
-                            # positions
-                            for j, p in enumerate(geo.Parts[part].outpositions):
-                                if (geo.Parts[part].bonemap[j] == i):
-                                    p.transform( invert * b.matrix)
+                        start = time.time()
+                        if geo.Parts[part].positionArray is not None:
+                            positions, normals = geo.Parts[part].skin([invert * b.matrix for b in pa.Bones])
+                        else:
+                            for i, b in enumerate(pa.Bones):
+                                # positions
+                                for j, p in enumerate(geo.Parts[part].outpositions):
+                                    if (geo.Parts[part].bonemap[j] == i):
+                                        p.transform( invert * b.matrix)
                                     
-                            # normals
-                            for k, n in enumerate(geo.Parts[part].outnormals):
-                                if (geo.Parts[part].bonemap[k] == i):
-                                    n.transformW( invert * b.matrix)
-
-                    if "geo{0}".format(written_geo) not in geometriecache:
+                                # normals
+                                for k, n in enumerate(geo.Parts[part].outnormals):
+                                    if (geo.Parts[part].bonemap[k] == i):
+                                        n.transformW( invert * b.matrix)
+                        self.stats.add('flex skinning', time.time() - start)
+
+                    # rigid sub parts with the same decoded geometry share one mesh, also across designIDs
+                    geokey = "geo{0}".format(written_geo)
+                    if not (len(pa.Bones) > flexflag) and geo.Parts[part].digest() is not None:
+                        geokey = "geo" + geo.Parts[part].digest()
+
+                    start = time.time()
+                    if geokey not in geometriecache:
                         
                         mesh = bpy.data.meshes.new("geo{0}".format(written_geo))
+                        if useInstancing == True:
+                            # Shared meshes keep a single empty slot, the material is linked to each object
+                            mesh.materials.append(None)
                         
-                        verts = []
-                        for point in geo.Parts[part].outpositions:
-                            single_vert = mathutils.Vector([point.x, point.y, point.z])
-                            verts.append(single_vert)
+                        if geo.Parts[part].positionArray is not None:
+                            if not (len(pa.Bones) > flexflag):
+                                positions = geo.Parts[part].positionArray
+                            buildMesh(mesh, positions, geo.Parts[part].faceArray, geo.Parts[part].textureArray)
                         
-                        usenormal = False
-                        if usenormal == True: # write normals in case flag True
-                            # WARNING: SOME PARTS MAY HAVE BAD NORMALS. FOR EXAMPLE MAYBE PART: (85861) PL.ROUND 1X1 W. THROUGHG. HOLE
-                            #gop.write('\t\tnormal3f[] normals = [')
-                            for normal in geo.Parts[part].outnormals:
-                                i =0
-                                #gop.write('{0}({1}, {2}, {3})'.format(fmt, normal.x, normal.y, normal.z))
+                        else:
+                            verts = []
+                            for point in geo.Parts[part].outpositions:
+                                single_vert = mathutils.Vector([point.x, point.y, point.z])
+                                verts.append(single_vert)
                         
-                        faces = []
-                        for face in geo.Parts[part].faces:
-                            single_face = [face.a , face.b, face.c]
-                            faces.append(single_face)
+                            usenormal = False
+                            if usenormal == True: # write normals in case flag True
+                                # WARNING: SOME PARTS MAY HAVE BAD NORMALS. FOR EXAMPLE MAYBE PART: (85861) PL.ROUND 1X1 W. THROUGHG. HOLE
+                                #gop.write('\t\tnormal3f[] normals = [')
+                                for normal in geo.Parts[part].outnormals:
+                                    i =0
+                                    #gop.write('{0}({1}, {2}, {3})'.format(fmt, normal.x, normal.y, normal.z))
+                        
+                            faces = []
+                            for face in geo.Parts[part].faces:
+                                single_face = [face.a , face.b, face.c]
+                                faces.append(single_face)
                             
-                        edges = []
-                        mesh.from_pydata(verts, edges, faces)
-                        for f in mesh.polygons:
-                            f.use_smooth = True
-                        geometriecache["geo{0}".format(written_geo)] = mesh 
+                            edges = []
+                            mesh.from_pydata(verts, edges, faces)
+                            for f in mesh.polygons:
+                                f.use_smooth = True
+                        geometriecache[geokey] = mesh
                         
+                    elif useInstancing == True:
+                        mesh = geometriecache[geokey]
+                    
                     else:
-                        mesh = geometriecache["geo{0}".format(written_geo)].copy()
+                        mesh = geometriecache[geokey].copy()
                         mesh.materials.clear()
                     
                     geo_obj = bpy.data.objects.new(mesh.name, mesh)
                     geo_obj.parent = brick_object
-                    col.objects.link(geo_obj)
+                    partcol.objects.link(geo_obj)
+                    self.stats.add('mesh build', time.time() - start)
 
                     #try catch here for possible problems in materials assignment of various g, g1, g2, .. files in lxf file
                     try:
@@ -1140,29 +2382,22 @@ class Converter:
                         print('WARNING: {0}.g{1} has NO material assignment in lxf. Replaced with color 9. Fix {0}.xml faces values.'.format(pa.designID, part))
                         materialCurrentPart = '9'
                     
+                    start = time.time()
                     lddmatri = self.allMaterials.getMaterialRibyId(materialCurrentPart)
                     matname = materialCurrentPart
 
                     deco = '0'
-                    if hasattr(pa, 'decoration') and len(geo.Parts[part].textures) > 0:
+                    if hasattr(pa, 'decoration') and geo.Parts[part].texCount > 0:
                         if decoCount < len(pa.decoration):
                             deco = pa.decoration[decoCount]
                         decoCount += 1
 
                     extfile = ''
+                    partmaterials = []
                     if not deco == '0':
                     #    extfile = deco + '.png'
                     #    matname += "_" + deco
-                        decofilename = DECORATIONPATH + deco + '.png'    
-                        
-                        mat = bpy.data.materials.new(name=deco + '.png')
-                        mat.use_nodes = True
-                        bsdf = mat.node_tree.nodes["Principled BSDF"]
-                        texImage = mat.node_tree.nodes.new('ShaderNodeTexImage')
-                        texImage.image = bpy.data.images.load(os.path.normpath(decofilename))
-                        mat.node_tree.links.new(bsdf.inputs['Base Color'], texImage.outputs['Color'])
-                        
-                        mesh.materials.append(mat)
+                        partmaterials.append(MATERIALCACHE.get(lddmatri, deco))
 
                         # Assign it to object
                         #if geo_obj.data.materials:
@@ -1185,17 +2420,25 @@ class Converter:
 
                     #    else:
                     #        outmat.write(lddmatri.string(None))
-                        mesh.materials.append(lddmatri.string(None))  
+                        partmaterials.append(MATERIALCACHE.get(lddmatri))
                     #    outmat.close()
 
+                    if useInstancing == True:
+                        geo_obj.material_slots[0].link = 'OBJECT'
+                        geo_obj.material_slots[0].material = partmaterials[0]
+                    else:
+                        for mat in partmaterials:
+                            mesh.materials.append(mat)
+                    self.stats.add('material creation', time.time() - start)
+
                     #op.write('\n\t\tcolor3f[] primvars:displayColor = [({0}, {1}, {2})]\n'.format(lddmatri.r, lddmatri.g, lddmatri.b))
                     #op.write('\t\trel material:binding = <Material{0}/material_{0}a>\n'.format(matname))
                     #op.write('''\t\tdef "Material{0}" (add references = @./material_{0}.usda@'''.format(matname))
                             
                     #gop.write('\n\t\tcolor3f[] primvars:displayColor = [(1, 0, 0)]\n')
                             
-                    if len(geo.Parts[part].textures) > 0:
-                        
+                    if geo.Parts[part].texCount > 0 and len(mesh.uv_layers) == 0:
+                        start = time.time()
                         mesh.uv_layers.new(do_init=False)
                         uv_layer = mesh.uv_layers.active.data
                         
@@ -1217,6 +2460,7 @@ class Converter:
                                 #print("    Vertex: %d" % mesh.loops[loop_index].vertex_index)
                                 uv_layer[loop_index].uv = uvs[mesh.loops[loop_index].vertex_index]
                                 #print("    UV: %r" % uv_layer[loop_index].uv)
+                        self.stats.add('mesh build', time.time() - start)
                         
                         #for face in geo.Parts[part].faces:
                             #gop.write('{0}{1},{2},{3}'.format(fmt, face.a, face.b, face.c))
@@ -1225,8 +2469,8 @@ class Converter:
                     #gop.close()      
 
                 #Logo on studs
-                if uselogoonstuds == True: # write logo on studs in case flag True
-                           
+                if uselogoonstuds == True and lod == 0: # write logo on studs in case flag True
+                    start = time.time()
                     if 'logoonstuds' not in geometriecache:    
                         #Basically the .usda logo from LegoToRHD - without the disk
                         faceVertexCounts = [3, 4, 4, 4, 4, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 4, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 4, 3, 3, 4, 4, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 3, 3, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 4, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 4, 3, 3, 4, 4, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 4, 3, 3, 3, 3, 3, 4, 4, 4, 4, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 4, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 4, 3, 3, 4, 4, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 3, 3, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 4, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 4, 3, 3, 4, 4, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 3, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 3, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 3, 3, 3, 3, 3, 3, 3, 3, 3]
@@ -1245,29 +2489,69 @@ class Converter:
                         logo_mesh.from_pydata(points, edges, faces)
                         for f in logo_mesh.polygons:
                             f.use_smooth = True
+                        if useInstancing == True:
+                            logo_mesh.materials.append(None)
                         geometriecache['logoonstuds'] = logo_mesh
                     
+                    elif useInstancing == True:
+                        logo_mesh = geometriecache['logoonstuds']
+                    
                     else:
                         logo_mesh = geometriecache['logoonstuds'].copy()
                         logo_mesh.materials.clear()
-                            
-                    logo_mesh.materials.append(lddmatri.string(None))
                     
+                    logo_material = MATERIALCACHE.get(lddmatri)
+                    if useInstancing == False:
+                        logo_mesh.materials.append(logo_material)
+                    
+                    coveredstuds = self.coveredStuds(pa, studocclusion)
                     a = 0
                     for studs in geo.studsFields2D:
                         a += 1
                         if studs.type == 23:
-                            for i in range(len(studs.custom2DField)):
-                                for j in range(len(studs.custom2DField[0])):
-                                    if studs.custom2DField[i][j] in LOGOONSTUDSCONNTYPE: #Valid Connection type which are "allowed" for logo on stud
-                                        #logo_transform_matrix = mathutils.Matrix(((studs.matrix.n11, studs.matrix.n21, studs.matrix.n31, studs.matrix.n41),(studs.matrix.n12, studs.matrix.n22, studs.matrix.n32, studs.matrix.n42),(studs.matrix.n13, studs.matrix.n23, studs.matrix.n33, studs.matrix.n43),(studs.matrix.n14, studs.matrix.n24, studs.matrix.n34, studs.matrix.n44)))
-                                        logo_obj = bpy.data.objects.new(logo_mesh.name, logo_mesh)
-                                        logo_obj.parent = brick_object
-                                        col.objects.link(logo_obj)
-                                        
-                                        logo_transform_matrix = mathutils.Matrix(((studs.matrix.n11, studs.matrix.n21, studs.matrix.n31, -1 * studs.matrix.n41 + j * 0.4 - 0.02),(studs.matrix.n12, studs.matrix.n22, studs.matrix.n32, -1 * studs.matrix.n42 + 0.14),(studs.matrix.n13, studs.matrix.n23, studs.matrix.n33, -1 * studs.matrix.n43 + i * 0.4 - 0),(studs.matrix.n14, studs.matrix.n24, studs.matrix.n34, studs.matrix.n44)))
-                                        logo_obj.matrix_world = logo_transform_matrix
-                                        logo_obj.scale = (0.80, 0.80, 0.80)
+                            # All studs of a field are vertices of one mesh that instances a single logo object,
+                            # the mesh is shared by every brick of that designID with the same covered studs
+                            studskey = 'studs{0}_{1}'.format(geo.designID, a)
+                            if 'points' + studskey not in geometriecache:
+                                geometriecache['points' + studskey] = studPoints(studs)
+                            studpoints = geometriecache['points' + studskey]
+
+                            meshkey = studskey
+                            covered = coveredstuds.get(a, [])
+                            if len(covered) > 0:
+                                meshkey = studskey + '_' + '_'.join(str(k) for k in covered)
+                                studpoints = [point for (k, point) in enumerate(studpoints) if k not in set(covered)]
+                                self.stats.count('stud logos culled', len(covered))
+
+                            if meshkey not in geometriecache:
+                                studs_mesh = None
+                                if len(studpoints) > 0:
+                                    studs_mesh = bpy.data.meshes.new(studskey)
+                                    studs_mesh.from_pydata(studpoints, [], [])
+                                geometriecache[meshkey] = studs_mesh
+
+                            studs_mesh = geometriecache[meshkey]
+                            if studs_mesh is None:
+                                continue
+
+                            studs_obj = bpy.data.objects.new('Studs', studs_mesh)
+                            studs_obj.parent = brick_object
+                            studs_obj.instance_type = 'VERTS'
+                            partcol.objects.link(studs_obj)
+                            self.stats.count('stud logos', len(studpoints))
+
+                            logo_obj = bpy.data.objects.new(logo_mesh.name, logo_mesh)
+                            logo_obj.parent = studs_obj
+                            partcol.objects.link(logo_obj)
+                            if useInstancing == True:
+                                logo_obj.material_slots[0].link = 'OBJECT'
+                                logo_obj.material_slots[0].material = logo_material
+
+                            # Vertex instances keep the rotation of the logo object and add the vertex position
+                            logo_transform_matrix = mathutils.Matrix(((studs.matrix.n11, studs.matrix.n21, studs.matrix.n31, 0),(studs.matrix.n12, studs.matrix.n22, studs.matrix.n32, 0),(studs.matrix.n13, studs.matrix.n23, studs.matrix.n33, 0),(studs.matrix.n14, studs.matrix.n24, studs.matrix.n34, studs.matrix.n44)))
+                            logo_obj.matrix_world = logo_transform_matrix
+                            logo_obj.scale = (0.80, 0.80, 0.80)
+                    self.stats.add('logo placement', time.time() - start)
                                       
                 if not (len(pa.Bones) > flexflag):
                     #Transform (move) only non-flex parts
@@ -1284,13 +2568,33 @@ class Converter:
                 indexOffset = 1
                 textOffset = 1
         
+        if batches is not None:
+            start = time.time()
+            for ((partcol, chunk, materialId, deco), batch) in batches.items():
+                name = 'merged_{0}'.format(materialId)
+                if deco != '0':
+                    name = name + '_' + deco
+                if mergeMode != 'MATERIAL':
+                    name = name + '_' + str(chunk)
+                mesh = bpy.data.meshes.new(name)
+                batch.build(mesh)
+                mesh.materials.append(MATERIALCACHE.get(self.allMaterials.getMaterialRibyId(materialId), deco))
+                merged_obj = bpy.data.objects.new(name, mesh)
+                merged_obj.matrix_world = global_matrix
+                partcol.objects.link(merged_obj)
+            self.stats.add('mesh build', time.time() - start)
+            self.stats.count('merged meshes', len(batches))
+        
         useplane = True                
         if useplane == True: # write the floor plane in case True
             i = 0
             #out.write('''def Mesh "GroundPlane_1"'''.format(miny))
         
+        self.stats.add('export', time.time() - start_time)
         sys.stdout.write('%s\r' % ('                                                                                                 '))
         print("--- %s seconds ---" % (time.time() - start_time))
+        if printStats == True:
+            print(self.updateStats().summary())
         
             
 def setDBFolderVars(dbfolderlocation):
@@ -1340,6 +2644,15 @@ def FindDatabase():
             print('Your OS {0} is not supported yet.'.format(platform.system()))
             os._exit()
     
+def FindCacheDir():
+    lddcachedir = os.getenv('LDDCACHEDIR')
+    if lddcachedir is not None:
+        return str(lddcachedir)
+    elif os.name == 'nt':
+        return str(os.path.join(str(os.getenv('LOCALAPPDATA') or os.getenv('USERPROFILE')),'pylddlib','cache'))
+    else:
+        return str(os.path.join(str(os.getenv('XDG_CACHE_HOME') or os.path.join(str(os.getenv('HOME')),'.cache')),'pylddlib'))
+
 def progress(count, total, status='', suffix = ''):
     bar_len = 40
     filled_len = int(round(bar_len * count / float(total)))
@@ -1395,9 +2708,7 @@ def main():
 
 
 
-def convertldd_data(context, filepath, lddLIFPath, useLogoStuds, useLDDCamera):
-        
-    converter = Converter()
+def loadldd_database(converter, lddLIFPath):
     if os.path.isdir(lddLIFPath):
         print("Found DB folder. Will use this instead of db.lif!")
         setDBFolderVars(dbfolderlocation = lddLIFPath)
@@ -1406,13 +2717,65 @@ def convertldd_data(context, filepath, lddLIFPath, useLogoStuds, useLDDCamera):
     elif os.path.isfile(lddLIFPath):
         print("Found db.lif. Will use this.")
         converter.LoadDatabase(databaselocation = lddLIFPath)
-        
-    if (os.path.isdir(lddLIFPath) or os.path.isfile(lddLIFPath)):
-        converter.LoadScene(filename=filepath)
-        converter.Export(filename=filepath, useLogoStuds=useLogoStuds, useLDDCamera=useLDDCamera)  
     
     else:
         print("no LDD database found please install LEGO-Digital-Designer")
+        return False
+    return True
+
+def convertldd_data(context, filepath, lddLIFPath, useLogoStuds, useLDDCamera, useInstancing, useStudCulling=False, interiorMode='NONE', useWeld=False, useLOD=False, useFrustumCulling=False, frustumMargin=FRUSTUMMARGIN, mergeMode='NONE', mergeChunkSize=MERGECHUNKSIZE, useProxies=False, useReimport=False, printStats=False, stats=None):
+        
+    converter = Converter(stats=stats, weld=WELDTOLERANCE if useWeld == True else None)
+    if loadldd_database(converter, lddLIFPath):
+        converter.LoadScene(filename=filepath)
+        converter.Export(filename=filepath, useLogoStuds=useLogoStuds, useLDDCamera=useLDDCamera, useInstancing=useInstancing, useStudCulling=useStudCulling, interiorMode=interiorMode, useLOD=useLOD, useFrustumCulling=useFrustumCulling, frustumMargin=frustumMargin, mergeMode=mergeMode, mergeChunkSize=mergeChunkSize, useProxies=useProxies, useReimport=useReimport, printStats=printStats)
+
+    return {'FINISHED'}
+
+def proxyBrick(proxy):
+    # the brick of an LDD proxy object, read back from its custom properties
+    node = ElementTree.Element('Brick', refID=proxy['lddBrickRefID'], designID=proxy['lddDesignID'])
+    partnode = ElementTree.SubElement(node, 'Part', refID=proxy['lddRefID'], designID=proxy['lddDesignID'], materials=proxy['lddMaterials'])
+    if 'lddDecoration' in proxy:
+        partnode.set('decoration', proxy['lddDecoration'])
+    for (k, transformation) in enumerate(proxy['lddBones'].split(';')):
+        ElementTree.SubElement(partnode, 'Bone', refID=str(k), transformation=transformation)
+    brick = Brick(node=node)
+    if proxy['lddGroup'] >= 0:
+        brick.Parts[0].isGrouped = True
+        brick.Parts[0].GroupIDX = proxy['lddGroup']
+    return brick
+
+def proxyInView(scene, camera, proxy):
+    corners = [world_to_camera_view(scene, camera, proxy.matrix_world @ mathutils.Vector(corner)) for corner in proxy.bound_box]
+    if all(corner.z <= 0 for corner in corners):
+        return False
+    return min(c.x for c in corners) <= 1 and max(c.x for c in corners) >= 0 and min(c.y for c in corners) <= 1 and max(c.y for c in corners) >= 0
+
+def realizeldd_data(context, proxies, useGroups, useLogoStuds, useInstancing):
+    # proxies are realized per import collection, which knows the database it was read from
+    imports = {}
+    for proxy in proxies:
+        for col in proxy.users_collection:
+            if 'lddDatabase' in col:
+                imports.setdefault(col.name, (col, []))[1].append(proxy)
+
+    for (col, members) in imports.values():
+        if useGroups == True:
+            groups = set(proxy['lddGroup'] for proxy in members if proxy['lddGroup'] >= 0)
+            names = set(proxy.name for proxy in members)
+            members = [obj for obj in col.objects if 'lddProxy' in obj and (obj.name in names or obj['lddGroup'] in groups)]
+
+        converter = Converter()
+        if not loadldd_database(converter, col['lddDatabase']):
+            continue
+        scene = Scene(file='')
+        scene.Name = col.name
+        scene.Bricks = [proxyBrick(proxy) for proxy in members]
+        converter.scene = scene
+        converter.Export(filename=col.name, useLogoStuds=useLogoStuds, useLDDCamera=False, useInstancing=useInstancing, collection=col)
+        for proxy in members:
+            bpy.data.objects.remove(proxy, do_unlink=True)
 
     return {'FINISHED'}
 
@@ -1420,7 +2783,7 @@ def convertldd_data(context, filepath, lddLIFPath, useLogoStuds, useLDDCamera):
 # ImportHelper is a helper class, defines filename and
 # invoke() function which calls the file selector.
 from bpy_extras.io_utils import ImportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, FloatProperty, IntProperty
 from bpy.types import Operator
 
 class ImportLDDOps(Operator, ImportHelper):
@@ -1452,12 +2815,97 @@ class ImportLDDOps(Operator, ImportHelper):
         default=True,
     )
 
+    useStudCulling: BoolProperty(
+        name="Skip covered stud logos",
+        description="Leaves out the logo on studs that are inside the bounding box of another brick, like the studs under the brick above (transparent bricks do not cover studs)",
+        default=False,
+    )
+
     useLDDCamera: BoolProperty(
         name="Import camera(s)",
         description="Import camera(s) from LEGO Digital Designer",
         default=True,
     )
 
+    useInstancing: BoolProperty(
+        name="Share part meshes",
+        description="Bricks of the same part share one mesh and get their color through object materials (uses much less memory, editing one brick's mesh changes all of them)",
+        default=True,
+    )
+
+    useWeld: BoolProperty(
+        name="Weld vertices",
+        description="Merge duplicate vertices of the LDD geometry and share equal sub part meshes between different parts",
+        default=False,
+    )
+
+    useLOD: BoolProperty(
+        name="Level of detail",
+        description="Import bricks that look small from the LDD cameras with simplified geometry and without logos on studs",
+        default=False,
+    )
+
+    useFrustumCulling: BoolProperty(
+        name="Skip bricks out of view",
+        description="Leave out bricks that are outside of the view of the LDD camera (needs Import LDD camera)",
+        default=False,
+    )
+
+    frustumMargin: FloatProperty(
+        name="View margin",
+        description="Distance in LDD units a brick may lie outside of the camera view and still be imported",
+        default=FRUSTUMMARGIN,
+        min=0.0,
+    )
+
+    interiorMode: EnumProperty(
+        name="Enclosed bricks",
+        description="Bricks that are surrounded by other bricks on all sides cannot be seen",
+        items=(
+            ('NONE', "Import", "Import enclosed bricks like all others"),
+            ('HIDE', "Hide", "Put enclosed bricks into a collection that is hidden in viewport and render"),
+            ('SKIP', "Skip", "Leave enclosed bricks out"),
+        ),
+        default='NONE',
+    )
+
+    printStats: BoolProperty(
+        name="Print timings",
+        description="Print seconds and counters per import phase to the system console",
+        default=False,
+    )
+
+    useReimport: BoolProperty(
+        name="Update last import",
+        description="Update the collection of the last import of this file, only added, removed or changed bricks are built again (not with merged bricks or proxies)",
+        default=False,
+    )
+
+    useProxies: BoolProperty(
+        name="Proxies only",
+        description="Import a box per brick and build the bricks later with Object > Realize LDD proxies",
+        default=False,
+    )
+
+    mergeMode: EnumProperty(
+        name="Merge bricks",
+        description="Build one mesh per material instead of an object per brick for scenes that are not animated (flex parts stay separate, merged bricks get no logos on studs)",
+        items=(
+            ('NONE', "Off", "An object per brick and sub part"),
+            ('MATERIAL', "Per material", "One mesh per material for the whole scene"),
+            ('BRICKS', "Per material and chunk", "One mesh per material for every chunk of bricks"),
+            ('GROUP', "Per material and group", "One mesh per material for every LDD group"),
+        ),
+        default='NONE',
+    )
+
+    mergeChunkSize: IntProperty(
+        name="Bricks per chunk",
+        description="Number of bricks merged into the meshes of one chunk",
+        default=MERGECHUNKSIZE,
+        min=1,
+    )
+
     type: EnumProperty(
         name="Example Enum",
         description="Choose between two items",
@@ -1469,7 +2917,52 @@ class ImportLDDOps(Operator, ImportHelper):
     )
 
     def execute(self, context):
-        return convertldd_data(context, self.filepath, self.lddLIFPath, self.useLogoStuds, self.useLDDCamera)
+        return convertldd_data(context, self.filepath, self.lddLIFPath, self.useLogoStuds, self.useLDDCamera, self.useInstancing, self.useStudCulling, self.interiorMode, self.useWeld, self.useLOD, self.useFrustumCulling, self.frustumMargin, self.mergeMode, self.mergeChunkSize, self.useProxies, self.useReimport, self.printStats)
+
+
+class RealizeLDDOps(Operator):
+    """Replace LDD proxies with the bricks they stand for"""
+    bl_idname = "object.realizeldd"
+    bl_label = "Realize LDD proxies"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    realizeMode: EnumProperty(
+        name="Proxies",
+        description="Which proxies get their bricks",
+        items=(
+            ('SELECTED', "Selected", "Selected proxies"),
+            ('VIEW', "In view", "Proxies in the view of the scene camera"),
+        ),
+        default='SELECTED',
+    )
+
+    useGroups: BoolProperty(
+        name="Whole groups",
+        description="Realize all proxies of the LDD groups of the chosen proxies",
+        default=True,
+    )
+
+    useLogoStuds: BoolProperty(
+        name="Show 'LEGO' logo on studs",
+        description="Shows the LEGO logo on each stud (at the expense of some extra geometry and import time)",
+        default=True,
+    )
+
+    useInstancing: BoolProperty(
+        name="Share part meshes",
+        description="Bricks of the same part share one mesh and get their color through object materials (uses much less memory, editing one brick's mesh changes all of them)",
+        default=True,
+    )
+
+    def execute(self, context):
+        if self.realizeMode == 'VIEW':
+            if context.scene.camera is None:
+                self.report({'ERROR'}, "The scene has no camera")
+                return {'CANCELLED'}
+            proxies = [obj for obj in context.scene.objects if 'lddProxy' in obj and proxyInView(context.scene, context.scene.camera, obj)]
+        else:
+            proxies = [obj for obj in context.selected_objects if 'lddProxy' in obj]
+        return realizeldd_data(context, proxies, self.useGroups, self.useLogoStuds, self.useInstancing)
 
 
 # Only needed if you want to add into a dynamic menu
@@ -1477,14 +2970,22 @@ def menu_func_import(self, context):
     self.layout.operator(ImportLDDOps.bl_idname, text="LEGO Digital Designer (.lxf/.lxfml)")
 
 
+def menu_func_realize(self, context):
+    self.layout.operator(RealizeLDDOps.bl_idname, text="Realize LDD proxies")
+
+
 def register():
     bpy.utils.register_class(ImportLDDOps)
+    bpy.utils.register_class(RealizeLDDOps)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.VIEW3D_MT_object.append(menu_func_realize)
 
 
 def unregister():
     bpy.utils.unregister_class(ImportLDDOps)
+    bpy.utils.unregister_class(RealizeLDDOps)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.types.VIEW3D_MT_object.remove(menu_func_realize)
 
 
 if __name__ == "__main__":
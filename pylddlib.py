@@ -15,21 +15,59 @@
 import os
 import sys
 import math
+import mmap
+import json
+import hashlib
+import collections
 import struct
 import zipfile
+import threading
+import tracemalloc
+import cProfile
+import pstats
+import io
 from xml.dom import minidom
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor
 import time
-
-if sys.version_info < (3, 0):
-	reload(sys)
-	sys.setdefaultencoding('utf-8')
+import argparse
+import multiprocessing
+import tempfile
+import shutil
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+try:
+	import resource
+except ImportError:
+	resource = None
 
 PRIMITIVEPATH = '/Primitives/'
 GEOMETRIEPATH = PRIMITIVEPATH + 'LOD0/'
 DECORATIONPATH = '/Decorations/'
 MATERIALNAMESPATH = '/MaterialNames/'
 
+LIFINDEXSUFFIX = '.idx'
+LIFINDEXVERSION = 2
+# bytes of the db.lif header and of its directory block that go into the fingerprint, the rest is covered by size and mtime
+LIFFINGERPRINTSIZE = 65536
+GEOMETRYCACHEVERSION = 3
+# arrays of a GeometryReader that go into the .npz of the geometry cache, everything else is json
+GEOMETRYCACHEARRAYS = ('positions', 'normals', 'textures', 'faces', 'bones')
+OBJWRITEBUFFER = 1 << 20
+
 LOGOONSTUDSCONNTYPE = {"0:4", "0:4:1", "0:4:2", "0:4:33", "2:4:1", "2:4:34"}
+OCCLUSIONCELLSIZE = 1.6
+ENCLOSURESTEP = 0.4
+ENCLOSUREMARGIN = 0.1
+WELDTOLERANCE = 0.0001
+# cluster cell size per level of detail, levels without a Primitives/LOD<n>/ folder in the database are simplified from LOD0
+LODCLUSTERSIZE = (0, 0.06, 0.16, 0.4)
 
 class Matrix3D:
 	def __init__(self, n11=1,n12=0,n13=0,n14=0,n21=0,n22=1,n23=0,n24=0,n31=0,n32=0,n33=1,n34=0,n41=0,n42=0,n43=0,n44=1):
@@ -137,6 +175,34 @@ class Point3D:
 	def copy(self):
 		return Point3D(x=self.x,y=self.y,z=self.z)
 
+def transformArray(points, matrix, mask=None, translate=True):
+	# Same arithmetic as Point3D.transform / transformW, applied to an (N,3) array in double precision
+	if mask is None:
+		mask = slice(None)
+	out = numpy.array(points, dtype=numpy.float64)
+	src = numpy.asarray(points, dtype=numpy.float64)[mask]
+	x = src[:, 0]
+	y = src[:, 1]
+	z = src[:, 2]
+	if translate:
+		out[mask, 0] = matrix.n11 * x + matrix.n21 * y + matrix.n31 * z + matrix.n41
+		out[mask, 1] = matrix.n12 * x + matrix.n22 * y + matrix.n32 * z + matrix.n42
+		out[mask, 2] = matrix.n13 * x + matrix.n23 * y + matrix.n33 * z + matrix.n43
+	else:
+		out[mask, 0] = matrix.n11 * x + matrix.n21 * y + matrix.n31 * z
+		out[mask, 1] = matrix.n12 * x + matrix.n22 * y + matrix.n32 * z
+		out[mask, 2] = matrix.n13 * x + matrix.n23 * y + matrix.n33 * z
+	return out
+
+def formatRows(fmt, rows, chunk=65536):
+	# One % operation per block of rows instead of a format and write call per line, '%f' prints like '{:f}'
+	rows = numpy.asarray(rows)
+	out = []
+	for start in range(0, len(rows), chunk):
+		block = rows[start:start + chunk]
+		out.append((fmt * len(block)) % tuple(block.ravel().tolist()))
+	return ''.join(out)
+
 class Point2D:
 	def __init__(self, x=0,y=0):
 		self.x = x
@@ -163,12 +229,12 @@ class Face:
 
 class Group:
 	def __init__(self, node):
-		self.partRefs = node.getAttribute('partRefs').split(',')
+		self.partRefs = node.get('partRefs', '').split(',')
 		
 class Bone:
 	def __init__(self, node):
-		self.refID = node.getAttribute('refID')
-		(a, b, c, d, e, f, g, h, i, x, y, z) = map(float, node.getAttribute('transformation').split(','))
+		self.refID = node.get('refID', '')
+		(a, b, c, d, e, f, g, h, i, x, y, z) = map(float, node.get('transformation', '').split(','))
 		self.matrix = Matrix3D(n11=a,n12=b,n13=c,n14=0,n21=d,n22=e,n23=f,n24=0,n31=g,n32=h,n33=i,n34=0,n41=x,n42=y,n43=z,n44=1)
 
 class Part:
@@ -176,9 +242,9 @@ class Part:
 		self.isGrouped = False
 		self.GroupIDX = 0
 		self.Bones = []
-		self.refID = node.getAttribute('refID')
-		self.designID = node.getAttribute('designID')
-		self.materials = list(map(str, node.getAttribute('materials').split(',')))
+		self.refID = node.get('refID', '')
+		self.designID = node.get('designID', '')
+		self.materials = list(map(str, node.get('materials', '').split(',')))
 		
 		lastm = '0'
 		for i, m in enumerate(self.materials):
@@ -187,95 +253,126 @@ class Part:
 				self.materials[i] = self.materials[0] #in case of 0 choose the 'base' material
 			else:
 				lastm = m
-		if node.hasAttribute('decoration'):
-			self.decoration = list(map(str,node.getAttribute('decoration').split(',')))
-		for childnode in node.childNodes:
-			if childnode.nodeName == 'Bone':
+		if 'decoration' in node.attrib:
+			self.decoration = list(map(str,node.get('decoration').split(',')))
+		for childnode in node:
+			if childnode.tag == 'Bone':
 				self.Bones.append(Bone(node=childnode)) 
 
 class Brick:
 	def __init__(self, node):
-		self.refID = node.getAttribute('refID')
-		self.designID = node.getAttribute('designID')
+		self.refID = node.get('refID', '')
+		self.designID = node.get('designID', '')
 		self.Parts = []
-		for childnode in node.childNodes:
-			if childnode.nodeName == 'Part':
+		for childnode in node:
+			if childnode.tag == 'Part':
 				self.Parts.append(Part(node=childnode))
 
 class SceneCamera:
 	def __init__(self, node):
-		self.refID = node.getAttribute('refID')
-		(a, b, c, d, e, f, g, h, i, x, y, z) = map(float, node.getAttribute('transformation').split(','))
+		self.refID = node.get('refID', '')
+		(a, b, c, d, e, f, g, h, i, x, y, z) = map(float, node.get('transformation', '').split(','))
 		self.matrix = Matrix3D(n11=a,n12=b,n13=c,n14=0,n21=d,n22=e,n23=f,n24=0,n31=g,n32=h,n33=i,n34=0,n41=x,n42=y,n43=z,n44=1)
-		self.fieldOfView = float(node.getAttribute('fieldOfView'))
-		self.distance = float(node.getAttribute('distance'))
+		self.fieldOfView = float(node.get('fieldOfView', ''))
+		self.distance = float(node.get('distance', ''))
 
 class Scene:
 	def __init__(self, file):
 		self.Bricks = []
 		self.Scenecamera = []
 		self.Groups = []
+		self.cameraRef = ''
 
 		if file.endswith('.lxfml'):
-			with open(file, "rb") as file:
-				data = file.read()
+			with open(file, "rb") as source:
+				self.parse(source)
 		elif file.endswith('.lxf'):
-			zf = zipfile.ZipFile(file, 'r')
-			data = zf.read('IMAGE100.LXFML')
+			with zipfile.ZipFile(file, 'r') as zf:
+				with zf.open('IMAGE100.LXFML') as source:
+					self.parse(source)
 		else:
 			return
 
-		xml = minidom.parseString(data)
-		self.Name = xml.firstChild.getAttribute('name')
-				
-		for node in xml.firstChild.childNodes: 
-			if node.nodeName == 'Meta':
-				for childnode in node.childNodes:
-					if childnode.nodeName == 'BrickSet':
-						self.Version = str(childnode.getAttribute('version'))
-			elif node.nodeName == 'Cameras':
-				for childnode in node.childNodes:
-					if childnode.nodeName == 'Camera':
-						self.Scenecamera.append(SceneCamera(node=childnode))
-			elif node.nodeName == 'Bricks':
-				for childnode in node.childNodes:
-					if childnode.nodeName == 'Brick':
-						self.Bricks.append(Brick(node=childnode))
-			elif node.nodeName == 'GroupSystems':
-				for childnode in node.childNodes:
-					if childnode.nodeName == 'GroupSystem':
-						for childnode in childnode.childNodes:
-							if childnode.nodeName == 'Group':
-								self.Groups.append(Group(node=childnode))
-
-		for i in range(len(self.Groups)):
-			for brick in self.Bricks:
-				for part in brick.Parts:
-					if part.refID in self.Groups[i].partRefs:
-						part.isGrouped = True
-						part.GroupIDX = i
+		# a part belongs to the last group listing it
+		groupIndex = {}
+		for i, group in enumerate(self.Groups):
+			for refID in group.partRefs:
+				groupIndex[refID] = i
+
+		for brick in self.Bricks:
+			for part in brick.Parts:
+				if part.refID in groupIndex:
+					part.isGrouped = True
+					part.GroupIDX = groupIndex[part.refID]
 
 		print('Scene "'+ self.Name + '" Brickversion: ' + str(self.Version))
 
-class GeometryReader:
+	def parse(self, source):
+		# Streams the LXFML, every brick, camera and group is dropped from the tree once it has been read
+		path = []
+		for event, node in ElementTree.iterparse(source, events=('start', 'end')):
+			if event == 'start':
+				if len(path) == 0:
+					self.Name = node.get('name', '')
+				elif node.tag == 'Bricks':
+					self.cameraRef = node.get('cameraRef', '')
+				path.append(node)
+				continue
+
+			path.pop()
+			if len(path) == 0:
+				continue
+			parent = path[-1]
+
+			if node.tag == 'BrickSet' and parent.tag == 'Meta':
+				self.Version = str(node.get('version', ''))
+			elif node.tag == 'Camera' and parent.tag == 'Cameras':
+				self.Scenecamera.append(SceneCamera(node=node))
+			elif node.tag == 'Brick' and parent.tag == 'Bricks':
+				self.Bricks.append(Brick(node=node))
+			elif node.tag == 'Group' and parent.tag == 'GroupSystem':
+				self.Groups.append(Group(node=node))
+			else:
+				continue
+			parent.remove(node)
+
+class GeometryReader(object):
 	def __init__(self, data):
 		self.offset = 0
 		self.data = data
-		self.positions = []
-		self.normals = []
-		self.textures = []
-		self.faces = []
-		self.bonemap = {}
+		# decoded arrays, only filled when numpy is available
+		self.positionArray = None
+		self.normalArray = None
+		self.textureArray = None
+		self.faceArray = None
+		self.boneArray = None
+		# object views of the arrays, built on first access
+		self._positions = None
+		self._normals = None
+		self._textures = None
+		self._faces = None
+		self._bonemap = None
+		self._boneGroups = None
+		self._digest = None
 		self.texCount = 0
 		self.outpositions = []
 		self.outnormals = []
 
-		if self.readInt() == 1111961649:
+		if data is not None and self.readInt() == 1111961649:
 			self.valueCount = self.readInt()
 			self.indexCount = self.readInt()
 			self.faceCount = int(self.indexCount / 3)
 			options = self.readInt()
 
+			if numpy is not None:
+				self.readArrays(options)
+				return
+
+			self.positions = []
+			self.normals = []
+			self.textures = []
+			self.faces = []
+
 			for i in range(0, self.valueCount):
 				self.positions.append(Point3D(x=self.readFloat(),y= self.readFloat(),z=self.readFloat()))
 
@@ -305,18 +402,206 @@ class GeometryReader:
 				for i in range(0, self.valueCount):
 					boneoffset = self.readInt() + 4
 					self.bonemap[i] = self.read_Int(datastart + boneoffset)
-	
+
+	def readArrays(self, options):
+		self.positionArray = self.readArray('<f4', self.valueCount, 3)
+		self.normalArray = self.readArray('<f4', self.valueCount, 3)
+
+		if (options & 3) == 3:
+			self.texCount = self.valueCount
+			self.textureArray = self.readArray('<f4', self.valueCount, 2)
+
+		self.faceArray = self.readArray('<i4', self.faceCount, 3)
+
+		if (options & 48) == 48:
+			num = self.readInt()
+			self.offset += (num * 4) + (self.indexCount * 4)
+			num = self.readInt()
+			self.offset += (3 * num * 4) + (self.indexCount * 4)
+
+		bonelength = self.readInt()
+		self.boneArray = numpy.zeros(self.valueCount, dtype=numpy.int32)
+
+		if (bonelength > self.valueCount) or (bonelength > self.faceCount):
+			datastart = self.offset
+			self.offset += bonelength
+			# every vertex points to a bone record, the bone index is stored 4 bytes into it
+			boneoffsets = self.readArray('<i4', self.valueCount) + (datastart + 4)
+			raw = numpy.frombuffer(self.data, dtype=numpy.uint8)
+			self.boneArray = raw[boneoffsets[:, None] + numpy.arange(4)].view('<i4').ravel().astype(numpy.int32)
+
+	def compile(self):
+		return {'valueCount': self.valueCount, 'indexCount': self.indexCount, 'texCount': self.texCount, 'positions': self.positionArray, 'normals': self.normalArray, 'textures': self.textureArray, 'faces': self.faceArray, 'bones': self.boneArray}
+
+	def restore(self, compiled):
+		self.valueCount = compiled['valueCount']
+		self.indexCount = compiled['indexCount']
+		self.faceCount = int(self.indexCount / 3)
+		self.texCount = compiled['texCount']
+		self.positionArray = compiled['positions']
+		self.normalArray = compiled['normals']
+		self.textureArray = compiled['textures']
+		self.faceArray = compiled['faces']
+		self.boneArray = compiled['bones']
+
+	def weld(self, tolerance):
+		# Merges vertices whose position, normal, uv and bone agree within tolerance and drops the faces that collapse
+		if self.positionArray is None or self.valueCount == 0:
+			return 0
+		if self.faceArray.size > 0 and (self.faceArray.min() < 0 or self.faceArray.max() >= self.valueCount):
+			return 0
+		columns = [self.positionArray, self.normalArray]
+		if self.textureArray is not None:
+			columns.append(self.textureArray)
+		keys = numpy.column_stack((numpy.round(numpy.hstack(columns) / tolerance).astype(numpy.int64), self.boneArray))
+		unique, first, inverse = numpy.unique(keys, axis=0, return_index=True, return_inverse=True)
+		if len(first) == self.valueCount:
+			return 0
+
+		# the kept vertices stay in the order they first appear in
+		order = numpy.argsort(first)
+		remap = numpy.empty(len(first), dtype=numpy.int32)
+		remap[order] = numpy.arange(len(first), dtype=numpy.int32)
+		keep = first[order]
+		removed = self.valueCount - len(keep)
+		self.setArrays(self.positionArray[keep], self.normalArray[keep], self.textureArray[keep] if self.textureArray is not None else None, self.boneArray[keep], remap[inverse.reshape(-1)][self.faceArray])
+		return removed
+
+	def simplify(self, cellsize):
+		# Vertex clustering, the vertices of one bone inside one cell of cellsize become a single vertex
+		if self.positionArray is None or self.valueCount == 0:
+			return 0
+		if self.faceArray.size > 0 and (self.faceArray.min() < 0 or self.faceArray.max() >= self.valueCount):
+			return 0
+		cells = numpy.column_stack((numpy.floor(self.positionArray / cellsize).astype(numpy.int64), self.boneArray))
+		unique, first, inverse = numpy.unique(cells, axis=0, return_index=True, return_inverse=True)
+		inverse = inverse.reshape(-1)
+
+		counts = numpy.bincount(inverse, minlength=len(first)).astype(numpy.float64)
+		positions = numpy.zeros((len(first), 3))
+		numpy.add.at(positions, inverse, self.positionArray)
+		positions /= counts[:, None]
+		normals = numpy.zeros((len(first), 3))
+		numpy.add.at(normals, inverse, self.normalArray)
+		lengths = numpy.linalg.norm(normals, axis=1)
+		lengths[lengths == 0] = 1
+		normals /= lengths[:, None]
+		textures = self.textureArray[first] if self.textureArray is not None else None
+
+		faces = inverse[self.faceArray]
+		faceCount = self.faceCount
+		self.setArrays(positions.astype(self.positionArray.dtype), normals.astype(self.normalArray.dtype), textures, self.boneArray[first], faces)
+		# faces that now use the same three vertices are kept once
+		unique, first = numpy.unique(numpy.sort(self.faceArray, axis=1), axis=0, return_index=True)
+		self.setArrays(self.positionArray, self.normalArray, self.textureArray, self.boneArray, self.faceArray[numpy.sort(first)])
+		return faceCount - self.faceCount
+
+	def setArrays(self, positions, normals, textures, bones, faces):
+		# faces that collapsed to a line or a point are dropped, everything derived from the old arrays is reset
+		faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])].astype(numpy.int32)
+		self.positionArray = positions
+		self.normalArray = normals
+		self.textureArray = textures
+		self.boneArray = bones
+		self.faceArray = faces
+		self.valueCount = len(positions)
+		self.texCount = len(positions) if textures is not None else 0
+		self.faceCount = len(faces)
+		self.indexCount = self.faceCount * 3
+		self._boneGroups = None
+		self._digest = None
+
+	def digest(self):
+		# identifies the decoded arrays, equal sub parts of different designIDs have the same digest
+		if self._digest is None and self.positionArray is not None:
+			sha = hashlib.sha1()
+			for (array, dtype) in ((self.positionArray, '<f4'), (self.normalArray, '<f4'), (self.textureArray, '<f4'), (self.faceArray, '<i4'), (self.boneArray, '<i4')):
+				if array is not None:
+					sha.update(numpy.ascontiguousarray(array, dtype=dtype).tobytes())
+				sha.update(b'|')
+			self._digest = sha.hexdigest()
+		return self._digest
+
+	def readArray(self, dtype, count, width=1):
+		ret = numpy.frombuffer(self.data, dtype=dtype, count=count * width, offset=self.offset)
+		self.offset += count * width * 4
+		if width > 1:
+			ret = ret.reshape(count, width)
+		return ret
+
+	@property
+	def positions(self):
+		if self._positions is None:
+			self._positions = [Point3D(x=x, y=y, z=z) for (x, y, z) in self.positionArray.tolist()] if self.positionArray is not None else []
+		return self._positions
+
+	@positions.setter
+	def positions(self, value):
+		self._positions = value
+
+	@property
+	def normals(self):
+		if self._normals is None:
+			self._normals = [Point3D(x=x, y=y, z=z) for (x, y, z) in self.normalArray.tolist()] if self.normalArray is not None else []
+		return self._normals
+
+	@normals.setter
+	def normals(self, value):
+		self._normals = value
+
+	@property
+	def textures(self):
+		if self._textures is None:
+			self._textures = [Point2D(x=x, y=y) for (x, y) in self.textureArray.tolist()] if self.textureArray is not None else []
+		return self._textures
+
+	@textures.setter
+	def textures(self, value):
+		self._textures = value
+
+	@property
+	def faces(self):
+		if self._faces is None:
+			self._faces = [Face(a=a, b=b, c=c) for (a, b, c) in self.faceArray.tolist()] if self.faceArray is not None else []
+		return self._faces
+
+	@faces.setter
+	def faces(self, value):
+		self._faces = value
+
+	@property
+	def bonemap(self):
+		if self._bonemap is None:
+			self._bonemap = self.boneArray.tolist() if self.boneArray is not None else {}
+		return self._bonemap
+
+	@bonemap.setter
+	def bonemap(self, value):
+		self._bonemap = value
+
+	def boneGroups(self):
+		# (bone index, vertex indices) pairs, grouped once per geometry
+		if self._boneGroups is None:
+			order = numpy.argsort(self.boneArray, kind='stable')
+			bones, starts = numpy.unique(self.boneArray[order], return_index=True)
+			self._boneGroups = list(zip(bones.tolist(), numpy.split(order, starts[1:])))
+		return self._boneGroups
+
+	def skin(self, matrices):
+		# Moves the vertices of every bone with that bone's matrix, one array operation per bone
+		positions = numpy.array(self.positionArray, dtype=numpy.float64)
+		normals = numpy.array(self.normalArray, dtype=numpy.float64)
+		for bone, indices in self.boneGroups():
+			if 0 <= bone < len(matrices):
+				positions[indices] = transformArray(positions[indices], matrices[bone])
+				normals[indices] = transformArray(normals[indices], matrices[bone], translate=False)
+		return positions, normals
+
 	def read_Int(self,_offset):
-		if sys.version_info < (3, 0):
-			return int(struct.unpack_from('i', self.data, _offset)[0])
-		else:
-			return int.from_bytes(self.data[_offset:_offset + 4], byteorder='little')
+		return int.from_bytes(self.data[_offset:_offset + 4], byteorder='little')
 
 	def readInt(self):
-		if sys.version_info < (3, 0):
-			ret = int(struct.unpack_from('i', self.data, self.offset)[0])
-		else:
-			ret = int.from_bytes(self.data[self.offset:self.offset + 4], byteorder='little')
+		ret = int.from_bytes(self.data[self.offset:self.offset + 4], byteorder='little')
 		self.offset += 4
 		return ret
 
@@ -326,25 +611,48 @@ class GeometryReader:
 		return ret
 
 class Geometry:
-	def __init__(self, designID, database):
+	def __init__(self, designID, database, compiled=None, lod=0):
 		self.designID = designID
+		self.lod = lod
 		self.Parts = {}
 		
 		self.studsFields2D = []
+		self.CollisionBoxes = []
+		# every database file that was looked at, a cached copy is only used while none of them changed
+		self.sources = []
 		
-		GeometryLocation = '{0}{1}{2}'.format(GEOMETRIEPATH, designID,'.g')
+		if compiled is not None:
+			self.restore(compiled)
+			return
+
+		geometrypath = GEOMETRIEPATH
+		if lod > 0:
+			self.sources.append('{0}LOD{1}/{2}.g'.format(PRIMITIVEPATH, lod, designID))
+			if self.sources[-1] in database.filelist:
+				geometrypath = '{0}LOD{1}/'.format(PRIMITIVEPATH, lod)
+
+		GeometryLocation = '{0}{1}{2}'.format(geometrypath, designID,'.g')
 		GeometryCount = 0
+		self.sources.append(GeometryLocation)
 		while str(GeometryLocation) in database.filelist:
 			self.Parts[GeometryCount] = GeometryReader(data=database.filelist[GeometryLocation].read())
 			GeometryCount += 1
-			GeometryLocation = '{0}{1}{2}{3}'.format(GEOMETRIEPATH, designID,'.g',GeometryCount)
+			GeometryLocation = '{0}{1}{2}{3}'.format(geometrypath, designID,'.g',GeometryCount)
+			self.sources.append(GeometryLocation)
 
-		primitive = Primitive(data = database.filelist[PRIMITIVEPATH + designID + '.xml'].read())
+		self.sources.append(PRIMITIVEPATH + designID + '.xml')
+		primitive = Primitive(data = database.filelist[self.sources[-1]].read())
 		self.Partname = primitive.Designname
 		self.studsFields2D = primitive.Fields2D
+		self.CollisionBoxes = primitive.CollisionBoxes
+		self.Bounding = primitive.Bounding
 		
 		# preflex
 		for part in self.Parts:
+			if self.Parts[part].positionArray is not None:
+				if len(primitive.Bones) > 0:
+					self.Parts[part].positionArray, self.Parts[part].normalArray = self.Parts[part].skin([b.matrix for b in primitive.Bones])
+				continue
 			# transform
 			for i, b in enumerate(primitive.Bones):
 				# positions
@@ -356,6 +664,42 @@ class Geometry:
 					if (self.Parts[part].bonemap[k] == i):
 						self.Parts[part].normals[k].transformW(b.matrix)
 
+		if lod > 0 and geometrypath == GEOMETRIEPATH:
+			self.simplify(LODCLUSTERSIZE[lod])
+
+	def compile(self):
+		fields = [(f.type, len(f.custom2DField[0]) - 1, len(f.custom2DField) - 1, f.field2DRawData, [f.matrix.n11, f.matrix.n12, f.matrix.n13, f.matrix.n14, f.matrix.n21, f.matrix.n22, f.matrix.n23, f.matrix.n24, f.matrix.n31, f.matrix.n32, f.matrix.n33, f.matrix.n34, f.matrix.n41, f.matrix.n42, f.matrix.n43, f.matrix.n44]) for f in self.studsFields2D]
+		boxes = [(b.corner.x, b.corner.y, b.corner.z, [b.matrix.n11, b.matrix.n12, b.matrix.n13, b.matrix.n14, b.matrix.n21, b.matrix.n22, b.matrix.n23, b.matrix.n24, b.matrix.n31, b.matrix.n32, b.matrix.n33, b.matrix.n34, b.matrix.n41, b.matrix.n42, b.matrix.n43, b.matrix.n44]) for b in self.CollisionBoxes]
+		return {'version': GEOMETRYCACHEVERSION, 'sources': self.sources, 'designID': self.designID, 'Partname': self.Partname, 'Bounding': self.Bounding, 'studsFields2D': fields, 'CollisionBoxes': boxes, 'Parts': [self.Parts[part].compile() for part in sorted(self.Parts)]}
+
+	def restore(self, compiled):
+		self.sources = compiled['sources']
+		self.Partname = compiled['Partname']
+		self.Bounding = compiled['Bounding']
+		for (sX, sY, sZ, matrix) in compiled['CollisionBoxes']:
+			box = CollisionBox(sX=sX, sY=sY, sZ=sZ)
+			box.matrix = Matrix3D(*matrix)
+			self.CollisionBoxes.append(box)
+		for (type, width, height, field2DRawData, matrix) in compiled['studsFields2D']:
+			field = Field2D(type=type, width=width, height=height, field2DRawData=field2DRawData)
+			field.matrix = Matrix3D(*matrix)
+			self.studsFields2D.append(field)
+		for i, part in enumerate(compiled['Parts']):
+			self.Parts[i] = GeometryReader(data=None)
+			self.Parts[i].restore(part)
+
+	def simplify(self, cellsize):
+		removed = 0
+		for part in self.Parts:
+			removed += self.Parts[part].simplify(cellsize)
+		return removed
+
+	def weld(self, tolerance=WELDTOLERANCE):
+		removed = 0
+		for part in self.Parts:
+			removed += self.Parts[part].weld(tolerance)
+		return removed
+
 	def valuecount(self):
 		count = 0
 		for part in self.Parts:
@@ -374,6 +718,202 @@ class Geometry:
 			count += self.Parts[part].texCount
 		return count
 
+class LRUCache(object):
+	# dict that drops the least recently used entry beyond maxsize entries, maxsize None keeps everything
+	def __init__(self, maxsize=None):
+		self.maxsize = maxsize
+		self.entries = collections.OrderedDict()
+
+	def __contains__(self, key):
+		return key in self.entries
+
+	def __getitem__(self, key):
+		value = self.entries.pop(key)
+		self.entries[key] = value
+		return value
+
+	def __setitem__(self, key, value):
+		self.entries.pop(key, None)
+		self.entries[key] = value
+		if self.maxsize is not None:
+			while len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+
+	def __len__(self):
+		return len(self.entries)
+
+class ConverterStats(object):
+	# Seconds and counters per conversion phase, callback(stats, phase, seconds) runs after every timed phase
+	def __init__(self, callback=None):
+		self.callback = callback
+		self.lock = threading.Lock()
+		self.phases = collections.OrderedDict()
+		self.calls = collections.OrderedDict()
+		self.counters = collections.OrderedDict()
+		# decode seconds per designID, geometry loaded from the cache directory does not show up here
+		self.designs = {}
+		self.peakMemory = 0
+
+	def add(self, phase, seconds, designID=None):
+		with self.lock:
+			self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+			self.calls[phase] = self.calls.get(phase, 0) + 1
+			if designID is not None:
+				self.designs[designID] = self.designs.get(designID, 0.0) + seconds
+		if self.callback is not None:
+			self.callback(self, phase, seconds)
+
+	def count(self, counter, value=1):
+		with self.lock:
+			self.counters[counter] = self.counters.get(counter, 0) + value
+
+	def set(self, counter, value):
+		with self.lock:
+			self.counters[counter] = value
+
+	def measureMemory(self):
+		# traced peak while tracemalloc runs (--profile), otherwise the peak resident size of the process
+		if tracemalloc.is_tracing():
+			peak = tracemalloc.get_traced_memory()[1]
+		elif resource is not None:
+			peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+		else:
+			return self.peakMemory
+		self.peakMemory = max(self.peakMemory, peak)
+		return self.peakMemory
+
+	def report(self):
+		with self.lock:
+			return {
+				'phases': collections.OrderedDict((phase, {'seconds': round(seconds, 6), 'calls': self.calls[phase]}) for (phase, seconds) in self.phases.items()),
+				'counters': collections.OrderedDict(self.counters),
+				'designs': dict((designID, round(seconds, 6)) for (designID, seconds) in self.designs.items()),
+				'peakMemory': self.peakMemory
+			}
+
+	def summary(self, slowest=10):
+		lines = ['{0:<24} {1:>10} {2:>8}'.format('phase', 'seconds', 'calls')]
+		for (phase, seconds) in self.phases.items():
+			lines.append('{0:<24} {1:>10.3f} {2:>8}'.format(phase, seconds, self.calls[phase]))
+		for (counter, value) in self.counters.items():
+			lines.append('{0:<24} {1:>10}'.format(counter, value))
+		if self.peakMemory > 0:
+			lines.append('{0:<24} {1:>10.1f} MB'.format('peak memory', self.peakMemory / 1048576.0))
+		for (designID, seconds) in sorted(self.designs.items(), key=lambda item: -item[1])[:slowest]:
+			lines.append('{0:<24} {1:>10.3f}'.format('decode ' + designID, seconds))
+		return '\n'.join(lines)
+
+class GeometryCache:
+	# Compiled (pre-flexed) geometry per designID on disk, one directory per database version and state
+	def __init__(self, database, maxsize=None, stats=None, weld=None):
+		self.location = None
+		self.pending = {}
+		self.executor = None
+		self.stats = stats if stats is not None else ConverterStats()
+		# welding tolerance, None keeps the vertices as they are stored in the .g files
+		self.weld = weld
+		# decoded geometry stays in memory for every later export with the same converter
+		self.warm = LRUCache(maxsize=maxsize)
+		if numpy is None or database.dbinfo is None:
+			return
+		dbstate = hashlib.sha1(database.fingerprint.encode('utf-8')).hexdigest()[:16]
+		self.location = os.path.join(FindCacheDir(), '{0}_{1}'.format(database.dbinfo.Version, dbstate))
+		if weld is not None:
+			self.location += '_weld{0:g}'.format(weld)
+
+	def prefetch(self, designIDs, database, workers=None):
+		# Decodes every designID in background threads, get() then hands out the finished geometry
+		self.shutdown()
+		self.executor = ThreadPoolExecutor(max_workers=workers)
+		task = lambda designID: self.build(designID=designID, database=database)
+
+		for designID in designIDs:
+			if designID not in self.pending and designID not in self.warm:
+				self.pending[designID] = self.executor.submit(task, designID)
+		if len(self.pending) == 0:
+			self.shutdown()
+
+	def shutdown(self):
+		if self.executor is not None:
+			for future in self.pending.values():
+				future.cancel()
+			self.executor.shutdown(wait=False)
+		self.executor = None
+		self.pending = {}
+
+	def get(self, designID, database, lod=0):
+		key = geometryKey(designID, lod)
+		if key in self.warm:
+			self.stats.count('geometry memory hits')
+			return self.warm[key]
+		if lod == 0 and designID in self.pending:
+			start = time.time()
+			result = self.pending.pop(designID).result()
+			self.stats.add('geometry wait', time.time() - start)
+			if len(self.pending) == 0:
+				self.shutdown()
+		else:
+			result = self.build(designID=designID, database=database, lod=lod)
+		self.warm[key] = result
+		return result
+
+	def build(self, designID, database, lod=0):
+		if self.location is not None:
+			compiled = self.load(geometryKey(designID, lod), database)
+			if compiled is not None:
+				self.stats.count('geometry disk hits')
+				return Geometry(designID=designID, database=database, compiled=compiled, lod=lod)
+		start = time.time()
+		geo = Geometry(designID=designID, database=database, lod=lod)
+		if self.weld is not None and numpy is not None:
+			self.stats.count('vertices welded', geo.weld(self.weld))
+		self.stats.add('geometry decode', time.time() - start, designID=geometryKey(designID, lod))
+		if self.location is not None:
+			self.save(geo, database)
+		return geo
+
+	def load(self, key, database):
+		# arrays of an .npz and json for the rest, nothing in the cache directory is unpickled
+		try:
+			with numpy.load(os.path.join(self.location, key + '.npz'), allow_pickle=False) as data:
+				compiled = json.loads(bytes(data['meta']).decode('utf-8'))
+				if compiled.get('version') != GEOMETRYCACHEVERSION:
+					return None
+				for (i, part) in enumerate(compiled['Parts']):
+					for name in GEOMETRYCACHEARRAYS:
+						part[name] = data['{0}_{1}'.format(i, name)] if '{0}_{1}'.format(i, name) in data.files else None
+		except Exception as e:
+			return None
+		if [database.filelist.stamp(name) for name in compiled['sources']] != compiled['stamps']:
+			return None
+		return compiled
+
+	def save(self, geo, database):
+		filename = os.path.join(self.location, geometryKey(geo.designID, geo.lod) + '.npz')
+		tmpname = '{0}.{1}'.format(filename, os.getpid())
+		compiled = geo.compile()
+		compiled['stamps'] = [database.filelist.stamp(name) for name in geo.sources]
+		arrays = {}
+		for (i, part) in enumerate(compiled['Parts']):
+			for name in GEOMETRYCACHEARRAYS:
+				if part[name] is not None:
+					arrays['{0}_{1}'.format(i, name)] = part[name]
+				del part[name]
+		try:
+			arrays['meta'] = numpy.frombuffer(json.dumps(compiled).encode('utf-8'), dtype=numpy.uint8)
+			if not os.path.isdir(self.location):
+				os.makedirs(self.location)
+			with open(tmpname, 'wb') as f:
+				numpy.savez(f, **arrays)
+			os.replace(tmpname, filename)
+		except Exception as e:
+			print('Could not write geometry cache {0}: {1}'.format(filename, e))
+			if os.path.exists(tmpname):
+				os.remove(tmpname)
+
+def geometryKey(designID, lod=0):
+	return designID if lod == 0 else '{0}.lod{1}'.format(designID, lod)
+
 class Bone2:
 	def __init__(self,boneId=0, angle=0, ax=0, ay=0, az=0, tx=0, ty=0, tz=0):
 		self.boneId = boneId
@@ -420,11 +960,38 @@ class Field2D:
 	def __str__(self):
 		return '[type="{0}" transform="{1}" custom2DField="{2}"]'.format(self.type, self.matrix, self.custom2DField)
 
+class CollisionBox:
+	def __init__(self, sX=0, sY=0, sZ=0, angle=0, ax=0, ay=0, az=0, tx=0, ty=0, tz=0):
+		rotationMatrix = Matrix3D()
+		rotationMatrix.rotate(angle = -angle * math.pi / 180.0, axis = Point3D(x=ax,y=ay,z=az))
+		p = Point3D(x=tx,y=ty,z=tz)
+		p.transformW(rotationMatrix)
+		rotationMatrix.n41 -= p.x
+		rotationMatrix.n42 -= p.y
+		rotationMatrix.n43 -= p.z
+		
+		self.matrix = rotationMatrix
+		self.corner = Point3D(x=sX,y=sY,z=sZ)
+		self.positions = []
+		
+		self.positions.append(Point3D(x=0, y=0, z=0))
+		self.positions.append(Point3D(x=sX, y=0, z=0))
+		self.positions.append(Point3D(x=0, y=sY, z=0))
+		self.positions.append(Point3D(x=sX, y=sY, z=0))
+		self.positions.append(Point3D(x=0, y=0, z=sZ))
+		self.positions.append(Point3D(x=0, y=sY, z=sZ))
+		self.positions.append(Point3D(x=sX ,y=0, z=sZ))
+		self.positions.append(Point3D(x=sX ,y=sY, z=sZ))
+	
+	def __str__(self):
+		return '[0,0,0] [{0},0,0] [0,{1},0] [{0},{1},0] [0,0,{2}] [0,{1},{2}] [{0},0,{2}] [{0},{1},{2}]'.format(self.corner.x, self.corner.y, self.corner.z)
+
 class Primitive:
 	def __init__(self, data):
 		self.Designname = ''
 		self.Bones = []
 		self.Fields2D = []
+		self.CollisionBoxes = []
 		self.PhysicsAttributes = {}
 		self.Bounding = {}
 		self.GeometryBounding = {}
@@ -438,29 +1005,20 @@ class Primitive:
 				for childnode in node.childNodes:
 					if childnode.nodeName == 'Annotation' and childnode.hasAttribute('designname'):
 						self.Designname = childnode.getAttribute('designname')
+			elif node.nodeName == 'Collision':
+				for childnode in node.childNodes:
+					if childnode.nodeName == 'Box':
+						self.CollisionBoxes.append(CollisionBox(sX=float(childnode.getAttribute('sX')), sY=float(childnode.getAttribute('sY')), sZ=float(childnode.getAttribute('sZ')), angle=float(childnode.getAttribute('angle')), ax=float(childnode.getAttribute('ax')), ay=float(childnode.getAttribute('ay')), az=float(childnode.getAttribute('az')), tx=float(childnode.getAttribute('tx')), ty=float(childnode.getAttribute('ty')), tz=float(childnode.getAttribute('tz'))))
 			elif node.nodeName == 'PhysicsAttributes':
-				self.PhysicsAttributes = {"inertiaTensor": node.getAttribute('inertiaTensor')}
-				self.PhysicsAttributes = {"centerOfMass": node.getAttribute('centerOfMass')}
-				self.PhysicsAttributes = {"mass": node.getAttribute('mass')}
-				self.PhysicsAttributes = {"frictionType": node.getAttribute('frictionType')}				
+				self.PhysicsAttributes = {"inertiaTensor": node.getAttribute('inertiaTensor'),"centerOfMass": node.getAttribute('centerOfMass'),"mass": node.getAttribute('mass'),"frictionType": node.getAttribute('frictionType')}
 			elif node.nodeName == 'Bounding':
 				for childnode in node.childNodes:
 					if childnode.nodeName == 'AABB':
-						self.Bounding = {"minX": childnode.getAttribute('minX')}
-						self.Bounding = {"minY": childnode.getAttribute('minY')}
-						self.Bounding = {"minZ": childnode.getAttribute('minZ')}
-						self.Bounding = {"maxX": childnode.getAttribute('maxX')}
-						self.Bounding = {"maxY": childnode.getAttribute('maxY')}
-						self.Bounding = {"maxZ": childnode.getAttribute('maxZ')}
+						self.Bounding = {"minX": childnode.getAttribute('minX'), "minY": childnode.getAttribute('minY'), "minZ": childnode.getAttribute('minZ'), "maxX": childnode.getAttribute('maxX'), "maxY": childnode.getAttribute('maxY'), "maxZ": childnode.getAttribute('maxZ')}
 			elif node.nodeName == 'GeometryBounding':
 				for childnode in node.childNodes:
 					if childnode.nodeName == 'AABB':
-						self.GeometryBounding = {"minX": childnode.getAttribute('minX')}
-						self.GeometryBounding = {"minY": childnode.getAttribute('minY')}
-						self.GeometryBounding = {"minZ": childnode.getAttribute('minZ')}
-						self.GeometryBounding = {"maxX": childnode.getAttribute('maxX')}
-						self.GeometryBounding = {"maxY": childnode.getAttribute('maxY')}
-						self.GeometryBounding = {"maxZ": childnode.getAttribute('maxZ')}
+						self.GeometryBounding = {"minX": childnode.getAttribute('minX'), "minY": childnode.getAttribute('minY'), "minZ": childnode.getAttribute('minZ'), "maxX": childnode.getAttribute('maxX'), "maxY": childnode.getAttribute('maxY'), "maxZ": childnode.getAttribute('maxZ')}
 			elif node.nodeName == 'Connectivity':
 				for childnode in node.childNodes:
 					if childnode.nodeName == 'Custom2DField':
@@ -471,37 +1029,21 @@ class LOCReader:
 		self.offset = 0
 		self.values = {}
 		self.data = data
-		if sys.version_info < (3, 0):
-			if ord(self.data[0]) == 50 and ord(self.data[1]) == 0:
-				self.offset += 2
-				while self.offset < len(self.data):
-					key = self.NextString().replace('Material', '')
-					value = self.NextString()
-					self.values[key] = value
-		else:
-			if int(self.data[0]) == 50 and int(self.data[1]) == 0:
-				self.offset += 2
-				while self.offset < len(self.data):
-					key = self.NextString().replace('Material', '')
-					value = self.NextString()
-					self.values[key] = value
+		if int(self.data[0]) == 50 and int(self.data[1]) == 0:
+			self.offset += 2
+			while self.offset < len(self.data):
+				key = self.NextString().replace('Material', '')
+				value = self.NextString()
+				self.values[key] = value
 
 	def NextString(self):
 		out = ''
-		if sys.version_info < (3, 0):
-			t = ord(self.data[self.offset])
-			self.offset += 1
-			while not t == 0:
-				out = '{0}{1}'.format(out,chr(t))
-				t = ord(self.data[self.offset])
-				self.offset += 1
-		else:
+		t = int(self.data[self.offset])
+		self.offset += 1
+		while not t == 0:
+			out = '{0}{1}'.format(out,chr(t))
 			t = int(self.data[self.offset])
 			self.offset += 1
-			while not t == 0:
-				out = '{0}{1}'.format(out,chr(t))
-				t = int(self.data[self.offset])
-				self.offset += 1
 		return out
 
 class Materials:
@@ -562,29 +1104,94 @@ class DBinfo:
 			print('DB Version: ' + str(self.Version))
 
 class DBFolderFile:
-	def __init__(self, name, handle):
+	def __init__(self, name, handle, filelist=None):
 		self.handle = handle
 		self.name = name
+		self.filelist = filelist
 
 	def read(self):
 		reader = open(self.handle, "rb")
 		try:
 			filecontent = reader.read()
 			reader.close()
+			if self.filelist is not None:
+				self.filelist.addBytesRead(len(filecontent))
 			return filecontent
 		finally:
 			reader.close()
 		
+class DBFolderFileList:
+	# Resolves entries on demand instead of walking the whole db folder up front
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.bytesread = 0
+
+	def addBytesRead(self, count):
+		with self.lock:
+			self.bytesread += count
+
+	def __contains__(self, name):
+		return os.path.isfile(name)
+
+	def __getitem__(self, name):
+		if not os.path.isfile(name):
+			raise KeyError(name)
+		return DBFolderFile(name=name, handle=name, filelist=self)
+
+	def stamp(self, name):
+		# changes when the file is edited in place, None for a missing file
+		try:
+			stat = os.stat(name)
+		except OSError as e:
+			return None
+		return '{0}-{1}'.format(stat.st_size, stat.st_mtime_ns)
+
 class LIFFile:
-	def __init__(self, name, offset, size, handle):
+	def __init__(self, name, offset, size, handle, filelist=None):
 		self.handle = handle
 		self.name = name
 		self.offset = offset
 		self.size = size
+		self.filelist = filelist
 
 	def read(self):
-		self.handle.seek(self.offset, 0)
-		return self.handle.read(self.size)
+		if self.filelist is not None:
+			self.filelist.addBytesRead(self.size)
+		return self.handle[self.offset:self.offset + self.size]
+
+class LIFFileList:
+	# name -> (offset, size) table of a db.lif, LIFFile objects are created on access
+	def __init__(self, handle, entries):
+		self.handle = handle
+		self.entries = entries
+		self.lock = threading.Lock()
+		self.bytesread = 0
+
+	def addBytesRead(self, count):
+		with self.lock:
+			self.bytesread += count
+
+	def __contains__(self, name):
+		return name in self.entries
+
+	def __getitem__(self, name):
+		(offset, size) = self.entries[name]
+		return LIFFile(name=name, offset=offset, size=size, handle=self.handle, filelist=self)
+
+	def stamp(self, name):
+		# the fingerprint of the whole db.lif covers the content, the entry tells files apart
+		if name not in self.entries:
+			return None
+		return '{0}-{1}'.format(*self.entries[name])
+
+	def __iter__(self):
+		return iter(self.entries)
+
+	def keys(self):
+		return self.entries.keys()
+
+	def __len__(self):
+		return len(self.entries)
 
 class DBFolderReader:
 	def __init__(self, folder):
@@ -603,6 +1210,7 @@ class DBFolderReader:
 			self.parse()
 			if self.fileexist(os.path.join(self.location,'Materials.xml')) and self.fileexist(os.path.join(self.location, 'info.xml')) and self.fileexist(os.path.join(self.location, MATERIALNAMESPATH, 'EN/localizedStrings.loc')):
 				self.dbinfo = DBinfo(data=self.filelist[os.path.join(self.location,'info.xml')].read())
+				self.readFingerprint()
 				print("DB folder OK.")
 				self.initok = True
 			else:
@@ -613,29 +1221,38 @@ class DBFolderReader:
 		return filename in self.filelist
 
 	def parse(self):
-		for path, subdirs, files in os.walk(self.location):
-			for name in files:
-				entryName = os.path.join(path, name)
-				self.filelist[entryName] = DBFolderFile(name=entryName, handle=entryName)
+		self.filelist = DBFolderFileList()
+
+	def readFingerprint(self):
+		# no single file to hash here, the mtimes of info.xml and the part folders change with the database
+		names = ['info.xml', 'Primitives', os.path.join('Primitives', 'LOD0')]
+		self.fingerprint = '-'.join('{0}'.format(os.stat(os.path.join(self.location, name)).st_mtime) for name in names if os.path.exists(os.path.join(self.location, name)))
 	
 class LIFReader:
 	def __init__(self, file):
 		self.packedFilesOffset = 84
 		self.filelist = {}
+		self.entries = {}
+		self.index = file + LIFINDEXSUFFIX
 		self.initok = False
 		self.location = file
 		self.dbinfo = None
 
 		try:
 			self.filehandle = open(self.location, "rb")
-			self.filehandle.seek(0, 0)
+			self.mapping = mmap.mmap(self.filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+			self.data = memoryview(self.mapping)
 		except Exception as e:
 			self.initok = False
 			print("Database FAIL")
 			return
 		else:
-			if self.filehandle.read(4).decode() == "LIFF":
-				self.parse(prefix='', offset=self.readInt(offset=72) + 64)
+			if self.mapping[0:4] == b"LIFF":
+				self.readFingerprint()
+				if not self.loadIndex():
+					self.parse(prefix='', offset=self.readInt(offset=72) + 64)
+					self.saveIndex()
+				self.filelist = LIFFileList(handle=self.data, entries=self.entries)
 				if self.fileexist('/Materials.xml') and self.fileexist('/info.xml') and self.fileexist(MATERIALNAMESPATH + 'EN/localizedStrings.loc'):
 					self.dbinfo = DBinfo(data=self.filelist['/info.xml'].read())
 					print("Database OK.")
@@ -663,69 +1280,327 @@ class LIFReader:
 			entryType = self.readShort(offset=offset)
 			offset += 6
 
-			entryName = '{0}{1}'.format(prefix,'/');
-			self.filehandle.seek(offset + 1, 0)
-			if sys.version_info < (3, 0):
-				t = ord(self.filehandle.read(1))
-			else:
-				t = int.from_bytes(self.filehandle.read(1), byteorder='big')
-
-			while not t == 0:
-				entryName ='{0}{1}'.format(entryName,chr(t))
-				self.filehandle.seek(1, 1)
-				if sys.version_info < (3, 0):
-					t = ord(self.filehandle.read(1))
-				else:
-					t = int.from_bytes(self.filehandle.read(1), byteorder='big')
-
-				offset += 2
-
-			offset += 6
+			# entry names are zero terminated UTF-16BE strings
+			nameEnd = self.mapping.find(b'\x00\x00', offset)
+			while (nameEnd - offset) % 2 == 1:
+				nameEnd = self.mapping.find(b'\x00\x00', nameEnd + 1)
+			entryName = '{0}/{1}'.format(prefix, self.mapping[offset:nameEnd].decode('utf-16-be'))
+			offset = nameEnd + 6
 			self.packedFilesOffset += 20
 
 			if entryType == 1:
 				offset = self.parse(prefix=entryName, offset=offset)
 			elif entryType == 2:
 				fileSize = self.readInt(offset=offset) - 20
-				self.filelist[entryName] = LIFFile(name=entryName, offset=self.packedFilesOffset, size=fileSize, handle=self.filehandle)
+				self.entries[entryName] = (self.packedFilesOffset, fileSize)
 				offset += 24
 				self.packedFilesOffset += fileSize
 
 		return offset
 
+	def readFingerprint(self):
+		# size, mtime and a hash of the header and the start of the directory tables identify the state of a db.lif
+		stat = os.fstat(self.filehandle.fileno())
+		self.size = stat.st_size
+		self.mtime = stat.st_mtime_ns
+		directory = self.readInt(offset=72) + 64
+		sha = hashlib.sha1(self.data[:min(LIFFINGERPRINTSIZE, directory)])
+		sha.update(self.data[directory:directory + LIFFINGERPRINTSIZE])
+		self.hash = sha.hexdigest()
+		self.fingerprint = '{0}-{1}-{2}'.format(self.size, self.mtime, self.hash)
+
+	def loadIndex(self):
+		try:
+			with open(self.index, 'rb') as f:
+				index = json.loads(f.read().decode('utf-8'))
+		except Exception as e:
+			return False
+		if index.get('version') != LIFINDEXVERSION or index.get('size') != self.size or index.get('mtime') != self.mtime or index.get('hash') != self.hash or index.get('separator') != '/':
+			return False
+		self.entries = index['entries']
+		return True
+
+	def saveIndex(self):
+		index = {'version': LIFINDEXVERSION, 'size': self.size, 'mtime': self.mtime, 'hash': self.hash, 'separator': '/', 'entries': self.entries}
+		tmpname = '{0}.{1}'.format(self.index, os.getpid())
+		try:
+			with open(tmpname, 'wb') as f:
+				f.write(json.dumps(index).encode('utf-8'))
+			os.replace(tmpname, self.index)
+		except Exception as e:
+			print('Could not write database index {0}: {1}'.format(self.index, e))
+			if os.path.exists(tmpname):
+				os.remove(tmpname)
+
 	def readInt(self, offset=0):
-		self.filehandle.seek(offset, 0)
-		if sys.version_info < (3, 0):
-			return int(struct.unpack('>i', self.filehandle.read(4))[0])
-		else:
-			return int.from_bytes(self.filehandle.read(4), byteorder='big')
+		return int(struct.unpack_from('>I', self.mapping, offset)[0])
 
 	def readShort(self, offset=0):
-		self.filehandle.seek(offset, 0)
-		if sys.version_info < (3, 0):
-			return int(struct.unpack('>h', self.filehandle.read(2))[0])
+		return int(struct.unpack_from('>H', self.mapping, offset)[0])
+
+class GLTFBuilder:
+	# glTF 2.0 json plus one binary buffer, written out as a single .glb file
+	def __init__(self):
+		self.json = {'asset': {'version': '2.0', 'generator': 'pylddlib'}, 'scene': 0, 'scenes': [{'nodes': []}], 'nodes': [], 'meshes': [], 'materials': [], 'textures': [], 'images': [], 'samplers': [], 'accessors': [], 'bufferViews': []}
+		self.binary = []
+		self.length = 0
+
+	def addBufferView(self, data, target=None):
+		view = {'buffer': 0, 'byteOffset': self.length, 'byteLength': len(data)}
+		if target is not None:
+			view['target'] = target
+		self.binary.append(data)
+		self.length += len(data)
+		# every view starts 4 byte aligned
+		padding = (4 - self.length % 4) % 4
+		if padding > 0:
+			self.binary.append(b'\0' * padding)
+			self.length += padding
+		self.json['bufferViews'].append(view)
+		return len(self.json['bufferViews']) - 1
+
+	def addAccessor(self, array, type, target, minmax=False):
+		array = numpy.ascontiguousarray(array)
+		if array.dtype == numpy.uint32:
+			componentType = 5125
 		else:
-			return int.from_bytes(self.filehandle.read(2), byteorder='big')
+			array = numpy.ascontiguousarray(array, dtype=numpy.float32)
+			componentType = 5126
+		accessor = {'bufferView': self.addBufferView(array.tobytes(), target), 'componentType': componentType, 'count': len(array), 'type': type}
+		if minmax:
+			accessor['min'] = array.min(axis=0).tolist()
+			accessor['max'] = array.max(axis=0).tolist()
+		self.json['accessors'].append(accessor)
+		return len(self.json['accessors']) - 1
+
+	def addAttributes(self, positions, normals, textures=None):
+		lengths = numpy.sqrt((numpy.asarray(normals, dtype=numpy.float64) ** 2).sum(axis=1))
+		lengths[lengths == 0] = 1
+		attributes = {'POSITION': self.addAccessor(positions, 'VEC3', 34962, minmax=True), 'NORMAL': self.addAccessor(numpy.asarray(normals, dtype=numpy.float64) / lengths[:, None], 'VEC3', 34962)}
+		if textures is not None:
+			# glTF counts v from the top of the image
+			attributes['TEXCOORD_0'] = self.addAccessor(numpy.asarray(textures, dtype=numpy.float64) + (0, 1), 'VEC2', 34962)
+		return attributes
+
+	def addIndices(self, faces):
+		return self.addAccessor(numpy.asarray(faces, dtype=numpy.uint32).ravel(), 'SCALAR', 34963)
+
+	def addMaterial(self, name, lddmat, texture=None):
+		color = [self.sRGBtoLinear(lddmat.r), self.sRGBtoLinear(lddmat.g), self.sRGBtoLinear(lddmat.b), lddmat.a / 255]
+		material = {'name': name, 'pbrMetallicRoughness': {'baseColorFactor': color, 'metallicFactor': 0.0, 'roughnessFactor': 0.1}}
+		if lddmat.mattype == 'Metallic':
+			material['pbrMetallicRoughness']['metallicFactor'] = 1.0
+			material['pbrMetallicRoughness']['roughnessFactor'] = 0.2
+		if lddmat.a < 255:
+			material['alphaMode'] = 'BLEND'
+		if texture is not None:
+			# like the Blender importer, decorated surfaces only show the decoration image
+			material['pbrMetallicRoughness']['baseColorFactor'] = [1.0, 1.0, 1.0, color[3]]
+			material['pbrMetallicRoughness']['baseColorTexture'] = {'index': texture}
+		self.json['materials'].append(material)
+		return len(self.json['materials']) - 1
+
+	def addTexture(self, image):
+		if len(self.json['samplers']) == 0:
+			self.json['samplers'].append({'magFilter': 9729, 'minFilter': 9987, 'wrapS': 33071, 'wrapT': 33071})
+		self.json['images'].append({'bufferView': self.addBufferView(bytes(image)), 'mimeType': 'image/png'})
+		self.json['textures'].append({'sampler': 0, 'source': len(self.json['images']) - 1})
+		return len(self.json['textures']) - 1
+
+	def addMesh(self, name, primitives):
+		self.json['meshes'].append({'name': name, 'primitives': primitives})
+		return len(self.json['meshes']) - 1
+
+	def addNode(self, node):
+		self.json['nodes'].append(node)
+		self.json['scenes'][0]['nodes'].append(len(self.json['nodes']) - 1)
+
+	def sRGBtoLinear(self, value):
+		value = float(value) / 255
+		if value <= 0.04045:
+			return value / 12.92
+		return pow((value + 0.055) / 1.055, 2.4)
+
+	def write(self, filename):
+		gltf = dict((key, value) for key, value in self.json.items() if not (isinstance(value, list) and len(value) == 0))
+		if self.length > 0:
+			gltf['buffers'] = [{'byteLength': self.length}]
+		jsondata = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+		jsondata += b' ' * ((4 - len(jsondata) % 4) % 4)
+		binary = b''.join(self.binary)
+
+		total = 12 + 8 + len(jsondata)
+		if len(binary) > 0:
+			total += 8 + len(binary)
+		with open(filename, 'wb') as f:
+			f.write(struct.pack('<III', 0x46546C67, 2, total))
+			f.write(struct.pack('<II', len(jsondata), 0x4E4F534A))
+			f.write(jsondata)
+			if len(binary) > 0:
+				f.write(struct.pack('<II', len(binary), 0x004E4942))
+				f.write(binary)
+
+def invertRigid(matrix):
+	# inverse of a rotation followed by a translation, like the bone and box matrices of LDD
+	return Matrix3D(
+		n11=matrix.n11, n12=matrix.n21, n13=matrix.n31, n14=0,
+		n21=matrix.n12, n22=matrix.n22, n23=matrix.n32, n24=0,
+		n31=matrix.n13, n32=matrix.n23, n33=matrix.n33, n34=0,
+		n41=-(matrix.n41 * matrix.n11 + matrix.n42 * matrix.n12 + matrix.n43 * matrix.n13),
+		n42=-(matrix.n41 * matrix.n21 + matrix.n42 * matrix.n22 + matrix.n43 * matrix.n23),
+		n43=-(matrix.n41 * matrix.n31 + matrix.n42 * matrix.n32 + matrix.n43 * matrix.n33),
+		n44=1)
+
+def readBounding(bounding):
+	try:
+		return ((float(bounding['minX']), float(bounding['minY']), float(bounding['minZ'])), (float(bounding['maxX']), float(bounding['maxY']), float(bounding['maxZ'])))
+	except (KeyError, ValueError) as e:
+		return None
+
+class BoxGrid:
+	# Boxes of the parts of a scene in a uniform grid of OCCLUSIONCELLSIZE cells, finds the parts a point is inside of
+	def __init__(self, cellsize=OCCLUSIONCELLSIZE):
+		self.cellsize = cellsize
+		self.boxes = []
+		self.cells = {}
+
+	def add(self, matrix, low, high, owner, box=None):
+		# matrix places the part in the scene, box is a CollisionBox matrix from part space into the space of that box
+		toscene = [matrix] if box is None else [invertRigid(box), matrix]
+		corners = [Point3D(x=x, y=y, z=z) for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])]
+		for corner in corners:
+			for m in toscene:
+				corner.transform(m)
+		first = self.cell(Point3D(x=min(c.x for c in corners), y=min(c.y for c in corners), z=min(c.z for c in corners)))
+		last = self.cell(Point3D(x=max(c.x for c in corners), y=max(c.y for c in corners), z=max(c.z for c in corners)))
+
+		index = len(self.boxes)
+		self.boxes.append(([invertRigid(matrix)] if box is None else [invertRigid(matrix), box], low, high, owner))
+		for i in range(first[0], last[0] + 1):
+			for j in range(first[1], last[1] + 1):
+				for k in range(first[2], last[2] + 1):
+					self.cells.setdefault((i, j, k), []).append(index)
+
+	def cell(self, point):
+		return (int(math.floor(point.x / self.cellsize)), int(math.floor(point.y / self.cellsize)), int(math.floor(point.z / self.cellsize)))
+
+	def inside(self, point, owner=None):
+		# point is in scene space, boxes of owner itself do not count
+		for index in self.cells.get(self.cell(point), ()):
+			(tolocal, low, high, other) = self.boxes[index]
+			if other is owner:
+				continue
+			p = point.copy()
+			for m in tolocal:
+				p.transform(m)
+			if low[0] < p.x < high[0] and low[1] < p.y < high[1] and low[2] < p.z < high[2]:
+				return True
+		return False
+
+def findEnclosed(placements, candidates=None):
+	# placements are (owner, matrix, designID, primitive) of rigid parts. A part is enclosed when points just outside
+	# every face of its Bounding box, ENCLOSURESTEP apart, are all inside collision boxes of other parts.
+	# Only the owners in candidates are tested (all of them for None), every placement covers the others
+	grid = BoxGrid()
+	for (owner, matrix, designID, primitive) in placements:
+		for box in primitive.CollisionBoxes:
+			grid.add(matrix, (-box.corner.x, -box.corner.y, -box.corner.z), (box.corner.x, box.corner.y, box.corner.z), owner, box=box.matrix)
+
+	enclosed = set()
+	surfaces = {}
+	for (owner, matrix, designID, primitive) in placements:
+		if candidates is not None and owner not in candidates:
+			continue
+		if designID not in surfaces:
+			bounds = readBounding(primitive.Bounding)
+			surfaces[designID] = surfacePoints(bounds[0], bounds[1]) if bounds is not None else []
+		if len(surfaces[designID]) == 0:
+			continue
+		for (x, y, z) in surfaces[designID]:
+			point = Point3D(x=x, y=y, z=z)
+			point.transform(matrix)
+			if not grid.inside(point, owner):
+				break
+		else:
+			enclosed.add(owner)
+	return enclosed
+
+def surfacePoints(low, high):
+	# points ENCLOSUREMARGIN outside of every face of a box, about ENCLOSURESTEP apart
+	samples = []
+	for (a, b) in zip(low, high):
+		count = max(1, int(math.ceil((b - a) / ENCLOSURESTEP)))
+		samples.append([a + (b - a) * (k + 0.5) / count for k in range(count)])
+	points = []
+	for axis in range(3):
+		(u, v) = [other for other in range(3) if other != axis]
+		for side in (low[axis] - ENCLOSUREMARGIN, high[axis] + ENCLOSUREMARGIN):
+			for a in samples[u]:
+				for b in samples[v]:
+					coords = [0, 0, 0]
+					coords[axis] = side
+					coords[u] = a
+					coords[v] = b
+					points.append(tuple(coords))
+	return points
 
 class Converter:
-	def LoadDBFolder(self, dbfolderlocation):
+	def __init__(self, stats=None, weld=None):
+		self.stats = stats if stats is not None else ConverterStats()
+		self.weld = weld
+		self.primitives = {}
+
+	def LoadDBFolder(self, dbfolderlocation, geometrycachesize=None):
+		start = time.time()
 		self.database = DBFolderReader(folder=dbfolderlocation)
+		self.geometrycache = GeometryCache(database=self.database, maxsize=geometrycachesize, stats=self.stats, weld=self.weld)
 		if self.database.initok and self.database.fileexist(os.path.join(dbfolderlocation,'Materials.xml')) and self.database.fileexist(MATERIALNAMESPATH + 'EN/localizedStrings.loc'):
 			self.allMaterials = Materials(data=self.database.filelist[os.path.join(dbfolderlocation,'Materials.xml')].read());
 			self.allMaterials.setLOC(loc=LOCReader(data=self.database.filelist[MATERIALNAMESPATH + 'EN/localizedStrings.loc'].read()))
+		self.stats.add('database open', time.time() - start)
 
-	def LoadDatabase(self,databaselocation):
+	def LoadDatabase(self,databaselocation, geometrycachesize=None):
+		start = time.time()
 		self.database = LIFReader(file=databaselocation)
+		self.geometrycache = GeometryCache(database=self.database, maxsize=geometrycachesize, stats=self.stats, weld=self.weld)
 
 		if self.database.initok and self.database.fileexist('/Materials.xml') and self.database.fileexist(MATERIALNAMESPATH + 'EN/localizedStrings.loc'):
 			self.allMaterials = Materials(data=self.database.filelist['/Materials.xml'].read());
 			self.allMaterials.setLOC(loc=LOCReader(data=self.database.filelist[MATERIALNAMESPATH + 'EN/localizedStrings.loc'].read()))
+		self.stats.add('database open', time.time() - start)
 
 	def LoadScene(self,filename):
 		if self.database.initok:
+			start = time.time()
 			self.scene = Scene(file=filename)
-
-	def Export(self,filename):
+			self.stats.add('scene parse', time.time() - start)
+
+	def readPrimitive(self, designID):
+		# the .xml of a design without its .g files, for bounds and collision boxes
+		if designID not in self.primitives:
+			self.primitives[designID] = Primitive(data = self.database.filelist[PRIMITIVEPATH + designID + '.xml'].read())
+		return self.primitives[designID]
+
+	def findEnclosedParts(self, candidates=None):
+		# rigid parts out of candidates (all for None) that are covered by other parts on every side, only the .xml files are read
+		start = time.time()
+		placements = []
+		for bri in self.scene.Bricks:
+			for pa in bri.Parts:
+				if len(pa.Bones) == 1:
+					placements.append((pa, pa.Bones[0].matrix, pa.designID, self.readPrimitive(pa.designID)))
+		enclosed = findEnclosed(placements, candidates)
+		self.stats.add('interior culling', time.time() - start)
+		self.stats.count('enclosed parts', len(enclosed))
+		return enclosed
+
+	def updateStats(self):
+		# counters that are read off the database and the process instead of being counted along the way
+		self.stats.set('database bytes read', getattr(self.database.filelist, 'bytesread', 0))
+		self.stats.measureMemory()
+		return self.stats
+
+	def Export(self,filename, skipEnclosed=False):
 		invert = Matrix3D() 
 		#invert.n33 = -1 #uncomment to invert the Z-Axis
 		
@@ -736,23 +1611,31 @@ class Converter:
 
 		start_time = time.time()
 
-		out = open(filename + ".obj", "w+")
-		out.write("mtllib " + filename + ".mtl" + '\n\n')
+		out = open(filename + ".obj", "w+", OBJWRITEBUFFER)
+		out.write("mtllib " + os.path.basename(filename) + ".mtl" + '\n\n')
 		outtext = open(filename + ".mtl", "w+")
 		
 		total = len(self.scene.Bricks)
 		current = 0
 
+		# decode the geometry of all parts that are written in the background while the bricks are written
+		enclosed = self.findEnclosedParts() if skipEnclosed else set()
+		self.geometrycache.prefetch(designIDs=[pa.designID for bri in self.scene.Bricks for pa in bri.Parts if pa not in enclosed], database=self.database)
+
 		for bri in self.scene.Bricks:
 			current += 1
 
 			for pa in bri.Parts:
+				if pa in enclosed:
+					continue
 
 				if pa.designID not in geometriecache:
-					geo = Geometry(designID=pa.designID, database=self.database)
+					self.stats.count('geometriecache misses')
+					geo = self.geometrycache.get(designID=pa.designID, database=self.database)
 					progress(current ,total , "(" + geo.designID + ") " + geo.Partname, ' ')
 					geometriecache[pa.designID] = geo
 				else:
+					self.stats.count('geometriecache hits')
 					geo = geometriecache[pa.designID]
 
 					progress(current ,total , "(" + geo.designID + ") " + geo.Partname ,'-')
@@ -760,27 +1643,36 @@ class Converter:
 				out.write("o\n")
 
 				for part in geo.Parts:
-					geo.Parts[part].outpositions = [elem.copy() for elem in geo.Parts[part].positions]
-					geo.Parts[part].outnormals = [elem.copy() for elem in geo.Parts[part].normals]
-
-					for i, b in enumerate(pa.Bones):
-						# positions
-						for j, p in enumerate(geo.Parts[part].outpositions):
-							if (geo.Parts[part].bonemap[j] == i):
-								p.transform( invert * b.matrix)
-						# normals
-						for k, n in enumerate(geo.Parts[part].outnormals):
-							if (geo.Parts[part].bonemap[k] == i):
-								n.transformW( invert * b.matrix)
-
-					for point in geo.Parts[part].outpositions:
-						out.write(point.string("v")) 
-
-					for normal in geo.Parts[part].outnormals:
-						out.write(normal.string("vn"))
-
-					for text in geo.Parts[part].textures:
-						out.write(text.string("vt")) 
+					if geo.Parts[part].positionArray is not None:
+						start = time.time()
+						geo.Parts[part].outpositions, geo.Parts[part].outnormals = geo.Parts[part].skin([invert * b.matrix for b in pa.Bones])
+						self.stats.add('flex skinning' if len(pa.Bones) > 1 else 'vertex transform', time.time() - start)
+						out.write(formatRows('v %f %f %f\n', geo.Parts[part].outpositions))
+						out.write(formatRows('vn %f %f %f\n', geo.Parts[part].outnormals))
+						if geo.Parts[part].textureArray is not None:
+							out.write(formatRows('vt %f %f\n', numpy.asarray(geo.Parts[part].textureArray, dtype=numpy.float64) * (1, -1)))
+					else:
+						geo.Parts[part].outpositions = [elem.copy() for elem in geo.Parts[part].positions]
+						geo.Parts[part].outnormals = [elem.copy() for elem in geo.Parts[part].normals]
+
+						for i, b in enumerate(pa.Bones):
+							# positions
+							for j, p in enumerate(geo.Parts[part].outpositions):
+								if (geo.Parts[part].bonemap[j] == i):
+									p.transform( invert * b.matrix)
+							# normals
+							for k, n in enumerate(geo.Parts[part].outnormals):
+								if (geo.Parts[part].bonemap[k] == i):
+									n.transformW( invert * b.matrix)
+
+						for point in geo.Parts[part].outpositions:
+							out.write(point.string("v")) 
+
+						for normal in geo.Parts[part].outnormals:
+							out.write(normal.string("vn"))
+
+						for text in geo.Parts[part].textures:
+							out.write(text.string("vt")) 
 
 				decoCount = 0
 				out.write("g " + "(" + geo.designID + ") " + geo.Partname + '\n')
@@ -794,11 +1686,12 @@ class Converter:
 						print('WARNING: {0}.g{1} has NO material assignment in lxf. Replaced with color 9. Fix {0}.xml faces values.'.format(pa.designID, part))
 						materialCurrentPart = '9'
 					
+					start = time.time()
 					lddmat = self.allMaterials.getMaterialbyId(materialCurrentPart)
 					matname = lddmat.name
 
 					deco = '0'
-					if hasattr(pa, 'decoration') and len(geo.Parts[part].textures) > 0:
+					if hasattr(pa, 'decoration') and geo.Parts[part].texCount > 0:
 						#if decoCount <= len(pa.decoration):
 						if decoCount < len(pa.decoration):
 							deco = pa.decoration[decoCount]
@@ -806,7 +1699,8 @@ class Converter:
 	
 					extfile = ''
 					if not deco == '0':
-						extfile = deco + '.png'
+						# decorations go next to the .mtl that references them
+						extfile = os.path.join(os.path.dirname(filename), deco + '.png')
 						matname += "_" + deco
 						decofilename = DECORATIONPATH + deco + '.png'
 						if not os.path.isfile(extfile) and self.database.fileexist(decofilename):
@@ -820,19 +1714,152 @@ class Converter:
 						outtext.write(lddmat.string())
 						if not deco == '0':
 							outtext.write("map_Kd " + deco + ".png" + '\n')
+					self.stats.add('material creation', time.time() - start)
 
 					out.write("usemtl " + matname + '\n') 
-					for face in geo.Parts[part].faces:
-						if len(geo.Parts[part].textures) > 0:
-							out.write(face.string("f",indexOffset,textOffset))  
+					if geo.Parts[part].faceArray is not None:
+						faces = numpy.asarray(geo.Parts[part].faceArray, dtype=numpy.int64)
+						if geo.Parts[part].texCount > 0:
+							vertices = faces + indexOffset
+							textures = faces + textOffset
+							rows = numpy.stack((vertices, textures, vertices), axis=2).reshape(-1, 9)
+							out.write(formatRows('f %d/%d/%d %d/%d/%d %d/%d/%d\n', rows))
 						else:
-							out.write(face.string("f",indexOffset)) 
+							out.write(formatRows('f %d//%d %d//%d %d//%d\n', (faces + indexOffset)[:, [0, 0, 1, 1, 2, 2]]))
+					else:
+						for face in geo.Parts[part].faces:
+							if len(geo.Parts[part].textures) > 0:
+								out.write(face.string("f",indexOffset,textOffset))  
+							else:
+								out.write(face.string("f",indexOffset)) 
 
 					indexOffset += len(geo.Parts[part].outpositions)
-					textOffset += len(geo.Parts[part].textures) 
+					textOffset += geo.Parts[part].texCount
 				# -----------------------------------------------------------------
 				out.write('\n')
 
+		self.stats.add('export obj', time.time() - start_time)
+		self.updateStats()
+		sys.stdout.write('%s\r' % ('                                                                                                 '))
+		print("--- %s seconds ---" % (time.time() - start_time))
+
+	def ExportGLB(self, filename, skipEnclosed=False):
+		# Every distinct sub part goes into the buffer once, bricks are nodes pointing at shared meshes
+		if numpy is None:
+			print('GLB export needs numpy.')
+			return
+
+		gltf = GLTFBuilder()
+		geometriecache = {}
+		attributecache = {}
+		indexcache = {}
+		meshcache = {}
+		materialcache = {}
+		texturecache = {}
+
+		start_time = time.time()
+		total = len(self.scene.Bricks)
+		current = 0
+
+		enclosed = self.findEnclosedParts() if skipEnclosed else set()
+		self.geometrycache.prefetch(designIDs=[pa.designID for bri in self.scene.Bricks for pa in bri.Parts if pa not in enclosed], database=self.database)
+
+		for bri in self.scene.Bricks:
+			current += 1
+
+			for pa in bri.Parts:
+				if pa in enclosed:
+					continue
+
+				if pa.designID not in geometriecache:
+					self.stats.count('geometriecache misses')
+					geo = self.geometrycache.get(designID=pa.designID, database=self.database)
+					progress(current ,total , "(" + geo.designID + ") " + geo.Partname, ' ')
+					geometriecache[pa.designID] = geo
+				else:
+					self.stats.count('geometriecache hits')
+					geo = geometriecache[pa.designID]
+
+					progress(current ,total , "(" + geo.designID + ") " + geo.Partname ,'-')
+
+				# same material and decoration rules as the OBJ export
+				decoCount = 0
+				partmaterials = []
+				for part in geo.Parts:
+					try:
+						materialCurrentPart = pa.materials[part]
+					except IndexError:
+						print('WARNING: {0}.g{1} has NO material assignment in lxf. Replaced with color 9. Fix {0}.xml faces values.'.format(pa.designID, part))
+						materialCurrentPart = '9'
+
+					deco = '0'
+					if hasattr(pa, 'decoration') and geo.Parts[part].texCount > 0:
+						if decoCount < len(pa.decoration):
+							deco = pa.decoration[decoCount]
+						decoCount += 1
+					partmaterials.append((materialCurrentPart, deco))
+
+				# Flex parts are unique, their vertices are placed in scene space
+				isflex = len(pa.Bones) > 1
+				# sub parts are keyed by their digest, so equal geometry of different designIDs is stored once
+				meshkey = (tuple(geo.Parts[part].digest() for part in geo.Parts), tuple(partmaterials))
+
+				if isflex or meshkey not in meshcache:
+					primitives = []
+					for part in geo.Parts:
+						if geo.Parts[part].valueCount == 0 or geo.Parts[part].faceCount == 0:
+							continue
+
+						textures = geo.Parts[part].textureArray if geo.Parts[part].texCount > 0 else None
+						if isflex:
+							start = time.time()
+							positions, normals = geo.Parts[part].skin([b.matrix for b in pa.Bones])
+							self.stats.add('flex skinning', time.time() - start)
+							attributes = gltf.addAttributes(positions, normals, textures)
+						else:
+							if geo.Parts[part].digest() not in attributecache:
+								attributecache[geo.Parts[part].digest()] = gltf.addAttributes(geo.Parts[part].positionArray, geo.Parts[part].normalArray, textures)
+							attributes = attributecache[geo.Parts[part].digest()]
+
+						if geo.Parts[part].digest() not in indexcache:
+							indexcache[geo.Parts[part].digest()] = gltf.addIndices(geo.Parts[part].faceArray)
+
+						if partmaterials[part] not in materialcache:
+							start = time.time()
+							(materialId, deco) = partmaterials[part]
+							lddmat = self.allMaterials.getMaterialbyId(materialId)
+							matname = lddmat.name
+							if not deco == '0':
+								matname += "_" + deco
+								decofilename = DECORATIONPATH + deco + '.png'
+								if deco not in texturecache:
+									texturecache[deco] = gltf.addTexture(self.database.filelist[decofilename].read()) if self.database.fileexist(decofilename) else None
+							materialcache[partmaterials[part]] = gltf.addMaterial(matname, lddmat, texturecache.get(deco))
+							self.stats.add('material creation', time.time() - start)
+
+						primitives.append({'attributes': attributes, 'indices': indexcache[geo.Parts[part].digest()], 'material': materialcache[partmaterials[part]]})
+
+					if len(primitives) == 0:
+						continue
+					mesh = gltf.addMesh("(" + geo.designID + ") " + geo.Partname, primitives)
+					if not isflex:
+						meshcache[meshkey] = mesh
+				else:
+					mesh = meshcache[meshkey]
+
+				node = {'name': "(" + geo.designID + ") " + geo.Partname, 'mesh': mesh}
+				if not isflex and len(pa.Bones) > 0:
+					# Matrix3D maps row vectors, so its rows read in order are glTF's column major layout
+					m = pa.Bones[0].matrix
+					node['matrix'] = [m.n11, m.n12, m.n13, m.n14, m.n21, m.n22, m.n23, m.n24, m.n31, m.n32, m.n33, m.n34, m.n41, m.n42, m.n43, m.n44]
+				gltf.addNode(node)
+
+		start = time.time()
+		gltf.write(filename + ".glb")
+		self.stats.add('glb write', time.time() - start)
+
+		self.stats.add('export glb', time.time() - start_time)
+		self.updateStats()
 		sys.stdout.write('%s\r' % ('                                                                                                 '))
 		print("--- %s seconds ---" % (time.time() - start_time))
 
@@ -859,6 +1886,15 @@ def FindDatabase():
 	else:
 		return str(os.path.join(str(os.getenv('USERPROFILE') or os.getenv('HOME')),'AppData','Roaming','LEGO Company','LEGO Digital Designer','db.lif'))
 	
+def FindCacheDir():
+	lddcachedir = os.getenv('LDDCACHEDIR')
+	if lddcachedir is not None:
+		return str(lddcachedir)
+	elif os.name == 'nt':
+		return str(os.path.join(str(os.getenv('LOCALAPPDATA') or os.getenv('USERPROFILE')),'pylddlib','cache'))
+	else:
+		return str(os.path.join(str(os.getenv('XDG_CACHE_HOME') or os.path.join(str(os.getenv('HOME')),'.cache')),'pylddlib'))
+
 def progress(count, total, status='', suffix = ''):
 	bar_len = 40
 	filled_len = int(round(bar_len * count / float(total)))
@@ -868,6 +1904,220 @@ def progress(count, total, status='', suffix = ''):
 	sys.stdout.write('Progress: [%s] %s%s %s %s\r' % (bar, percents, '%', suffix, status))
 	sys.stdout.flush()
 
+def openConverter(databaselocation, geometrycachesize=None, stats=None, weld=None):
+	converter = Converter(stats=stats, weld=weld)
+	if os.path.isdir(databaselocation):
+		setDBFolderVars(dbfolderlocation = databaselocation)
+		converter.LoadDBFolder(dbfolderlocation = databaselocation, geometrycachesize = geometrycachesize)
+	else:
+		converter.LoadDatabase(databaselocation = databaselocation, geometrycachesize = geometrycachesize)
+	return converter
+
+def exportScene(converter, lxf_filename, obj_filename, skipEnclosed=False):
+	converter.LoadScene(filename=lxf_filename)
+	if obj_filename.endswith('.glb'):
+		converter.ExportGLB(filename=obj_filename[:-4], skipEnclosed=skipEnclosed)
+	else:
+		converter.Export(filename=obj_filename, skipEnclosed=skipEnclosed)
+
+def profileScene(databaselocation, lxf_filename, obj_filename, prefix, skipEnclosed=False, weld=None):
+	# One conversion under cProfile and tracemalloc, PREFIX.prof loads into pstats or snakeviz, PREFIX.txt is the readable report
+	stats = ConverterStats()
+	profiler = cProfile.Profile()
+	tracemalloc.start()
+	profiler.enable()
+	converter = openConverter(databaselocation, stats=stats, weld=weld)
+	exportScene(converter, lxf_filename, obj_filename, skipEnclosed=skipEnclosed)
+	profiler.disable()
+	converter.updateStats()
+	snapshot = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+
+	profiler.dump_stats(prefix + '.prof')
+	functions = io.StringIO()
+	pstats.Stats(profiler, stream=functions).sort_stats('cumulative').print_stats(30)
+	with open(prefix + '.txt', 'w') as f:
+		f.write(stats.summary() + '\n\n')
+		f.write(functions.getvalue() + '\n')
+		f.write('Top allocations still held at the end of the export:\n')
+		for statistic in snapshot.statistics('lineno')[:20]:
+			f.write(str(statistic) + '\n')
+
+	print(stats.summary())
+	print('Profile written to {0}.prof and {0}.txt'.format(prefix))
+
+BATCHCONVERTER = None
+
+def openBatchWorker(databaselocation, weld=None):
+	# Runs once per worker process, the database and its geometry stay loaded for all files of that worker
+	global BATCHCONVERTER
+	sys.stdout = open(os.devnull, 'w')
+	BATCHCONVERTER = openConverter(os.path.abspath(databaselocation), weld=weld)
+
+def convertBatchFile(job):
+	(lxf_filename, obj_filename, skipEnclosed) = job
+	start_time = time.time()
+	try:
+		if not BATCHCONVERTER.database.initok:
+			raise IOError('database could not be opened')
+		exportScene(BATCHCONVERTER, lxf_filename, obj_filename, skipEnclosed=skipEnclosed)
+		return (lxf_filename, time.time() - start_time, None)
+	except Exception as e:
+		return (lxf_filename, time.time() - start_time, '{0}: {1}'.format(type(e).__name__, e))
+
+def findBatchFiles(location):
+	# a directory is searched for models, any other file is a manifest with one model path per line
+	files = []
+	if os.path.isdir(location):
+		for root, dirs, names in os.walk(location):
+			dirs.sort()
+			for name in sorted(names):
+				if name.lower().endswith(('.lxf', '.lxfml')):
+					files.append(os.path.join(root, name))
+	else:
+		with open(location, 'r') as manifest:
+			for line in manifest:
+				line = line.strip()
+				if len(line) > 0 and not line.startswith('#'):
+					files.append(os.path.join(os.path.dirname(location), line))
+	return [os.path.abspath(f) for f in files]
+
+def convertBatch(databaselocation, location, outdir=None, exportformat='obj', jobs=None, report=None, skipEnclosed=False, weld=None):
+	files = findBatchFiles(location)
+	if len(files) == 0:
+		print('No .lxf or .lxfml files found in ' + location)
+		return 1
+
+	# models keep their subfolder below --out, two models that would write the same file are not converted
+	root = os.path.abspath(location if os.path.isdir(location) else os.path.dirname(location))
+	batch = []
+	targets = {}
+	collisions = []
+	for lxf_filename in files:
+		target = os.path.dirname(lxf_filename)
+		if outdir is not None:
+			subdir = os.path.relpath(target, root)
+			target = os.path.abspath(outdir) if subdir.startswith(os.pardir) else os.path.normpath(os.path.join(os.path.abspath(outdir), subdir))
+		obj_filename = os.path.join(target, os.path.splitext(os.path.basename(lxf_filename))[0])
+		if exportformat == 'glb':
+			obj_filename += '.glb'
+		if obj_filename in targets:
+			collisions.append((lxf_filename, 'writes {0} like {1}'.format(obj_filename, targets[obj_filename])))
+			continue
+		targets[obj_filename] = lxf_filename
+		if not os.path.isdir(target):
+			os.makedirs(target)
+		batch.append((lxf_filename, obj_filename, skipEnclosed))
+
+	start_time = time.time()
+	results = []
+	failed = 0
+	for (lxf_filename, error) in collisions:
+		results.append({'file': lxf_filename, 'seconds': 0, 'error': error})
+		failed += 1
+		print('{0:8.2f}s  FAIL  {1}  {2}'.format(0, lxf_filename, error))
+	pool = multiprocessing.Pool(processes=jobs, initializer=openBatchWorker, initargs=(databaselocation, weld))
+	try:
+		for (lxf_filename, seconds, error) in pool.imap_unordered(convertBatchFile, batch):
+			results.append({'file': lxf_filename, 'seconds': round(seconds, 3), 'error': error})
+			if error is None:
+				print('{0:8.2f}s  OK    {1}'.format(seconds, lxf_filename))
+			else:
+				failed += 1
+				print('{0:8.2f}s  FAIL  {1}  {2}'.format(seconds, lxf_filename, error))
+	finally:
+		pool.close()
+		pool.join()
+
+	print('{0} files, {1} failed, {2:.2f} seconds'.format(len(results), failed, time.time() - start_time))
+	if report is not None:
+		with open(report, 'w') as f:
+			json.dump({'files': results, 'failed': failed, 'seconds': round(time.time() - start_time, 3)}, f, indent=2)
+	return 1 if failed > 0 else 0
+
+class ConversionHandler(BaseHTTPRequestHandler):
+	# POST /convert?format=glb|obj with the .lxf or .lxfml as body, answers with the .glb or a zip of obj, mtl and decorations
+	converter = None
+
+	def do_GET(self):
+		if urlparse(self.path).path != '/health':
+			self.sendText(404, 'not found')
+			return
+		status = {'status': 'ok', 'database': self.converter.database.location, 'version': self.converter.database.dbinfo.Version, 'cachedParts': len(self.converter.geometrycache.warm)}
+		self.sendData(200, 'application/json', json.dumps(status).encode('utf-8'))
+
+	def do_POST(self):
+		url = urlparse(self.path)
+		if url.path != '/convert':
+			self.sendText(404, 'not found')
+			return
+		exportformat = parse_qs(url.query).get('format', ['glb'])[0]
+		if exportformat not in ('glb', 'obj'):
+			self.sendText(400, 'format must be glb or obj')
+			return
+
+		data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		workdir = tempfile.mkdtemp(prefix='pylddlib')
+		start_time = time.time()
+		try:
+			# .lxf files are zip archives
+			lxf_filename = os.path.join(workdir, 'model.lxf' if data[:4] == b'PK\x03\x04' else 'model.lxfml')
+			with open(lxf_filename, 'wb') as f:
+				f.write(data)
+
+			if exportformat == 'glb':
+				exportScene(self.converter, lxf_filename, os.path.join(workdir, 'model.glb'))
+				result = os.path.join(workdir, 'model.glb')
+				contenttype = 'model/gltf-binary'
+			else:
+				exportScene(self.converter, lxf_filename, os.path.join(workdir, 'model'))
+				result = os.path.join(workdir, 'model.zip')
+				contenttype = 'application/zip'
+				with zipfile.ZipFile(result, 'w', zipfile.ZIP_DEFLATED) as zf:
+					for name in sorted(os.listdir(workdir)):
+						if name.endswith(('.obj', '.mtl', '.png')):
+							zf.write(os.path.join(workdir, name), name)
+
+			self.send_response(200)
+			self.send_header('Content-Type', contenttype)
+			self.send_header('Content-Length', str(os.path.getsize(result)))
+			self.send_header('X-Conversion-Seconds', '{0:.3f}'.format(time.time() - start_time))
+			self.end_headers()
+			with open(result, 'rb') as f:
+				shutil.copyfileobj(f, self.wfile)
+		except (ElementTree.ParseError, zipfile.BadZipfile, KeyError) as e:
+			self.sendText(400, 'could not read model: {0}: {1}'.format(type(e).__name__, e))
+		except Exception as e:
+			self.sendText(500, 'conversion failed: {0}: {1}'.format(type(e).__name__, e))
+		finally:
+			shutil.rmtree(workdir, ignore_errors=True)
+
+	def sendText(self, code, text):
+		self.sendData(code, 'text/plain; charset=utf-8', (text + '\n').encode('utf-8'))
+
+	def sendData(self, code, contenttype, data):
+		self.send_response(code)
+		self.send_header('Content-Type', contenttype)
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+def serveConversions(databaselocation, port, geometrycachesize=None, weld=None):
+	# One converter for the lifetime of the server, requests are handled one after another
+	converter = openConverter(databaselocation, geometrycachesize=geometrycachesize, weld=weld)
+	if not converter.database.initok:
+		print("Could not open the LDD database " + databaselocation)
+		return 1
+	ConversionHandler.converter = converter
+	server = HTTPServer(('127.0.0.1', port), ConversionHandler)
+	print('Serving conversions on http://127.0.0.1:{0}/convert'.format(server.server_address[1]))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
 def main():
 	print("- - - pylddlib - - -")
 	print("          _ ")
@@ -878,27 +2128,52 @@ def main():
 	print("        [=|=]")
 	print("")
 	print("- - - - - - - - - - - -")
-	try:
-		lxf_filename = sys.argv[1]
-		obj_filename = sys.argv[2]
-	except Exception as e:
-		print("Missing Paramenter:" + sys.argv[0] + " infile.lfx exportname (without extension)")
+	parser = argparse.ArgumentParser(description='Convert LEGO Digital Designer models (.lxf, .lxfml) to OBJ or binary glTF.')
+	parser.add_argument('infile', nargs='?', help='model to convert')
+	parser.add_argument('exportname', nargs='?', help='export name without extension, or ending in .glb for binary glTF')
+	parser.add_argument('--batch', metavar='DIR_OR_MANIFEST', help='convert every model in a directory, or every path listed in a manifest file')
+	parser.add_argument('--out', metavar='DIR', help='batch output directory (default: next to each model)')
+	parser.add_argument('--format', choices=['obj', 'glb'], default='obj', help='batch export format')
+	parser.add_argument('--jobs', type=int, default=None, help='batch worker processes (default: one per CPU)')
+	parser.add_argument('--report', metavar='FILE', help='write per file timings and failures of a batch as JSON')
+	parser.add_argument('--db', metavar='PATH', help='db.lif or extracted db folder (default: the LDD install)')
+	parser.add_argument('--serve', metavar='PORT', type=int, help='keep the database loaded and convert models posted to http://127.0.0.1:PORT/convert')
+	parser.add_argument('--cache-size', type=int, default=512, help='parts kept decoded in memory by --serve')
+	parser.add_argument('--weld', action='store_true', help='merge duplicate vertices and share equal sub part geometry across parts')
+	parser.add_argument('--weld-tolerance', metavar='TOLERANCE', type=float, default=WELDTOLERANCE, help='distance under which --weld merges vertices (default {0:g})'.format(WELDTOLERANCE))
+	parser.add_argument('--skip-enclosed', action='store_true', help='leave out bricks that are surrounded by other bricks on all sides')
+	parser.add_argument('--profile', action='store_true', help='print seconds and counters per phase and write a cProfile (PREFIX.prof) and tracemalloc report (PREFIX.txt)')
+	parser.add_argument('--profile-prefix', metavar='PREFIX', help='file name of the --profile reports without extension (default: the export name followed by _profile)')
+	args = parser.parse_args()
+	weld = args.weld_tolerance if args.weld else None
+
+	if args.serve is None and args.batch is None and (args.infile is None or args.exportname is None):
+		print("Missing Paramenter:" + sys.argv[0] + " infile.lfx exportname (without extension, or ending in .glb for binary glTF)")
 		return
 
-	converter = Converter()
-	if os.path.isdir(FindDBFolder()):
+	if args.db is not None:
+		databaselocation = os.path.abspath(args.db)
+	elif os.path.isdir(FindDBFolder()):
 		print("Found DB folder. Will use this instead of db.lif!")
-		setDBFolderVars(dbfolderlocation = FindDBFolder())
-		converter.LoadDBFolder(dbfolderlocation = FindDBFolder())
-		converter.LoadScene(filename=lxf_filename)
-		converter.Export(filename=obj_filename)
-		
+		databaselocation = FindDBFolder()
 	elif os.path.exists(FindDatabase()):
-		converter.LoadDatabase(databaselocation = FindDatabase())
-		converter.LoadScene(filename=lxf_filename)
-		converter.Export(filename=obj_filename)
+		databaselocation = FindDatabase()
 	else:
 		print("no LDD database found please install LEGO-Digital-Designer")
+		return 1
+
+	if args.serve is not None:
+		return serveConversions(databaselocation, args.serve, geometrycachesize=args.cache_size, weld=weld)
+
+	if args.batch is not None:
+		return convertBatch(databaselocation, args.batch, outdir=args.out, exportformat=args.format, jobs=args.jobs, report=args.report, skipEnclosed=args.skip_enclosed, weld=weld)
+
+	if args.profile:
+		prefix = args.profile_prefix or os.path.splitext(args.exportname)[0] + '_profile'
+		profileScene(databaselocation, args.infile, args.exportname, prefix, skipEnclosed=args.skip_enclosed, weld=weld)
+		return
+
+	exportScene(openConverter(databaselocation, weld=weld), args.infile, args.exportname, skipEnclosed=args.skip_enclosed)
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	sys.exit(main())
\ No newline at end of file